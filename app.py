@@ -1,35 +1,229 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file
+from flask import Flask, Response, render_template, request, url_for, jsonify, session, g, make_response
 import db
-import sqlite3
-from selenium_worker import get_captcha, submit_form, get_available_case_types, refresh_captcha
-import requests
-import zipfile
+import http_cache
+import metrics
+import outbound
+from fetcher import (get_captcha, claim_captcha, submit_form, get_available_case_types, refresh_captcha,
+                     start_prewarm)
+from circuit_breaker import CircuitOpen
+from selenium_worker import COURT_BASE_URL, CASE_STATUS_URL, error_html
+from case_types_cache import CaseTypeCache
+from downloader import stream_zip
+import pdf_store
+import search_index
+from result_cache import cache as result_cache, is_cacheable, case_status
+from singleflight import lookups
+from case_parser import parse_result, parse_orders
+from jobs import JobQueue, describe
+from batch import parse_cases, run_batch, BATCH_MAX_CASES
+import tracker
+from datetime import date
+import base64
+import json
 import os
-import tempfile
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
+import threading
+import time
+import uuid
+
+# Orders per page of /api/case/orders and on the result page; clients may ask for up to ORDERS_PAGE_MAX
+ORDERS_PAGE_SIZE = int(os.environ.get('ORDERS_PAGE_SIZE', '50'))
+ORDERS_PAGE_MAX = int(os.environ.get('ORDERS_PAGE_MAX', '500'))
+# Hits per page of /search; clients may ask for up to SEARCH_PAGE_MAX
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', '20'))
+SEARCH_PAGE_MAX = int(os.environ.get('SEARCH_PAGE_MAX', '100'))
 
 app = Flask(__name__)
+# Signs the session cookie that pins a captcha to its browser, so every worker and restart must share it
+app.secret_key = os.environ.get('SECRET_KEY')
+if not app.secret_key:
+    app.logger.warning("SECRET_KEY is not set; using a random key, so captchas fail across workers and restarts")
+    app.secret_key = os.urandom(24)
 db.init_db()
+# A preloading server forks its workers after this import; none of them may share this connection
+db.close_connection()
+
+# Case types change rarely; serve them from cache and refresh in the background
+case_type_cache = CaseTypeCache(get_available_case_types)
+# Under python app.py the search indexer runs in this process, extracting text on its own thread,
+# since extraction processes would run this script again on start-up, browser pool and all
+INDEX_IN_APP = search_index.SEARCH_INDEXER == '1' or (search_index.SEARCH_INDEXER == 'auto' and __name__ == '__main__')
+if __name__ == '__main__':
+    search_index.indexer.workers = 0
+
+_started_pid = None
+_start_lock = threading.Lock()
+
+def start_background_work():
+    """Start this process's background threads once, on its first request.
+
+    Threads don't survive a fork, so nothing is started at import: with
+    gunicorn's preload_app the master imports the app and every forked
+    worker starts its own job workers, captcha prewarming and schedulers.
+    """
+    global _started_pid
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    case_type_cache.warm()
+    # Keep a captcha ready in each pooled browser so page loads never wait on Chrome
+    start_prewarm()
+    job_queue.start()
+    if tracker.TRACK_SCHEDULER:
+        tracker.scheduler.start()
+    if INDEX_IN_APP:
+        search_index.indexer.start()
+
+@app.before_request
+def start_request_timer():
+    start_background_work()
+    g.request_start = time.perf_counter()
+    metrics.begin_request()
+    # Court site requests made for this page go ahead of background work, taking turns per visitor
+    outbound.set_context(outbound.INTERACTIVE, session.get('browser_key') or request.remote_addr)
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and break its time down in a Server-Timing header"""
+    elapsed = time.perf_counter() - g.pop('request_start', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    timings = metrics.end_request()
+    if metrics.METRICS_SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing(timings, elapsed)
+    return response
+
+@app.after_request
+def cache_and_compress(response):
+    """ETags, 304s, Cache-Control and compression; runs before the metrics hook above"""
+    return http_cache.finalize(request, response)
+
+@app.context_processor
+def static_files():
+    return {'static_url': lambda filename: http_cache.static_url(app.static_folder, filename)}
+
+def browser_key():
+    """Key that pins this user's captcha and search to one pooled browser"""
+    if 'browser_key' not in session:
+        session['browser_key'] = uuid.uuid4().hex
+    return session['browser_key']
+
+def lookup_case(case_type, case_number, case_year, captcha_entered, force_refresh=False, timings=None,
+                session_key=None):
+    """Return (result_html, orders_html, cached), scraping only when no fresh result is stored.
+
+    Identical lookups running at the same time, in this process or another,
+    share one scrape; a shared result counts as cached. While the court site
+    is down the last stored result is returned however old it is, or an
+    error if there is none.
+    """
+    key = (case_type, case_number, case_year)
+    if not force_refresh:
+        with metrics.span('cache_lookup'):
+            cached = result_cache.get(key)
+        if cached is not None:
+            return cached[0], cached[1], True
+    session_key = session_key or browser_key()
+    try:
+        (result_html, orders_html), shared = lookups.do(
+            key,
+            lambda: submit_form(case_type, case_number, case_year, captcha_entered, session_key, timings=timings),
+            lambda result: is_cacheable(case_number, *result))
+    except CircuitOpen as e:
+        stale = result_cache.get_stale(key)
+        if stale is not None:
+            return stale[0], stale[1], True
+        return error_html(str(e)), '', False
+    result_cache.put(key, result_html, orders_html)
+    if shared:
+        # The scrape that produced it already stored the records
+        return result_html, orders_html, True
+    if is_cacheable(case_number, result_html, orders_html):
+        store_case_records(key, result_html, orders_html)
+    return result_html, orders_html, False
+
+def store_case_records(key, result_html, orders_html):
+    """Persist the parsed case and its orders so the JSON API never re-parses HTML"""
+    with metrics.span('record_parse'):
+        record = parse_result(result_html, CASE_STATUS_URL)
+        orders = parse_orders(orders_html, COURT_BASE_URL) if record is not None else None
+    if record is not None:
+        with metrics.span('db_write'):
+            db.save_case(*key, record, orders, time.time())
+
+def encode_cursor(after):
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # Cursors come back from clients, so check their shape before they reach the query
+        if not isinstance(after, list) or len(after) != 2 or not isinstance(after[0], (str, type(None))):
+            raise ValueError
+        return after[0], int(after[1])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def orders_page(case_id, limit=ORDERS_PAGE_SIZE, cursor=None, date_from=None, date_to=None, fields=db.ORDER_FIELDS):
+    """A page of stored orders as the API returns it"""
+    after = decode_cursor(cursor) if cursor else None
+    orders, total, next_after = db.get_orders_page(case_id, limit, after, date_from, date_to, fields)
+    return {'orders': orders, 'total': total, 'next_cursor': encode_cursor(next_after) if next_after else None}
+
+def first_orders_page(case_type, case_number, case_year, result_html, orders_html):
+    """First page of the stored orders for the result page, or None to show the scraped HTML as is"""
+    if not is_cacheable(case_number, result_html, orders_html):
+        return None
+    record = db.get_case(case_type, case_number, case_year)
+    return orders_page(record['id']) if record is not None else None
+
+def run_lookup_job(job):
+    """Job handler: the same lookup and logging as /submit, run on a queue worker"""
+    timings = {}
+    with outbound.context(outbound.INTERACTIVE, job['session_key']):
+        result_html, orders_html, cached = lookup_case(job['case_type'], job['case_number'], job['case_year'],
+                                                       job['captcha_entered'], bool(job['force_refresh']),
+                                                       timings, job['session_key'])
+    with metrics.span('db_write'):
+        db.record_lookup(job['case_type'], job['case_number'], job['case_year'], job['captcha_entered'],
+                         None if cached else result_html, orders_html)
+    return result_html, orders_html, cached, timings
+
+job_queue = JobQueue(run_lookup_job)
 
 @app.route('/')
 def index():
-    captcha = get_captcha()
-    case_types = get_available_case_types()
+    # Render from prepared state only; the page fetches a captcha or case types itself if none are ready
+    captcha = claim_captcha(browser_key())
+    case_types = case_type_cache.get(wait=False)
     return render_template('index.html', captcha=captcha, case_types=case_types)
 
 @app.route('/back')
 def back_to_search():
-    """Go back to search form with fresh captcha without reloading driver"""
-    captcha = refresh_captcha()
-    case_types = get_available_case_types()
-    return render_template('index.html', captcha=captcha, case_types=case_types)
+    """Go back to search form with a fresh captcha"""
+    return index()
+
+@app.route('/captcha')
+def captcha_ajax():
+    """AJAX endpoint for the captcha when none was ready at page load"""
+    try:
+        captcha = claim_captcha(browser_key()) or get_captcha(browser_key())
+        return jsonify({'success': True, 'captcha': captcha})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/case-types')
+def case_types_ajax():
+    """AJAX endpoint for the case types when the cache was cold at page load"""
+    return jsonify({'success': True, 'case_types': case_type_cache.get()})
 
 @app.route('/refresh-captcha')
 def refresh_captcha_ajax():
     """AJAX endpoint to refresh captcha"""
     try:
-        captcha = refresh_captcha()
+        # A prepared captcha from another browser is as good as reloading this one
+        captcha = claim_captcha(browser_key()) or refresh_captcha(browser_key())
         return jsonify({'success': True, 'captcha': captcha})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -43,139 +237,281 @@ def get_orders_data():
         case_year = request.form['case_year']
         captcha_entered = request.form['captcha_entered']
         
-        # Get the orders data using selenium worker
-        result_html, orders_html = submit_form(case_type, case_number, case_year, captcha_entered)
-        
-        # Parse the orders HTML to extract order details
-        soup = BeautifulSoup(orders_html, 'html.parser')
+        force_refresh = bool(request.form.get('force_refresh'))
         
-        # Find all order links and their details
-        orders_data = []
-        links = soup.find_all('a', href=True)
+        # Get the orders data from the result cache or the selenium worker
+        timings = {}
+        result_html, orders_html, cached = lookup_case(case_type, case_number, case_year, captcha_entered,
+                                                       force_refresh, timings)
+        with metrics.span('db_write'):
+            request_id = db.record_lookup(case_type, case_number, case_year, captcha_entered,
+                                          None if cached else result_html, orders_html)
         
-        for link in links:
-            href = link.get('href')
-            if href and ('pdf' in href.lower() or 'order' in href.lower()):
-                # Make sure it's a full URL
-                if not href.startswith('http'):
-                    base_url = "https://delhihighcourt.nic.in"
-                    href = urljoin(base_url, href)
-                
-                # Get the text content (order title/description)
-                order_title = link.get_text(strip=True) or f"Order {len(orders_data) + 1}"
-                
-                orders_data.append({
-                    'title': order_title,
-                    'url': href,
-                    'filename': os.path.basename(urlparse(href).path) or f"order_{len(orders_data) + 1}.pdf"
-                })
+        # Serve the stored order records; parse only if nothing was stored
+        record = db.get_case(case_type, case_number, case_year)
+        if record is not None:
+            orders_data = db.get_orders(record['id'])
+        else:
+            orders_data = parse_orders(orders_html, COURT_BASE_URL)
         
         return jsonify({
             'success': True,
             'orders_data': orders_data,
-            'orders_html': orders_html
+            'request_id': request_id,
+            'cached': cached,
+            'timings': timings
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/case')
+def case_json():
+    """Parsed case record and orders from the database"""
+    record = db.get_case(request.args.get('case_type', ''), request.args.get('case_number', ''),
+                         request.args.get('case_year', ''))
+    if record is None:
+        return jsonify({'success': False, 'error': 'Case not found'}), 404
+    orders = db.get_orders(record.pop('id'))
+    return http_cache.cache_for(jsonify({'success': True, 'case': record, 'orders': orders}), record['status'])
+
+@app.route('/api/case/orders')
+def case_orders_json():
+    """A page of a case's stored orders, newest first, with date filters and field selection"""
+    args = request.args
+    record = db.get_case(args.get('case_type', ''), args.get('case_number', ''), args.get('case_year', ''))
+    if record is None:
+        return jsonify({'success': False, 'error': 'Case not found'}), 404
+    try:
+        limit = min(max(int(args.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_PAGE_MAX)
+        date_from, date_to = (date.fromisoformat(args[name]).isoformat() if args.get(name) else None
+                              for name in ('from', 'to'))
+        fields = tuple(args['fields'].split(',')) if args.get('fields') else db.ORDER_FIELDS
+        unknown = [field for field in fields if field not in db.ORDER_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        page = orders_page(record['id'], limit, args.get('cursor'), date_from, date_to, fields)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return http_cache.cache_for(jsonify(dict(page, success=True)), record['status'])
+
+@app.route('/api/case/history')
+def case_history_json():
+    """What changed between the stored results of a case, newest first"""
+    args = request.args
+    try:
+        since = float(args.get('since', 0))
+        limit = min(max(int(args.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_PAGE_MAX)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    history = db.case_history(args.get('case_type', ''), args.get('case_number', ''), args.get('case_year', ''),
+                              since, limit)
+    if history is None:
+        return jsonify({'success': False, 'error': 'Case not found'}), 404
+    changes, checks, last_checked_at = history
+    return jsonify({'success': True, 'checks': checks, 'last_checked_at': last_checked_at, 'changes': changes})
+
+@app.route('/search')
+def search_json():
+    """Ranked full-text search over stored case results and order PDFs"""
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_PAGE_MAX)
+        page = max(int(args.get('page', 1)), 1)
+        kind = args.get('kind') or None
+        if kind not in (None, 'case', 'order'):
+            raise ValueError(f"Unknown kind: {kind}")
+        results = search_index.search(args.get('q', ''), page, limit, kind)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify(dict(results, success=True))
+
 @app.route('/download-all-orders', methods=['POST'])
 def download_all_orders():
     """Download all orders as a zip file"""
     try:
-        # Get the orders HTML from the request
-        orders_html = request.form.get('orders_html', '')
-        
-        if not orders_html:
-            return jsonify({'success': False, 'error': 'No orders data found'})
+        # Only the id of the logged lookup comes from the client; the order URLs are our own
+        data = request.get_json(silent=True) or request.form
+        try:
+            request_id = int(data.get('request_id', ''))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'No request id given'}), 400
         
-        # Parse the HTML to extract order links
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(orders_html, 'html.parser')
-        
-        # Find all links in the orders table
-        order_links = []
-        links = soup.find_all('a', href=True)
-        
-        for link in links:
-            href = link.get('href')
-            if href and ('pdf' in href.lower() or 'order' in href.lower()):
-                # Make sure it's a full URL
-                if href.startswith('http'):
-                    order_links.append(href)
-                else:
-                    # Convert relative URL to absolute
-                    base_url = "https://delhihighcourt.nic.in"
-                    full_url = urljoin(base_url, href)
-                    order_links.append(full_url)
+        orders = db.request_orders(request_id)
+        if orders is None:
+            return jsonify({'success': False, 'error': 'Request not found'}), 404
+        order_links = [order['url'] for order in orders]
         
         if not order_links:
             return jsonify({'success': False, 'error': 'No downloadable orders found'})
         
-        # Create a temporary directory for downloads
-        temp_dir = tempfile.mkdtemp()
-        zip_path = os.path.join(temp_dir, 'all_orders.zip')
-        
-        # Download all PDFs and create zip file
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for i, link in enumerate(order_links, 1):
-                try:
-                    # Download the PDF
-                    response = requests.get(link, timeout=30)
-                    if response.status_code == 200:
-                        # Get filename from URL or create one
-                        filename = f"order_{i}.pdf"
-                        if 'pdf' in link.lower():
-                            parsed_url = urlparse(link)
-                            path = parsed_url.path
-                            if path.endswith('.pdf'):
-                                filename = os.path.basename(path)
-                        
-                        # Add to zip
-                        zipf.writestr(filename, response.content)
-                except Exception as e:
-                    print(f"Error downloading {link}: {e}")
-                    continue
-        
-        # Return the zip file
-        return send_file(
-            zip_path,
-            as_attachment=True,
-            download_name='all_orders.zip',
-            mimetype='application/zip'
+        # Stream the zip while the PDFs are still downloading
+        return Response(
+            stream_zip(order_links, fetch=outbound.bind(pdf_store.store.fetch)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename="all_orders.zip"'}
         )
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/pdf-cache/stats')
+def pdf_cache_stats():
+    """Hit rate and bytes saved by the local order PDF store"""
+    return jsonify(pdf_store.store.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request, lookup-phase, cache, browser and download metrics for Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a case lookup and return its job id without waiting for the scrape"""
+    data = request.get_json(silent=True) or request.form
+    missing = [field for field in ('case_type', 'case_number', 'case_year') if not data.get(field)]
+    if missing:
+        return jsonify({'success': False, 'error': f"Missing fields: {', '.join(missing)}"}), 400
+
+    try:
+        job_id = job_queue.submit(data['case_type'], data['case_number'], data['case_year'],
+                                  data.get('captcha_entered') or None, browser_key(),
+                                  bool(data.get('force_refresh')), data.get('callback_url') or None)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('job_status', job_id=job_id),
+        'result_url': url_for('job_result', job_id=job_id)
+    }), 202
+
+@app.route('/jobs/stats')
+def job_stats():
+    """Queue depth, wait times and worker count"""
+    return jsonify(job_queue.stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = db.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    view = describe(job, include_html=request.args.get('html', '1') != '0')
+    if job['status'] == 'queued':
+        view['queue_position'] = db.queue_position(job_id)
+    return jsonify(dict(view, success=True))
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Result page for a finished job"""
+    job = db.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify(dict(describe(job), success=False)), 409
+    # A finished job's page never changes; disposed cases may be reused without revalidating
+    page = render_template('result.html',
+                         result_html=job['result_html'],
+                         orders_html=job['orders_html'],
+                         cached=bool(job['cached']),
+                         case_type=job['case_type'],
+                         case_number=job['case_number'],
+                         case_year=job['case_year'],
+                         captcha_entered=job['captcha_entered'] or '',
+                         orders_page=first_orders_page(job['case_type'], job['case_number'], job['case_year'],
+                                                       job['result_html'], job['orders_html']),
+                         request_id=db.latest_request_id(job['case_type'], job['case_number'], job['case_year']))
+    return http_cache.cache_for(make_response(page), case_status(job['result_html']))
+
+@app.route('/batch', methods=['POST'])
+def batch_lookup():
+    """Look up a CSV or JSON list of cases, streaming NDJSON progress"""
+    upload = request.files.get('file')
+    text = upload.read().decode('utf-8') if upload else request.get_data(as_text=True)
+    try:
+        cases = parse_cases(text)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not cases:
+        return jsonify({'success': False, 'error': 'No cases given'}), 400
+    if len(cases) > BATCH_MAX_CASES:
+        return jsonify({'success': False, 'error': f"At most {BATCH_MAX_CASES} cases per batch"}), 400
+
+    force_refresh = bool(request.args.get('force_refresh'))
+    return Response((json.dumps(event) + '\n' for event in run_batch(cases, force_refresh)),
+                    mimetype='application/x-ndjson')
+
+@app.route('/tracked')
+def list_tracked():
+    return jsonify({'success': True, 'tracked': db.tracked_cases()})
+
+@app.route('/tracked', methods=['POST'])
+def track_case():
+    """Track a case so new orders are synced and reported as events"""
+    data = request.get_json(silent=True) or request.form
+    missing = [field for field in ('case_type', 'case_number', 'case_year') if not data.get(field)]
+    if missing:
+        return jsonify({'success': False, 'error': f"Missing fields: {', '.join(missing)}"}), 400
+    tracking_id = db.track_case(data['case_type'], data['case_number'], data['case_year'], time.time())
+    if tracker.TRACK_SCHEDULER:
+        tracker.scheduler.trigger()
+    return jsonify({'success': True, 'id': tracking_id}), 201
+
+@app.route('/tracked/<int:tracking_id>', methods=['DELETE'])
+def untrack_case(tracking_id):
+    if not db.untrack_case(tracking_id):
+        return jsonify({'success': False, 'error': 'Not tracked'}), 404
+    return jsonify({'success': True})
+
+@app.route('/tracked/sync', methods=['POST'])
+def sync_tracked():
+    """Start a background check of every tracked case that is due"""
+    if tracker.TRACK_SCHEDULER:
+        tracker.scheduler.trigger()
+    else:
+        # Without the polling loop, check once rather than leave a poller running in this worker
+        tracker.scheduler.sync_once()
+    return jsonify({'success': True, 'last_summary': tracker.scheduler.last_summary}), 202
+
+@app.route('/tracked/events')
+def tracked_events():
+    """Change events after ?since=<event id>, oldest first"""
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    events = db.case_events(request.args.get('since', 0, type=int), limit)
+    for event in events:
+        event.update(json.loads(event.pop('payload')))
+    return jsonify({'success': True, 'events': events})
+
 @app.route('/submit', methods=['POST'])
 def submit():
     case_type = request.form['case_type']
     case_number = request.form['case_number']
     case_year = request.form['case_year']
     captcha_entered = request.form['captcha_entered']
+    force_refresh = bool(request.form.get('force_refresh'))
 
-    conn = sqlite3.connect('case_data.db')
-    cur = conn.cursor()
-    cur.execute('INSERT INTO requests (case_type, case_number, case_year, captcha_entered) VALUES (?, ?, ?, ?)',
-                (case_type, case_number, case_year, captcha_entered))
-    request_id = cur.lastrowid
-    conn.commit()
-
-    result_html, orders_html = submit_form(case_type, case_number, case_year, captcha_entered)
+    timings = {}
+    result_html, orders_html, cached = lookup_case(case_type, case_number, case_year, captcha_entered,
+                                                   force_refresh, timings)
+    app.logger.info("submit_form timings for %s %s/%s: %s", case_type, case_number, case_year, timings)
 
-    cur.execute('INSERT INTO results (request_id, result_html) VALUES (?, ?)',
-                (request_id, result_html))
-    conn.commit()
-    conn.close()
+    # One transaction for the request log and its result; cache hits are already stored
+    with metrics.span('db_write'):
+        request_id = db.record_lookup(case_type, case_number, case_year, captcha_entered,
+                                      None if cached else result_html, orders_html)
 
     return render_template('result.html', 
                          result_html=result_html, 
                          orders_html=orders_html,
+                         cached=cached,
                          case_type=case_type,
                          case_number=case_number,
                          case_year=case_year,
-                         captcha_entered=captcha_entered)
+                         captcha_entered=captcha_entered,
+                         orders_page=first_orders_page(case_type, case_number, case_year, result_html, orders_html),
+                         request_id=request_id)
 
 if __name__ == '__main__':
+    start_background_work()
     app.run(debug=True)
@@ -0,0 +1,180 @@
+"""Batch case-status checks.
+
+Looks up a list of cases across the browser pool, serves fresh results from
+the result cache, and yields one progress event per case, ready to be
+written out as NDJSON. Results are written to the database in bulk
+transactions. Run it from the command line:
+
+    python batch.py cases.csv > results.ndjson
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+import db
+import outbound
+from fetcher import submit_form
+from selenium_worker import BROWSER_POOL_SIZE, CASE_STATUS_URL, COURT_BASE_URL
+from result_cache import cache as result_cache, is_cacheable
+from case_parser import case_found, parse_result, parse_orders
+
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', str(BROWSER_POOL_SIZE)))
+BATCH_FLUSH_SIZE = int(os.environ.get('BATCH_FLUSH_SIZE', '50'))
+BATCH_MAX_CASES = int(os.environ.get('BATCH_MAX_CASES', '5000'))
+
+FIELDS = ('case_type', 'case_number', 'case_year')
+
+
+def parse_cases(text):
+    """Read (case_type, case_number, case_year) tuples from a JSON list or CSV text"""
+    text = text.strip()
+    if text.startswith(('[', '{')):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get('cases', [])
+        if not isinstance(data, list):
+            raise ValueError("Expected a list of cases")
+        rows = []
+        for line, item in enumerate(data, 1):
+            if isinstance(item, dict):
+                item = [item.get(field, '') for field in FIELDS]
+            elif not isinstance(item, list):
+                raise ValueError(f"Row {line}: expected a list or an object with case_type, case_number, case_year")
+            rows.append(item)
+    else:
+        rows = list(csv.reader(io.StringIO(text)))
+        if rows and rows[0] and rows[0][0].strip().lower() == 'case_type':
+            rows = rows[1:]
+
+    cases = []
+    for line, row in enumerate(rows, 1):
+        if not row or not any(str(cell).strip() for cell in row):
+            continue
+        if len(row) < 3:
+            raise ValueError(f"Row {line}: expected case_type, case_number, case_year")
+        cases.append(tuple(str(cell).strip() for cell in row[:3]))
+    return cases
+
+
+def lookup_status(case_number, result_html, orders_html):
+    if 'scrape-error' in result_html or 'scrape-error' in (orders_html or ''):
+        return 'error'
+    if not case_found(case_number, result_html):
+        return 'not_found'
+    return 'ok'
+
+
+def _lookup(key, batch_id, force_refresh):
+    """Run on a pool thread: (result_html, orders_html, cached, seconds)"""
+    start = time.perf_counter()
+    if not force_refresh:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached[0], cached[1], True, time.perf_counter() - start
+    # Each batch thread keeps to its own pooled browser; the captcha is read off the page
+    session_key = f"batch-{batch_id}-{threading.current_thread().name}"
+    # The whole batch is one client of the outbound scheduler, so it can't crowd out other batches
+    with outbound.context(outbound.BACKGROUND, f"batch-{batch_id}"):
+        result_html, orders_html = submit_form(*key, None, session_key)
+    result_cache.put(key, result_html, orders_html)
+    return result_html, orders_html, False, time.perf_counter() - start
+
+
+def run_batch(cases, force_refresh=False, concurrency=BATCH_CONCURRENCY, flush_size=BATCH_FLUSH_SIZE):
+    """Look up every case and yield a progress event per case, then a summary event.
+
+    Duplicate cases are looked up once. At most ``concurrency`` lookups are in
+    flight, and database writes are batched ``flush_size`` cases at a time.
+    """
+    batch_id = uuid.uuid4().hex[:8]
+    unique = list(dict.fromkeys(cases))
+    counts = {'ok': 0, 'not_found': 0, 'error': 0, 'cached': 0}
+    lookups, records = [], []
+    start = time.perf_counter()
+
+    def flush():
+        if lookups or records:
+            db.record_batch(lookups, records)
+            lookups.clear()
+            records.clear()
+
+    queue = list(enumerate(unique, 1))
+    queue.reverse()
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch')
+    try:
+        while queue or pending:
+            while queue and len(pending) < concurrency:
+                index, key = queue.pop()
+                pending[executor.submit(_lookup, key, batch_id, force_refresh)] = (index, key)
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, key = pending.pop(future)
+                event = {'event': 'case', 'index': index, **dict(zip(FIELDS, key))}
+                try:
+                    result_html, orders_html, cached, seconds = future.result()
+                except Exception as e:
+                    counts['error'] += 1
+                    event.update(status='error', error=str(e))
+                    yield event
+                    continue
+
+                status = lookup_status(key[1], result_html, orders_html)
+                counts[status] += 1
+                counts['cached'] += cached
+                record = None
+                lookups.append((*key, None, None if cached else result_html, orders_html))
+                if status == 'ok':
+                    record = parse_result(result_html, CASE_STATUS_URL)
+                    if record is not None and not cached and is_cacheable(key[1], result_html, orders_html):
+                        records.append((*key, record, parse_orders(orders_html, COURT_BASE_URL), time.time()))
+                event.update(status=status, cached=cached, seconds=round(seconds, 3), case=record)
+                yield event
+                if len(lookups) >= flush_size:
+                    flush()
+        flush()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    yield {
+        'event': 'summary',
+        'total': len(unique),
+        'duplicates': len(cases) - len(unique),
+        **counts,
+        'elapsed': round(elapsed, 3),
+        'cases_per_minute': round(len(unique) / elapsed * 60, 1) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the status of many cases and print NDJSON progress')
+    parser.add_argument('file', help="CSV (case_type,case_number,case_year) or JSON list; '-' for stdin")
+    parser.add_argument('--force-refresh', action='store_true', help='ignore recently fetched results')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    if args.file == '-':
+        text = sys.stdin.read()
+    else:
+        with open(args.file, encoding='utf-8') as f:
+            text = f.read()
+    cases = parse_cases(text)
+
+    db.init_db()
+    for event in run_batch(cases, args.force_refresh, args.concurrency):
+        print(json.dumps(event), flush=True)
+    print(f"{event['total']} cases in {event['elapsed']}s ({event['cases_per_minute']} cases/minute): "
+          f"{event['ok']} ok, {event['not_found']} not found, {event['error']} errors, {event['cached']} cached",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
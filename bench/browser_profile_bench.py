@@ -0,0 +1,110 @@
+"""Compare page-load time and memory of the full and lite Chrome profiles.
+
+    python bench/browser_profile_bench.py --loads 10
+    python bench/browser_profile_bench.py --url http://127.0.0.1:8000/app/get-case-type-status
+
+Each profile starts one Chrome, loads the search page ``--loads`` times
+(waiting until the form and captcha are ready, as the app does), and then
+reports the resident memory of chromedriver plus every Chrome process it
+started. psutil is used for memory if installed, otherwise /proc.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import selenium_worker
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _proc_children():
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the ppid follows the closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def _proc_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss(pid):
+    """Resident bytes of a process and all of its descendants"""
+    if psutil is not None:
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    children = _proc_children()
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += _proc_rss(current)
+        stack.extend(children.get(current, []))
+    return total
+
+
+def measure(profile, url, loads):
+    start = time.perf_counter()
+    driver = selenium_worker.create_driver(profile)
+    startup = time.perf_counter() - start
+    try:
+        timings = []
+        for _ in range(loads):
+            start = time.perf_counter()
+            driver.get(url)
+            selenium_worker._wait_for_search_page(driver)
+            timings.append(time.perf_counter() - start)
+        rss = tree_rss(driver.service.process.pid)
+    finally:
+        driver.quit()
+    return startup, timings, rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=selenium_worker.CASE_STATUS_URL)
+    parser.add_argument('--loads', type=int, default=10)
+    parser.add_argument('--profiles', nargs='+', default=['full', 'lite'])
+    args = parser.parse_args()
+
+    print(f"{args.url}, {args.loads} loads per profile")
+    print(f"  {'profile':<8} {'startup':>9} {'median':>9} {'p90':>9} {'memory':>10}")
+    for profile in args.profiles:
+        startup, timings, rss = measure(profile, args.url, args.loads)
+        timings.sort()
+        p90 = timings[min(len(timings) - 1, int(len(timings) * 0.9))]
+        print(f"  {profile:<8} {startup:8.2f}s {statistics.median(timings):8.3f}s {p90:8.3f}s "
+              f"{rss / (1024 * 1024):8.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Load-test the web app against the local stub of the court site.
+
+    python bench/load_bench.py --concurrency 8 --requests 200
+    python bench/load_bench.py --latency 0.5 --pdf-size 100000-2000000 --force-refresh
+    python bench/load_bench.py --app-url http://127.0.0.1:5000 --scenarios submit orders
+
+Starts tests/stub_court.py with the given latency and PDF sizes, points the
+app at it, serves the app on a local port and drives ``/``, ``/submit``,
+``/get-orders-data`` and ``/download-all-orders`` one scenario at a time from
+``--concurrency`` clients, each with its own cookie session. Each scenario
+reports latency percentiles, throughput and errors, followed by the resident
+memory of this process (app and stub included). Everything runs offline;
+the default plain-HTTP backend needs no Chrome.
+
+With ``--app-url`` an already running app is driven instead; it must be
+pointed at a stub started with the same ``--cases``, and memory is not
+reported.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import requests
+
+from stub_court import StubCourt, LATENCY_KINDS, synthetic_cases, parse_size
+
+SCENARIOS = ('index', 'submit', 'orders', 'download')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def memory():
+    """(current, peak) resident bytes of this process"""
+    rss = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    rss[line.split(':')[0]] = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return peak, peak
+    return rss.get('VmRSS', 0), rss.get('VmHWM', 0)
+
+
+def start_app(stub, backend, workdir):
+    """Import the app against the stub and serve it on a free local port"""
+    os.environ.update({
+        'COURT_BASE_URL': stub.base_url,
+        'FETCH_BACKEND': backend,
+        'DATABASE_PATH': os.path.join(workdir, 'case_data.db'),
+        'PDF_STORE_DIR': os.path.join(workdir, 'pdf_store'),
+        'SECRET_KEY': 'load-bench',
+        'TRACK_SCHEDULER': '0',
+        # The stub is local; measure the app rather than the court site's rate limit unless asked to
+        'OUTBOUND_RATE': os.environ.get('OUTBOUND_RATE', '0'),
+    })
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+class Client:
+    """One simulated user: a cookie session and the form fields for the next case"""
+
+    def __init__(self, base_url, cases, force_refresh):
+        self.base_url = base_url
+        self.cases = cases
+        self.force_refresh = force_refresh
+        self.session = requests.Session()
+
+    def form(self):
+        case_type, case_number, case_year = next(self.cases)
+        response = self.session.get(self.base_url + '/captcha', timeout=60)
+        data = response.json()
+        if not data.get('success'):
+            raise RuntimeError(f"captcha: {data.get('error')}")
+        form = {'case_type': case_type, 'case_number': case_number, 'case_year': case_year,
+                'captcha_entered': data['captcha']}
+        if self.force_refresh:
+            form['force_refresh'] = '1'
+        return form
+
+    def index(self):
+        response = self.session.get(self.base_url + '/', timeout=60)
+        return response.status_code == 200, len(response.content)
+
+    def submit(self):
+        response = self.session.post(self.base_url + '/submit', data=self.form(), timeout=120)
+        return response.status_code == 200 and b'scrape-error' not in response.content, len(response.content)
+
+    def orders(self):
+        response = self.session.post(self.base_url + '/get-orders-data', data=self.form(), timeout=120)
+        return response.json().get('success', False), len(response.content)
+
+    def download(self):
+        orders = self.session.post(self.base_url + '/get-orders-data', data=self.form(), timeout=120).json()
+        if not orders.get('success'):
+            return False, 0
+        with self.session.post(self.base_url + '/download-all-orders',
+                               data={'request_id': orders['request_id']}, stream=True, timeout=300) as response:
+            size = sum(len(chunk) for chunk in response.iter_content(64 * 1024))
+            return response.headers.get('Content-Type') == 'application/zip', size
+
+
+def run_scenario(name, base_url, cases, concurrency, total, force_refresh):
+    clients = [Client(base_url, cases, force_refresh) for _ in range(concurrency)]
+    remaining = itertools.count()
+    latencies, errors, transferred = [], [], []
+    lock = threading.Lock()
+
+    def worker(client):
+        while next(remaining) < total:
+            start = time.perf_counter()
+            try:
+                ok, size = getattr(client, name)()
+                error = None if ok else 'bad response'
+            except Exception as e:
+                ok, size, error = False, 0, str(e)
+            seconds = time.perf_counter() - start
+            with lock:
+                latencies.append(seconds)
+                transferred.append(size)
+                if error:
+                    errors.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, clients))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'scenario': name,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'elapsed': round(elapsed, 3),
+        'per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else None,
+        'bytes': sum(transferred),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--cases', type=int, default=50, help='distinct cases the requests cycle through')
+    parser.add_argument('--orders-per-case', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05, help='stub seconds before every response')
+    parser.add_argument('--search-latency', type=float, help='stub seconds before search results')
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--pdf-size', type=parse_size, default=(20000, 200000),
+                        help="stub PDF bytes, or a range like '1000-50000'")
+    parser.add_argument('--backend', choices=('http', 'selenium'), default='http')
+    parser.add_argument('--force-refresh', action='store_true', help='bypass the result cache on every lookup')
+    parser.add_argument('--app-url', help='drive an already running app instead of starting one')
+    parser.add_argument('--json', action='store_true', help='print one JSON line per scenario')
+    args = parser.parse_args()
+
+    cases = synthetic_cases(args.cases, args.orders_per_case)
+    keys = itertools.cycle(list(cases))
+    stub = server = workdir = None
+    if args.app_url:
+        base_url = args.app_url.rstrip('/')
+    else:
+        latency = dict.fromkeys(LATENCY_KINDS, args.latency)
+        if args.search_latency is not None:
+            latency['search'] = args.search_latency
+        stub = StubCourt(cases, args.pdf_size, latency, args.jitter).start()
+        workdir = tempfile.mkdtemp(prefix='load-bench-')
+        server, base_url = start_app(stub, args.backend, workdir)
+    rss_before, _ = memory()
+
+    try:
+        if not args.json:
+            print(f"{base_url}, {args.concurrency} clients, {args.requests} requests per scenario, "
+                  f"{args.cases} cases, {args.backend} backend"
+                  f"{', force refresh' if args.force_refresh else ''}")
+            print(f"  {'scenario':<9} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50':>8} {'p90':>8} "
+                  f"{'p99':>8} {'max':>8} {'MB':>8}")
+        for name in args.scenarios:
+            result = run_scenario(name, base_url, keys, args.concurrency, args.requests, args.force_refresh)
+            if args.json:
+                print(json.dumps(result), flush=True)
+                continue
+            ms = {k: f"{result[k] * 1000:7.0f}ms" if result[k] is not None else '       -'
+                  for k in ('p50', 'p90', 'p99', 'max')}
+            print(f"  {name:<9} {result['requests']:>8} {result['errors']:>6} {result['per_second']:>8} "
+                  f"{ms['p50']} {ms['p90']} {ms['p99']} {ms['max']} {result['bytes'] / 1e6:8.1f}")
+            if result['first_error']:
+                print(f"    first error: {result['first_error']}")
+    finally:
+        if server is not None:
+            server.shutdown()
+        if stub is not None:
+            stub.stop()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if server is not None:
+        rss, peak = memory()
+        summary = {'rss_before': rss_before, 'rss_after': rss, 'rss_peak': peak}
+        if args.json:
+            print(json.dumps(summary))
+        else:
+            print(f"  memory: {rss_before / 2 ** 20:.1f}MB before, {rss / 2 ** 20:.1f}MB after, "
+                  f"{peak / 2 ** 20:.1f}MB peak (app and stub in this process)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Compare HTML parser backends on a recorded Orders page.
+
+    python bench/parser_bench.py --orders 300 --iterations 50
+
+"baseline" is the old flow: a full html.parser tree of the page, then the
+caseTable and every link pulled out of it. The other rows run
+case_parser.parse_orders with each available backend; "lxml" reads the
+table with lxml.html directly rather than through BeautifulSoup.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from bs4 import BeautifulSoup
+
+import case_parser
+from stub_court import StubCourt
+
+
+def baseline(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    table = soup.find('table', id='caseTable')
+    return [a['href'] for a in BeautifulSoup(str(table), 'html.parser').find_all('a', href=True)]
+
+
+def orders_page(count):
+    key = ('W.P.(C)', '1234', '2024')
+    dates = [f"{day % 28 + 1:02d}/{day % 12 + 1:02d}/{2000 + day % 24}" for day in range(count)]
+    stub = StubCourt(cases={key: {'orders': dates}})
+    try:
+        return stub.render_orders(key)
+    finally:
+        stub.server.server_close()
+
+
+def timed(func, html, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(html)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=300)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    html = orders_page(args.orders)
+    runs = [('baseline html.parser', baseline)]
+    backends = ['html.parser']
+    for optional in ('lxml',):
+        try:
+            __import__(optional)
+            backends.append(optional)
+        except ImportError:
+            pass
+    for backend in backends:
+        runs.append((f"parse_orders {backend}",
+                     lambda page, backend=backend: case_parser.parse_orders(page, parser=backend)))
+
+    print(f"{args.orders} orders, {len(html) // 1024} KiB page, {args.iterations} iterations")
+    reference = None
+    for name, func in runs:
+        ms = timed(func, html, args.iterations)
+        reference = reference or ms
+        print(f"  {name:<28} {ms:8.2f} ms/page   {reference / ms:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Client for the shared browser broker (see browser_broker.py).
+
+With BROWSER_BROKER=1 the fetcher sends every browser call here instead of
+starting Chrome in its own process, so any number of web workers share the
+broker's fixed pool of browsers. Calls are newline-delimited JSON over a
+Unix socket; each thread keeps its own connection open between calls.
+"""
+import json
+import os
+import socket
+import threading
+
+import metrics
+import outbound
+from circuit_breaker import CircuitOpen
+from selenium_worker import PoolTimeout, BROWSER_CHECKOUT_TIMEOUT, pool_sessions
+
+BROWSER_BROKER = os.environ.get('BROWSER_BROKER', '0') == '1'
+BROWSER_BROKER_SOCKET = os.environ.get('BROWSER_BROKER_SOCKET', '/tmp/court-browser-broker.sock')
+# A search waits for a free browser, then for the court site; allow for both
+BROWSER_BROKER_TIMEOUT = float(os.environ.get('BROWSER_BROKER_TIMEOUT', str(BROWSER_CHECKOUT_TIMEOUT + 120)))
+
+# Errors the broker raised that callers handle by type; anything else arrives as BrokerError
+ERRORS = {'PoolTimeout': PoolTimeout, 'CircuitOpen': CircuitOpen, 'RateLimited': outbound.RateLimited}
+
+
+class BrokerError(Exception):
+    """Raised for an error inside the broker"""
+
+
+class BrokerUnavailable(ConnectionError):
+    """Raised when the broker can't be reached; counts as a browser failure, not a court site one"""
+
+
+def send(stream, message):
+    stream.write(json.dumps(message).encode('utf-8') + b'\n')
+    stream.flush()
+
+
+def receive(stream):
+    line = stream.readline()
+    if not line:
+        raise EOFError("Connection closed")
+    return json.loads(line)
+
+
+class BrokerClient:
+    """Same functions as selenium_worker, run by the broker process"""
+
+    def __init__(self, path=BROWSER_BROKER_SOCKET, timeout=BROWSER_BROKER_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._local.sock, self._local.stream = sock, sock.makefile('rwb')
+        return self._local.stream
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.stream.close()
+            sock.close()
+            self._local.sock = self._local.stream = None
+
+    def call(self, method, *args, **kwargs):
+        # The broker schedules the court site requests with this thread's priority and client
+        request = {'method': method, 'args': args, 'kwargs': kwargs, 'context': outbound.current()}
+        reused = getattr(self._local, 'stream', None) is not None
+        while True:
+            try:
+                stream = self._local.stream if reused else self._connect()
+                send(stream, request)
+                response = receive(stream)
+                break
+            except (OSError, EOFError, ValueError) as e:
+                self.close()
+                if reused and not isinstance(e, TimeoutError):
+                    # The broker restarted since this thread last used the connection
+                    reused = False
+                    continue
+                raise BrokerUnavailable(f"Browser broker at {self.path} unavailable: {e}")
+        if 'error' in response:
+            raise ERRORS.get(response.get('type'), BrokerError)(response['error'])
+        return response['result']
+
+    def claim_captcha(self, session_key):
+        return self.call('claim_captcha', session_key)
+
+    def get_captcha(self, session_key=None):
+        return self.call('get_captcha', session_key)
+
+    def refresh_captcha(self, session_key=None):
+        return self.call('refresh_captcha', session_key)
+
+    def get_available_case_types(self):
+        return self.call('get_available_case_types')
+
+    def submit_form(self, case_type, case_number, case_year, captcha_input, session_key=None, timings=None):
+        result = self.call('submit_form', case_type, case_number, case_year, captcha_input, session_key)
+        # The phases ran in the broker; count them here too so /metrics and Server-Timing show them
+        for phase, seconds in result['timings'].items():
+            metrics.record(phase, seconds, timings, backend='broker')
+        return result['result_html'], result['orders_html']
+
+    def stats(self):
+        return self.call('stats')
+
+    def pool_sessions(self):
+        return pool_sessions(self.stats())
+
+
+client = BrokerClient()
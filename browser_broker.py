@@ -0,0 +1,114 @@
+"""Standalone process that owns the Chrome pool for every web worker.
+
+    python browser_broker.py
+    BROWSER_BROKER=1 gunicorn -w 8 app:app
+
+Without it each gunicorn worker starts its own pool, so browser count and
+memory grow with the number of web workers. The broker runs one pool of
+BROWSER_POOL_SIZE browsers, with captcha prewarming, health supervision and
+the court circuit breaker, and serves ``claim_captcha``, ``get_captcha``,
+``refresh_captcha``, ``get_available_case_types`` and ``submit_form`` to
+workers started with BROWSER_BROKER=1 over the Unix socket at
+BROWSER_BROKER_SOCKET (see broker_client.py). Captcha affinity still works,
+as the workers pass each user's session key along.
+"""
+import argparse
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+import broker_client
+import fetcher
+import outbound
+import selenium_worker
+
+METHODS = ('claim_captcha', 'get_captcha', 'refresh_captcha', 'get_available_case_types', 'submit_form', 'stats')
+
+
+def call(method, args, kwargs):
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    if method == 'stats':
+        return selenium_worker.pool.stats()
+    if method == 'submit_form':
+        timings = {}
+        result_html, orders_html = fetcher.submit_form(*args, timings=timings, **kwargs)
+        return {'result_html': result_html, 'orders_html': orders_html, 'timings': timings}
+    return getattr(fetcher, method)(*args, **kwargs)
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    """One worker connection; requests on it are answered in order"""
+
+    def handle(self):
+        while True:
+            try:
+                request = broker_client.receive(self.rfile)
+            except (EOFError, OSError, ValueError):
+                return
+            try:
+                with outbound.context(*request.get('context') or (outbound.BACKGROUND, None)):
+                    response = {'result': call(request['method'], request.get('args', []), request.get('kwargs', {}))}
+            except Exception as e:
+                response = {'error': str(e), 'type': type(e).__name__}
+            try:
+                broker_client.send(self.wfile, response)
+            except OSError:
+                return
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _remove_stale_socket(path):
+    """Remove a socket file left by a broker that is no longer running"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise RuntimeError(f"A broker is already listening on {path}")
+    finally:
+        probe.close()
+
+
+def serve(path=broker_client.BROWSER_BROKER_SOCKET):
+    # This process drives the browsers itself, whatever the web workers are configured with
+    fetcher.USE_BROWSER_BROKER = False
+    fetcher.FETCH_BACKEND = 'selenium'
+    _remove_stale_socket(path)
+    server = BrokerServer(path, BrokerHandler)
+    # Only processes running as the same user or group may drive the browsers
+    os.chmod(path, 0o660)
+    fetcher.start_prewarm()
+    # Leave serve_forever through the finally below, closing the browsers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Browser broker listening on {path} with up to {selenium_worker.pool.size} browsers")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        selenium_worker.pool.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', default=broker_client.BROWSER_BROKER_SOCKET,
+                        help='Unix socket path (default: BROWSER_BROKER_SOCKET)')
+    args = parser.parse_args()
+    try:
+        serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Turns the court's result table and Orders caseTable into plain records.
+
+Tables are read with lxml.html directly when lxml is installed, which is
+roughly ten times faster than building a BeautifulSoup tree with
+html.parser on long order tables (see bench/parser_bench.py). Set
+HTML_PARSER=html.parser to force the pure-Python path.
+"""
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+import os
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
+
+HTML_PARSER = os.environ.get('HTML_PARSER', DEFAULT_PARSER)
+
+STATUS_RE = re.compile(r'\[\s*([A-Z][A-Z \-]*?)\s*\]')
+NEXT_DATE_RE = re.compile(r'NEXT\s+DATE\s*:\s*([0-9/\-.]+|NA)', re.I)
+LAST_DATE_RE = re.compile(r'LAST\s+DATE\s*:\s*([0-9/\-.]+|NA)', re.I)
+COURT_NO_RE = re.compile(r'COURT\s+NO\s*[:.]?\s*([\w\-]+)', re.I)
+DATE_RE = re.compile(r'\b(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4})\b')
+VS_RE = re.compile(r'\bVS\.?(?=\s|$)', re.I)
+
+
+def parse_date(text):
+    """Convert the court's dd/mm/yyyy dates to ISO yyyy-mm-dd, or None"""
+    match = DATE_RE.search(text or '')
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    try:
+        return datetime(year, month, day).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _text(element):
+    """Element text with whitespace collapsed, keeping <br>-separated parts apart"""
+    return ' '.join(' '.join(element.itertext()).split())
+
+
+def _rows_lxml(html, table_id):
+    try:
+        doc = lxml.html.fromstring(html)
+    except Exception:
+        return [], []
+    if table_id:
+        tables = doc.xpath('//table[@id=$id]', id=table_id)
+    else:
+        tables = doc.xpath('//table')
+    if not tables:
+        return [], []
+    table = tables[0]
+    headers = [_text(th).lower() for th in table.iter('th')]
+    rows = []
+    for tr in table.iter('tr'):
+        cells = [{
+            'text': _text(td),
+            'links': [(a.get('href'), _text(a)) for a in td.iter('a') if a.get('href')],
+        } for td in tr.findall('td')]
+        if cells:
+            rows.append(cells)
+    return headers, rows
+
+
+def _rows_soup(html, table_id, parser):
+    soup = BeautifulSoup(html, parser)
+    table = soup.find('table', id=table_id) if table_id else soup.find('table')
+    if table is None:
+        return [], []
+    headers = [th.get_text(' ', strip=True).lower() for th in table.find_all('th')]
+    rows = []
+    for tr in table.find_all('tr'):
+        cells = [{
+            'text': td.get_text(' ', strip=True),
+            'links': [(a['href'], a.get_text(strip=True)) for a in td.find_all('a', href=True)],
+        } for td in tr.find_all('td')]
+        if cells:
+            rows.append(cells)
+    return headers, rows
+
+
+def table_rows(html, table_id=None, parser=None):
+    """Return (lower-cased headers, rows) for a table; each cell has its text and links"""
+    parser = parser or HTML_PARSER
+    if parser == 'lxml' and DEFAULT_PARSER == 'lxml':
+        return _rows_lxml(html, table_id)
+    return _rows_soup(html, table_id, parser)
+
+
+def _column(headers, *needles):
+    """Index of the first column whose header mentions any of the needles"""
+    for i, header in enumerate(headers):
+        if any(needle in header for needle in needles):
+            return i
+    return None
+
+
+def parse_result(result_html, base_url=None, parser=None):
+    """Parse the search result table into a case record, or None if no case row is present"""
+    _, rows = table_rows(result_html, parser=parser)
+    for cells in rows:
+        if len(cells) < 4:
+            continue
+        case_cell, parties_cell, listing_cell = cells[1], cells[2], cells[3]
+        status = STATUS_RE.search(case_cell['text'])
+        parties = VS_RE.split(parties_cell['text'], maxsplit=1)
+        listing = listing_cell['text']
+        next_date = NEXT_DATE_RE.search(listing)
+        last_date = LAST_DATE_RE.search(listing)
+        court_no = COURT_NO_RE.search(listing)
+        orders_url = next((href for href, text in case_cell['links'] if text.lower() == 'orders'), None)
+        if orders_url and base_url:
+            orders_url = urljoin(base_url, orders_url)
+        return {
+            'case_title': STATUS_RE.sub('', case_cell['text']).replace('Orders', '').strip(' -'),
+            'status': status.group(1).strip() if status else None,
+            'petitioner': parties[0].strip() or None,
+            'respondent': parties[1].strip() if len(parties) > 1 else None,
+            'next_hearing_date': parse_date(next_date.group(1)) if next_date else None,
+            'last_hearing_date': parse_date(last_date.group(1)) if last_date else None,
+            'court_no': court_no.group(1) if court_no else None,
+            'orders_url': orders_url,
+        }
+    return None
+
+
+def case_found(case_number, result_html):
+    """True if the result table has a row for the case; matched on the parsed case cell, not the raw HTML"""
+    record = parse_result(result_html)
+    return record is not None and re.search(rf'(?<!\d){re.escape(case_number)}(?!\d)', record['case_title']) is not None
+
+
+def lookup_ok(case_number, result_html, orders_html):
+    """True if a scrape fetched cleanly and found the case"""
+    if 'scrape-error' in result_html or 'scrape-error' in (orders_html or ''):
+        return False
+    return case_found(case_number, result_html)
+
+
+def parse_orders(orders_html, base_url=None, parser=None):
+    """Parse the Orders caseTable into a list of order records"""
+    headers, rows = table_rows(orders_html, 'caseTable', parser)
+    link_col = _column(headers, 'order link', 'case no')
+    date_col = _column(headers, 'date of order', 'date')
+
+    orders = []
+    for cells in rows:
+        link_cell = cells[link_col] if link_col is not None and link_col < len(cells) else None
+        links = link_cell['links'] if link_cell and link_cell['links'] else [l for c in cells for l in c['links']]
+        if not links:
+            continue
+        url, title = links[0]
+        if base_url:
+            url = urljoin(base_url, url)
+        date_text = cells[date_col]['text'] if date_col is not None and date_col < len(cells) else ' '.join(
+            c['text'] for c in cells)
+        orders.append({
+            'title': title or f"Order {len(orders) + 1}",
+            'url': url,
+            'filename': os.path.basename(urlparse(url).path) or f"order_{len(orders) + 1}.pdf",
+            'order_date': parse_date(date_text),
+        })
+    return orders
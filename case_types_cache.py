@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+import db
+
+CASE_TYPES_TTL = float(os.environ.get('CASE_TYPES_TTL', str(24 * 3600)))
+CASE_TYPES_COLD_WAIT = float(os.environ.get('CASE_TYPES_COLD_WAIT', '30'))
+
+
+class CaseTypeCache:
+    """Process-wide cache of the court's case-type dropdown.
+
+    The list is served from memory (seeded from SQLite) and refreshed on a
+    background thread once it is older than the TTL, so page renders never
+    drive the browser themselves. Only a completely cold cache makes the
+    caller wait, and then only for the background refresh to finish.
+    """
+
+    def __init__(self, fetch, ttl=CASE_TYPES_TTL, cold_wait=CASE_TYPES_COLD_WAIT, persist=True):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.cold_wait = cold_wait
+        self.persist = persist
+        self._case_types = []
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._loaded = False
+
+    def get(self, wait=True):
+        """Return the case types; with wait=False a cold cache returns [] at once"""
+        self._load_persisted()
+        with self._lock:
+            case_types = self._case_types
+            stale = self._fetched_at is None or time.time() - self._fetched_at > self.ttl
+            done = self._start_refresh() if stale else None
+
+        if not case_types and done is not None and wait:
+            done.wait(self.cold_wait)
+            with self._lock:
+                case_types = self._case_types
+        return case_types
+
+    def warm(self):
+        """Kick off a background refresh if the cache is empty or stale"""
+        self._load_persisted()
+        with self._lock:
+            if self._fetched_at is None or time.time() - self._fetched_at > self.ttl:
+                self._start_refresh()
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+    def _load_persisted(self):
+        if self._loaded or not self.persist:
+            return
+        case_types, fetched_at = db.load_case_types()
+        with self._lock:
+            if not self._loaded:
+                if case_types and self._fetched_at is None:
+                    self._case_types, self._fetched_at = case_types, fetched_at
+                self._loaded = True
+
+    def _start_refresh(self):
+        # Caller holds self._lock; at most one refresh runs at a time
+        if self._refreshing is None:
+            self._refreshing = threading.Event()
+            threading.Thread(target=self._refresh, args=(self._refreshing,), daemon=True).start()
+        return self._refreshing
+
+    def _refresh(self, done):
+        try:
+            case_types = self.fetch()
+            if case_types:
+                fetched_at = time.time()
+                with self._lock:
+                    self._case_types, self._fetched_at = case_types, fetched_at
+                if self.persist:
+                    db.save_case_types(case_types, fetched_at)
+        except Exception as e:
+            print(f"Error refreshing case types: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = None
+            done.set()
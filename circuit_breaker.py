@@ -0,0 +1,83 @@
+"""Circuit breaker for the court website.
+
+After COURT_BREAKER_THRESHOLD consecutive failed calls (timeouts, refused
+connections, pages that never render) the circuit opens: calls fail at once
+with ``CircuitOpen`` for COURT_BREAKER_RESET seconds instead of each holding
+a browser or worker for the full page timeouts. After that one trial call
+is let through; if it succeeds the circuit closes again, otherwise it stays
+open for another period.
+"""
+import os
+import threading
+import time
+
+import metrics
+
+COURT_BREAKER_THRESHOLD = int(os.environ.get('COURT_BREAKER_THRESHOLD', '5'))
+COURT_BREAKER_RESET = float(os.environ.get('COURT_BREAKER_RESET', '60'))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a site that is known to be down"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=COURT_BREAKER_THRESHOLD, reset_timeout=COURT_BREAKER_RESET):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        # A trial that never reports back (e.g. no browser was free) stops counting after reset_timeout
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def state(self, now=None):
+        with self._lock:
+            return self._state(time.time() if now is None else now)
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return CLOSED
+        if now - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go ahead; half-open allows one trial at a time"""
+        now = time.time()
+        with self._lock:
+            state = self._state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and (self._trial_started is None or now - self._trial_started >= self.reset_timeout):
+                self._trial_started = now
+                return
+            retry_after = max(0, self.reset_timeout - (now - self.opened_at))
+        metrics.CIRCUIT_REJECTED.inc(circuit=self.name)
+        raise CircuitOpen(f"The {self.name} website is not responding; try again in {retry_after:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            was_trial, self._trial_started = self._trial_started is not None, None
+            if was_trial or (self.opened_at is None and self.failures >= self.threshold):
+                if self.opened_at is None:
+                    print(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self._state(time.time()), 'failures': self.failures}
+
+
+court = CircuitBreaker('court')
+metrics.CIRCUIT_OPEN.set_function(lambda: 0 if court.state() == CLOSED else 1)
@@ -1,25 +1,929 @@
+import json
+import os
 import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+
+import snapshots
+from case_parser import lookup_ok
+
+DB_PATH = os.environ.get('DATABASE_PATH', 'case_data.db')
+# Store result and orders HTML zlib-compressed (read back transparently either way)
+COMPRESS_HTML = os.environ.get('DB_COMPRESS_HTML', '1') == '1'
+# "delta" stores a case's repeated results as changes against a full snapshot; "full" stores each one whole
+RESULT_STORAGE = os.environ.get('DB_RESULT_STORAGE', 'delta')
+# A new snapshot is stored once a delta grows past this share of the snapshot's size
+RESULT_DELTA_MAX_RATIO = float(os.environ.get('DB_RESULT_DELTA_MAX_RATIO', '0.5'))
+SCHEMA_VERSION = 9
+
+_local = threading.local()
+# Connections a forked process inherited; kept open, since closing one would drop this process's own file locks
+_inherited = []
+
+def get_connection():
+    """Return this thread's connection to DB_PATH, opening it on first use in each process"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid != os.getpid():
+        _inherited.append(conn)
+        conn = None
+    if conn is None or _local.path != DB_PATH:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn, _local.path, _local.pid = conn, DB_PATH, os.getpid()
+    return conn
+
+def close_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def transaction():
+    """Run a batch of statements in one transaction on this thread's connection"""
+    conn = get_connection()
+    with conn:
+        yield conn.cursor()
+
+def encode_html(html):
+    if html is None or not COMPRESS_HTML:
+        return html
+    return zlib.compress(html.encode('utf-8'), 6)
+
+def decode_html(value):
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
 
 def init_db():
-    conn = sqlite3.connect('case_data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            case_type TEXT,
-            case_number TEXT,
-            case_year TEXT,
-            captcha_entered TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            request_id INTEGER,
-            result_html TEXT,
-            FOREIGN KEY (request_id) REFERENCES requests(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                case_type TEXT,
+                case_number TEXT,
+                case_year TEXT,
+                captcha_entered TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                request_id INTEGER,
+                result_html TEXT,
+                orders_html TEXT,
+                FOREIGN KEY (request_id) REFERENCES requests(id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS case_types (
+                value TEXT PRIMARY KEY,
+                text TEXT,
+                position INTEGER,
+                fetched_at REAL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER,
+                last_access REAL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at REAL,
+                FOREIGN KEY (sha256) REFERENCES pdf_blobs(sha256)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pdf_blobs_last_access ON pdf_blobs (last_access)')
+    migrate_db()
+
+def migrate_db():
+    """Bring databases created by older versions up to SCHEMA_VERSION"""
+    conn = get_connection()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version < 1:
+        with transaction() as cursor:
+            # Databases created before orders were stored lack this column
+            cursor.execute('PRAGMA table_info(results)')
+            if 'orders_html' not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE results ADD COLUMN orders_html TEXT')
+            cursor.execute('PRAGMA user_version = 1')
+    if version < 2:
+        with transaction() as cursor:
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_requests_case
+                ON requests (case_type, case_number, case_year, timestamp)
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_request ON results (request_id)')
+            cursor.execute('PRAGMA user_version = 2')
+    if version < 3:
+        with transaction() as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cases (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    case_type TEXT,
+                    case_number TEXT,
+                    case_year TEXT,
+                    case_title TEXT,
+                    status TEXT,
+                    petitioner TEXT,
+                    respondent TEXT,
+                    next_hearing_date TEXT,
+                    last_hearing_date TEXT,
+                    court_no TEXT,
+                    orders_url TEXT,
+                    updated_at REAL,
+                    UNIQUE (case_type, case_number, case_year)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS orders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    case_id INTEGER,
+                    position INTEGER,
+                    title TEXT,
+                    url TEXT,
+                    filename TEXT,
+                    order_date TEXT,
+                    FOREIGN KEY (case_id) REFERENCES cases(id)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_case ON orders (case_id, position)')
+            cursor.execute('PRAGMA user_version = 3')
+    if version < 4:
+        with transaction() as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT,
+                    case_type TEXT,
+                    case_number TEXT,
+                    case_year TEXT,
+                    captcha_entered TEXT,
+                    session_key TEXT,
+                    force_refresh INTEGER,
+                    callback_url TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result_html BLOB,
+                    orders_html BLOB,
+                    cached INTEGER,
+                    timings TEXT,
+                    error TEXT
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+            cursor.execute('PRAGMA user_version = 4')
+    if version < 5:
+        with transaction() as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tracked_cases (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    case_type TEXT,
+                    case_number TEXT,
+                    case_year TEXT,
+                    added_at REAL,
+                    last_checked_at REAL,
+                    next_check_at REAL,
+                    last_error TEXT,
+                    UNIQUE (case_type, case_number, case_year)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracked_due ON tracked_cases (next_check_at)')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS case_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    case_type TEXT,
+                    case_number TEXT,
+                    case_year TEXT,
+                    kind TEXT,
+                    payload TEXT,
+                    created_at REAL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_url ON orders (case_id, url)')
+            cursor.execute('PRAGMA user_version = 5')
+    if version < 6:
+        with transaction() as cursor:
+            # Serves date-filtered, newest-first pages of a case's orders
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (case_id, order_date, id)')
+            cursor.execute('PRAGMA user_version = 6')
+    if version < 7:
+        with transaction() as cursor:
+            # One row per case being scraped right now, so other processes can wait for it instead
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS lookup_flights (
+                    case_type TEXT,
+                    case_number TEXT,
+                    case_year TEXT,
+                    owner TEXT,
+                    started_at REAL,
+                    expires_at REAL,
+                    finished_at REAL,
+                    result_html TEXT,
+                    orders_html TEXT,
+                    PRIMARY KEY (case_type, case_number, case_year)
+                )
+            ''')
+            cursor.execute('PRAGMA user_version = 7')
+    if version < 8:
+        with transaction() as cursor:
+            # Full-text index of case results and order PDFs; search_docs maps each source to its row
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                    kind UNINDEXED,
+                    case_type UNINDEXED,
+                    case_number UNINDEXED,
+                    case_year UNINDEXED,
+                    url UNINDEXED,
+                    title,
+                    body,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS search_docs (
+                    ref TEXT PRIMARY KEY,
+                    doc_id INTEGER,
+                    version TEXT,
+                    indexed_at REAL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS search_state (
+                    name TEXT PRIMARY KEY,
+                    value REAL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pdf_urls_checked ON pdf_urls (checked_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_by_url ON orders (url)')
+            cursor.execute('PRAGMA user_version = 8')
+    if version < 9:
+        with transaction() as cursor:
+            # Rows stored whole have no storage, failed scrapes 'failed'; see _result_version for the others
+            for column, kind in (('storage', 'TEXT'), ('base_id', 'INTEGER'), ('delta', 'BLOB'), ('changes', 'TEXT')):
+                cursor.execute(f'ALTER TABLE results ADD COLUMN {column} {kind}')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_whole ON results (id) WHERE storage IS NULL')
+            cursor.execute('PRAGMA user_version = 9')
+    if COMPRESS_HTML:
+        compress_results()
+    if RESULT_STORAGE == 'delta':
+        compact_results()
+
+def compress_results(batch_size=500):
+    """Compress result rows stored as plain text, one batch per transaction"""
+    conn = get_connection()
+    while True:
+        rows = conn.execute('''
+            SELECT id, result_html, orders_html FROM results
+            WHERE typeof(result_html) = 'text' OR typeof(orders_html) = 'text'
+            LIMIT ?
+        ''', (batch_size,)).fetchall()
+        if not rows:
+            return
+        with transaction() as cursor:
+            cursor.executemany('UPDATE results SET result_html = ?, orders_html = ? WHERE id = ?',
+                               [(encode_html(decode_html(result_html)), encode_html(decode_html(orders_html)), row_id)
+                                for row_id, result_html, orders_html in rows])
+
+RESULT_COLUMNS = ('storage', 'result_html', 'orders_html', 'base_id', 'delta', 'changes')
+
+def compact_results(batch_size=100):
+    """Rewrite results stored whole as snapshots and deltas, a batch of cases per transaction"""
+    conn = get_connection()
+    while True:
+        keys = conn.execute('''
+            SELECT DISTINCT r.case_type, r.case_number, r.case_year
+            FROM results s JOIN requests r ON r.id = s.request_id
+            WHERE s.storage IS NULL LIMIT ?
+        ''', (batch_size,)).fetchall()
+        if not keys:
+            return
+        with transaction() as cursor:
+            for key in keys:
+                cursor.execute('''
+                    SELECT s.id, s.storage FROM requests r JOIN results s ON s.request_id = r.id
+                    WHERE r.case_type = ? AND r.case_number = ? AND r.case_year = ? ORDER BY s.id
+                ''', key)
+                previous_id = None
+                for result_id, storage in cursor.fetchall():
+                    if storage == 'failed':
+                        continue
+                    if storage is None:
+                        content = _result_content(cursor.connection, result_id)
+                        if not lookup_ok(key[1], *content):
+                            cursor.execute("UPDATE results SET storage = 'failed' WHERE id = ?", (result_id,))
+                            continue
+                        values = dict.fromkeys(RESULT_COLUMNS)
+                        values.update(_result_version(cursor.connection, previous_id, *content))
+                        cursor.execute(f'''
+                            UPDATE results SET {', '.join(f'{column} = ?' for column in values)} WHERE id = ?
+                        ''', (*values.values(), result_id))
+                    previous_id = result_id
+
+def _result_content(conn, result_id):
+    """(result_html, orders_html) of a results row, rebuilt from its base if it holds a delta"""
+    result_html, orders_html, storage, base_id, delta = conn.execute(
+        'SELECT result_html, orders_html, storage, base_id, delta FROM results WHERE id = ?', (result_id,)).fetchone()
+    if storage == 'same':
+        return _result_content(conn, base_id)
+    if storage == 'delta':
+        ops = json.loads(decode_html(delta))
+        return tuple(''.join(snapshots.apply(snapshots.split_rows(base), ops[part]))
+                     for base, part in zip(_result_content(conn, base_id), ('result', 'orders')))
+    return decode_html(result_html), decode_html(orders_html)
+
+def _snapshot_id(conn, result_id):
+    """The row holding the whole HTML that a results row is rebuilt from"""
+    while True:
+        storage, base_id = conn.execute('SELECT storage, base_id FROM results WHERE id = ?', (result_id,)).fetchone()
+        if storage in (None, 'snapshot'):
+            return result_id
+        result_id = base_id
+
+def _result_version(conn, previous_id, result_html, orders_html):
+    """Column values that store a case's new result given its previous good one.
+
+    The first result and any that changed too much are stored whole as a
+    ``snapshot``; a changed one as a ``delta`` of table rows against the
+    latest snapshot; an unchanged one as ``same``, pointing at the row that
+    holds its content. ``changes`` lists the rows added and removed since
+    the previous result. Failed scrapes never get here; they are stored
+    whole as ``failed`` and skipped when picking the previous result.
+    """
+    whole = {'storage': 'snapshot', 'result_html': encode_html(result_html), 'orders_html': encode_html(orders_html)}
+    if previous_id is None:
+        return dict(whole, changes=json.dumps({'initial': True}))
+    new = [snapshots.split_rows(part) for part in (result_html, orders_html)]
+    previous = [snapshots.split_rows(part) for part in _result_content(conn, previous_id)]
+    if all(snapshots.same(old, lines) for old, lines in zip(previous, new)):
+        storage, base_id = conn.execute('SELECT storage, base_id FROM results WHERE id = ?', (previous_id,)).fetchone()
+        return {'storage': 'same', 'base_id': base_id if storage == 'same' else previous_id}
+
+    changes = json.dumps({part: snapshots.changes(old, lines)
+                          for part, old, lines in zip(('result', 'orders'), previous, new)})
+    snapshot_id = _snapshot_id(conn, previous_id)
+    base = [snapshots.split_rows(part) for part in _result_content(conn, snapshot_id)]
+    delta = encode_html(json.dumps({part: snapshots.delta(old, lines)
+                                    for part, old, lines in zip(('result', 'orders'), base, new)}))
+    snapshot_size = conn.execute('SELECT length(result_html) + COALESCE(length(orders_html), 0) FROM results '
+                                 'WHERE id = ?', (snapshot_id,)).fetchone()[0]
+    if len(delta) > RESULT_DELTA_MAX_RATIO * snapshot_size:
+        return dict(whole, changes=changes)
+    return {'storage': 'delta', 'base_id': snapshot_id, 'delta': delta, 'changes': changes}
+
+def _insert_lookup(cursor, case_type, case_number, case_year, captcha_entered, result_html, orders_html):
+    cursor.execute('INSERT INTO requests (case_type, case_number, case_year, captcha_entered) VALUES (?, ?, ?, ?)',
+                   (case_type, case_number, case_year, captcha_entered))
+    request_id = cursor.lastrowid
+    if result_html is not None:
+        if not lookup_ok(case_number, result_html, orders_html):
+            # Failed scrapes are kept whole for the record but never become a version of the case
+            values = {'storage': 'failed', 'result_html': encode_html(result_html),
+                      'orders_html': encode_html(orders_html)}
+        elif RESULT_STORAGE == 'delta':
+            cursor.execute('''
+                SELECT MAX(s.id) FROM requests r JOIN results s ON s.request_id = r.id
+                WHERE r.case_type = ? AND r.case_number = ? AND r.case_year = ? AND s.storage IS NOT 'failed'
+            ''', (case_type, case_number, case_year))
+            values = _result_version(cursor.connection, cursor.fetchone()[0], result_html, orders_html)
+        else:
+            values = {'result_html': encode_html(result_html), 'orders_html': encode_html(orders_html)}
+        cursor.execute(f'''
+            INSERT INTO results (request_id, {', '.join(values)}) VALUES (?, {', '.join('?' for _ in values)})
+        ''', (request_id, *values.values()))
+    return request_id
+
+def record_lookup(case_type, case_number, case_year, captcha_entered, result_html=None, orders_html=None):
+    """Log a lookup and, if given, its result in a single transaction; returns the request id"""
+    with transaction() as cursor:
+        return _insert_lookup(cursor, case_type, case_number, case_year, captcha_entered, result_html, orders_html)
+
+def record_batch(lookups, cases):
+    """Log many lookups and upsert their parsed cases in one transaction.
+
+    ``lookups`` holds record_lookup argument tuples, ``cases`` save_case ones.
+    """
+    with transaction() as cursor:
+        for lookup in lookups:
+            _insert_lookup(cursor, *lookup)
+        for case in cases:
+            _upsert_case(cursor, *case)
+
+def latest_result(case_type, case_number, case_year):
+    """Return (result_html, orders_html, fetched_at) of the newest good stored lookup, or None"""
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT s.id, s.storage, CAST(strftime('%s', r.timestamp) AS REAL)
+        FROM requests r JOIN results s ON s.request_id = r.id
+        WHERE r.case_type = ? AND r.case_number = ? AND r.case_year = ? AND s.storage IS NOT 'failed'
+        ORDER BY r.timestamp DESC, r.id DESC
+    ''', (case_type, case_number, case_year))
+    for result_id, storage, fetched_at in rows:
+        content = _result_content(conn, result_id)
+        # Rows stored whole in full mode may still be failed scrapes from before they were marked
+        if storage is not None or lookup_ok(case_number, *content):
+            return (*content, fetched_at)
+    return None
+
+def case_history(case_type, case_number, case_year, since=0, limit=100):
+    """Stored results of a case that changed something, newest first.
+
+    Returns ``(changes, checks, last_checked_at)`` with the number of stored
+    results and when the newest was fetched, or None if there are none.
+    Only results stored with RESULT_STORAGE=delta carry changes.
+    """
+    conn = get_connection()
+    key = (case_type, case_number, case_year)
+    checks, last_checked_at = conn.execute('''
+        SELECT COUNT(*), CAST(strftime('%s', MAX(r.timestamp)) AS REAL)
+        FROM requests r JOIN results s ON s.request_id = r.id
+        WHERE r.case_type = ? AND r.case_number = ? AND r.case_year = ?
+    ''', key).fetchone()
+    if not checks:
+        return None
+    rows = conn.execute('''
+        SELECT s.id, CAST(strftime('%s', r.timestamp) AS REAL), s.changes
+        FROM requests r JOIN results s ON s.request_id = r.id
+        WHERE r.case_type = ? AND r.case_number = ? AND r.case_year = ?
+        AND s.changes IS NOT NULL AND r.timestamp > datetime(?, 'unixepoch')
+        ORDER BY s.id DESC LIMIT ?
+    ''', (*key, since, limit)).fetchall()
+    changes = [dict(json.loads(changed), id=result_id, checked_at=checked_at)
+               for result_id, checked_at, changed in rows]
+    return changes, checks, last_checked_at
+
+CASE_FIELDS = ('case_title', 'status', 'petitioner', 'respondent', 'next_hearing_date',
+               'last_hearing_date', 'court_no', 'orders_url')
+ORDER_FIELDS = ('title', 'url', 'filename', 'order_date')
+
+def _upsert_case(cursor, case_type, case_number, case_year, record, orders, updated_at):
+    cursor.execute(f'''
+        INSERT INTO cases (case_type, case_number, case_year, {', '.join(CASE_FIELDS)}, updated_at)
+        VALUES (?, ?, ?, {', '.join('?' for _ in CASE_FIELDS)}, ?)
+        ON CONFLICT(case_type, case_number, case_year) DO UPDATE SET
+        {', '.join(f'{field} = excluded.{field}' for field in CASE_FIELDS)}, updated_at = excluded.updated_at
+    ''', (case_type, case_number, case_year, *(record.get(field) for field in CASE_FIELDS), updated_at))
+    cursor.execute('SELECT id FROM cases WHERE case_type = ? AND case_number = ? AND case_year = ?',
+                   (case_type, case_number, case_year))
+    case_id = cursor.fetchone()[0]
+
+    # Only orders not seen before are written; known ones just follow the page order
+    cursor.execute('SELECT url, id, position FROM orders WHERE case_id = ?', (case_id,))
+    known = {url: (order_id, position) for url, order_id, position in cursor.fetchall()}
+    listed = {order['url'] for order in orders}
+    added = [order for order in orders if order['url'] not in known]
+    cursor.executemany('DELETE FROM orders WHERE id = ?',
+                       [(order_id,) for url, (order_id, _) in known.items() if url not in listed])
+    cursor.executemany('UPDATE orders SET position = ? WHERE id = ?',
+                       [(i, known[order['url']][0]) for i, order in enumerate(orders)
+                        if order['url'] in known and known[order['url']][1] != i])
+    cursor.executemany(f'''
+        INSERT INTO orders (case_id, position, {', '.join(ORDER_FIELDS)})
+        VALUES (?, ?, {', '.join('?' for _ in ORDER_FIELDS)})
+    ''', [(case_id, i, *(order.get(field) for field in ORDER_FIELDS))
+          for i, order in enumerate(orders) if order['url'] not in known])
+    return case_id, added
+
+def save_case(case_type, case_number, case_year, record, orders, updated_at):
+    """Upsert the parsed case record and sync its orders; returns (case_id, newly listed orders)"""
+    with transaction() as cursor:
+        return _upsert_case(cursor, case_type, case_number, case_year, record, orders, updated_at)
+
+def get_case(case_type, case_number, case_year):
+    """Return the parsed case record as a dict, or None"""
+    cursor = get_connection().cursor()
+    cursor.execute(f'''
+        SELECT id, {', '.join(CASE_FIELDS)}, updated_at FROM cases
+        WHERE case_type = ? AND case_number = ? AND case_year = ?
+    ''', (case_type, case_number, case_year))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    record = dict(zip(('id',) + CASE_FIELDS + ('updated_at',), row))
+    record.update(case_type=case_type, case_number=case_number, case_year=case_year)
+    return record
+
+def get_orders(case_id):
+    cursor = get_connection().cursor()
+    cursor.execute(f'''
+        SELECT {', '.join(ORDER_FIELDS)} FROM orders WHERE case_id = ? ORDER BY position
+    ''', (case_id,))
+    return [dict(zip(ORDER_FIELDS, row)) for row in cursor.fetchall()]
+
+def get_orders_page(case_id, limit, after=None, date_from=None, date_to=None, fields=ORDER_FIELDS):
+    """One page of a case's orders, newest first, and the total matching the date filters.
+
+    ``after`` is the ``(order_date, id)`` key of the last order on the
+    previous page. Returns ``(orders, total, next_after)``; ``next_after`` is
+    None on the last page. Orders without a date come last.
+    """
+    filters, params = ['case_id = ?'], [case_id]
+    if date_from:
+        filters.append('order_date >= ?')
+        params.append(date_from)
+    if date_to:
+        filters.append('order_date <= ?')
+        params.append(date_to)
+    where = ' AND '.join(filters)
+    cursor = get_connection().cursor()
+    cursor.execute(f'SELECT COUNT(*) FROM orders WHERE {where}', params)
+    total = cursor.fetchone()[0]
+
+    page_filter, page_params = '', []
+    if after is not None:
+        after_date, after_id = after
+        if after_date is None:
+            page_filter = ' AND order_date IS NULL AND id < ?'
+            page_params = [after_id]
+        else:
+            page_filter = ' AND (order_date < ? OR (order_date = ? AND id < ?) OR order_date IS NULL)'
+            page_params = [after_date, after_date, after_id]
+    cursor.execute(f'''
+        SELECT id, order_date, {', '.join(fields)} FROM orders WHERE {where}{page_filter}
+        ORDER BY order_date DESC, id DESC LIMIT ?
+    ''', params + page_params + [limit + 1])
+    rows = cursor.fetchall()
+    next_after = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return [dict(zip(fields, row[2:])) for row in rows[:limit]], total, next_after
+
+def request_orders(request_id):
+    """Stored orders of the case a logged request looked up, or None if there is no such request"""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT case_type, case_number, case_year FROM requests WHERE id = ?', (request_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    case = get_case(*row)
+    return get_orders(case['id']) if case is not None else []
+
+def latest_request_id(case_type, case_number, case_year):
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT id FROM requests WHERE case_type = ? AND case_number = ? AND case_year = ?
+        ORDER BY timestamp DESC, id DESC LIMIT 1
+    ''', (case_type, case_number, case_year))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+JOB_FIELDS = ('id', 'status', 'case_type', 'case_number', 'case_year', 'captcha_entered', 'session_key',
+              'force_refresh', 'callback_url', 'created_at', 'started_at', 'finished_at', 'result_html',
+              'orders_html', 'cached', 'timings', 'error')
+
+def claim_flight(case_type, case_number, case_year, owner, now, expires_at):
+    """Become the one process scraping this case; False while another holds an unexpired claim"""
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO lookup_flights (case_type, case_number, case_year, owner, started_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (case_type, case_number, case_year) DO UPDATE SET
+                owner = excluded.owner, started_at = excluded.started_at, expires_at = excluded.expires_at,
+                finished_at = NULL, result_html = NULL, orders_html = NULL
+            WHERE lookup_flights.finished_at IS NOT NULL OR lookup_flights.expires_at < excluded.started_at
+        ''', (case_type, case_number, case_year, owner, now, expires_at))
+        return cursor.rowcount == 1
+
+def finish_flight(case_type, case_number, case_year, owner, finished_at, result_html=None, orders_html=None,
+                  keep=60):
+    """Publish the result of a claimed scrape (None if it isn't worth sharing) and prune old flights"""
+    with transaction() as cursor:
+        cursor.execute('''
+            UPDATE lookup_flights SET finished_at = ?, result_html = ?, orders_html = ?
+            WHERE case_type = ? AND case_number = ? AND case_year = ? AND owner = ?
+        ''', (finished_at, encode_html(result_html), encode_html(orders_html), case_type, case_number, case_year,
+              owner))
+        cursor.execute('DELETE FROM lookup_flights WHERE finished_at < ?', (finished_at - keep,))
+
+def flight_result(case_type, case_number, case_year, finished_since):
+    """(result_html, orders_html) of a scrape of this case shared since finished_since, or None"""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT result_html, orders_html FROM lookup_flights
+        WHERE case_type = ? AND case_number = ? AND case_year = ? AND finished_at >= ? AND result_html IS NOT NULL
+    ''', (case_type, case_number, case_year, finished_since))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return decode_html(row[0]), decode_html(row[1])
+
+def create_job(job_id, case_type, case_number, case_year, captcha_entered, session_key, force_refresh,
+               callback_url, created_at):
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO jobs (id, status, case_type, case_number, case_year, captcha_entered, session_key,
+                              force_refresh, callback_url, created_at)
+            VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, case_type, case_number, case_year, captcha_entered, session_key, int(force_refresh),
+              callback_url, created_at))
+
+def claim_job(job_id, started_at):
+    """Mark a queued job as running; False if another worker or process got it first"""
+    with transaction() as cursor:
+        cursor.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                       (started_at, job_id))
+        return cursor.rowcount == 1
+
+def finish_job(job_id, status, finished_at, result_html=None, orders_html=None, cached=False, timings=None,
+               error=None):
+    with transaction() as cursor:
+        cursor.execute('''
+            UPDATE jobs SET status = ?, finished_at = ?, result_html = ?, orders_html = ?, cached = ?,
+                            timings = ?, error = ?
+            WHERE id = ?
+        ''', (status, finished_at, encode_html(result_html), encode_html(orders_html), int(cached), timings,
+              error, job_id))
+
+def get_job(job_id):
+    """Return the job row as a dict with its HTML decoded, or None"""
+    cursor = get_connection().cursor()
+    cursor.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    job = dict(zip(JOB_FIELDS, row))
+    job['result_html'] = decode_html(job['result_html'])
+    job['orders_html'] = decode_html(job['orders_html'])
+    return job
+
+def queue_position(job_id):
+    """Number of queued jobs created before this one"""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT COUNT(*) FROM jobs
+        WHERE status = 'queued' AND created_at < (SELECT created_at FROM jobs WHERE id = ?)
+    ''', (job_id,))
+    return cursor.fetchone()[0]
+
+def recover_jobs(stale_before):
+    """Requeue jobs left running by a dead process and return the ids of all queued jobs, oldest first"""
+    with transaction() as cursor:
+        # The captcha typed for an interrupted job belonged to a browser that no longer exists
+        cursor.execute('''
+            UPDATE jobs SET status = 'queued', started_at = NULL, captcha_entered = NULL
+            WHERE status = 'running' AND started_at < ?
+        ''', (stale_before,))
+        cursor.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")
+        return [row[0] for row in cursor.fetchall()]
+
+def prune_jobs(finished_before):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                       (finished_before,))
+        return cursor.rowcount
+
+def job_stats(now, window):
+    """Queue depth by status plus wait times of queued jobs and of jobs started within the window"""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')
+    counts = dict(cursor.fetchall())
+    cursor.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'")
+    oldest = cursor.fetchone()[0]
+    cursor.execute('''
+        SELECT AVG(started_at - created_at), MAX(started_at - created_at), COUNT(*)
+        FROM jobs WHERE started_at >= ?
+    ''', (now - window,))
+    avg_wait, max_wait, started = cursor.fetchone()
+    cursor.execute('''
+        SELECT AVG(finished_at - started_at) FROM jobs
+        WHERE status IN ('done', 'failed') AND finished_at >= ?
+    ''', (now - window,))
+    avg_run = cursor.fetchone()[0]
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_queued_wait': round(now - oldest, 3) if oldest is not None else 0,
+        'started_recently': started,
+        'avg_wait': round(avg_wait or 0, 3),
+        'max_wait': round(max_wait or 0, 3),
+        'avg_run': round(avg_run or 0, 3),
+    }
+
+def track_case(case_type, case_number, case_year, added_at):
+    """Start tracking a case; it is due for a check straight away. Returns the tracking id"""
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO tracked_cases (case_type, case_number, case_year, added_at, next_check_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(case_type, case_number, case_year) DO NOTHING
+        ''', (case_type, case_number, case_year, added_at, added_at))
+        cursor.execute('SELECT id FROM tracked_cases WHERE case_type = ? AND case_number = ? AND case_year = ?',
+                       (case_type, case_number, case_year))
+        return cursor.fetchone()[0]
+
+def untrack_case(tracking_id):
+    with transaction() as cursor:
+        cursor.execute('DELETE FROM tracked_cases WHERE id = ?', (tracking_id,))
+        return cursor.rowcount == 1
+
+TRACKED_FIELDS = ('id', 'case_type', 'case_number', 'case_year', 'added_at', 'last_checked_at',
+                  'next_check_at', 'last_error')
+
+def tracked_cases(due_before=None):
+    """All tracked cases, or only those due for a check before the given time"""
+    cursor = get_connection().cursor()
+    if due_before is None:
+        cursor.execute(f"SELECT {', '.join(TRACKED_FIELDS)} FROM tracked_cases ORDER BY id")
+    else:
+        cursor.execute(f'''
+            SELECT {', '.join(TRACKED_FIELDS)} FROM tracked_cases
+            WHERE next_check_at <= ? ORDER BY next_check_at
+        ''', (due_before,))
+    return [dict(zip(TRACKED_FIELDS, row)) for row in cursor.fetchall()]
+
+def mark_tracked(tracking_id, checked_at, next_check_at, error=None):
+    """Schedule a tracked case's next check; a checked_at of None keeps the last successful one"""
+    with transaction() as cursor:
+        cursor.execute('''
+            UPDATE tracked_cases SET last_checked_at = COALESCE(?, last_checked_at), next_check_at = ?, last_error = ?
+            WHERE id = ?
+        ''', (checked_at, next_check_at, error, tracking_id))
+
+def add_case_event(case_type, case_number, case_year, kind, payload, created_at):
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO case_events (case_type, case_number, case_year, kind, payload, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (case_type, case_number, case_year, kind, payload, created_at))
+        return cursor.lastrowid
+
+def case_events(since_id=0, limit=100):
+    """Events with an id above since_id, oldest first"""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT id, case_type, case_number, case_year, kind, payload, created_at FROM case_events
+        WHERE id > ? ORDER BY id LIMIT ?
+    ''', (since_id, limit))
+    return [dict(zip(('id', 'case_type', 'case_number', 'case_year', 'kind', 'payload', 'created_at'), row))
+            for row in cursor.fetchall()]
+
+def save_case_types(case_types, fetched_at):
+    """Replace the persisted case-type list"""
+    with transaction() as cursor:
+        cursor.execute('DELETE FROM case_types')
+        cursor.executemany('INSERT INTO case_types (value, text, position, fetched_at) VALUES (?, ?, ?, ?)',
+                           [(ct['value'], ct['text'], i, fetched_at) for i, ct in enumerate(case_types)])
+
+def load_case_types():
+    """Return (case_types, fetched_at) from the persisted list, or ([], None)"""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT value, text, fetched_at FROM case_types ORDER BY position')
+    rows = cursor.fetchall()
+    if not rows:
+        return [], None
+    return [{'value': value, 'text': text} for value, text, _ in rows], rows[0][2]
+
+def get_pdf_url(url):
+    """Return (sha256, etag, last_modified, checked_at, size) for a stored order URL, or None"""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT u.sha256, u.etag, u.last_modified, u.checked_at, b.size
+        FROM pdf_urls u JOIN pdf_blobs b ON b.sha256 = u.sha256
+        WHERE u.url = ?
+    ''', (url,))
+    return cursor.fetchone()
+
+def save_pdf(url, sha256, size, etag, last_modified, now):
+    """Record a downloaded PDF; returns True if the blob was already stored"""
+    with transaction() as cursor:
+        cursor.execute('SELECT 1 FROM pdf_blobs WHERE sha256 = ?', (sha256,))
+        existed = cursor.fetchone() is not None
+        cursor.execute('''
+            INSERT INTO pdf_blobs (sha256, size, last_access) VALUES (?, ?, ?)
+            ON CONFLICT(sha256) DO UPDATE SET last_access = excluded.last_access
+        ''', (sha256, size, now))
+        cursor.execute('''
+            INSERT OR REPLACE INTO pdf_urls (url, sha256, etag, last_modified, checked_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (url, sha256, etag, last_modified, now))
+    return existed
+
+def touch_pdf(url, sha256, now, revalidated=False):
+    """Mark a stored PDF as recently used (and recently revalidated)"""
+    with transaction() as cursor:
+        cursor.execute('UPDATE pdf_blobs SET last_access = ? WHERE sha256 = ?', (now, sha256))
+        if revalidated:
+            cursor.execute('UPDATE pdf_urls SET checked_at = ? WHERE url = ?', (now, url))
+
+def pdf_store_size():
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM pdf_blobs')
+    return cursor.fetchone()
+
+def evict_pdfs(max_bytes):
+    """Drop least recently used blobs until the store fits; returns the evicted hashes"""
+    with transaction() as cursor:
+        cursor.execute('SELECT COALESCE(SUM(size), 0) FROM pdf_blobs')
+        total = cursor.fetchone()[0]
+        evicted = []
+        if total > max_bytes:
+            cursor.execute('SELECT sha256, size FROM pdf_blobs ORDER BY last_access')
+            for sha256, size in cursor.fetchall():
+                if total <= max_bytes:
+                    break
+                evicted.append(sha256)
+                total -= size
+            cursor.executemany('DELETE FROM pdf_urls WHERE sha256 = ?', [(h,) for h in evicted])
+            cursor.executemany('DELETE FROM pdf_blobs WHERE sha256 = ?', [(h,) for h in evicted])
+    return evicted
+
+SEARCH_FIELDS = ('kind', 'case_type', 'case_number', 'case_year', 'url', 'title')
+
+def search_state(name, default=0):
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT value FROM search_state WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    return row[0] if row else default
+
+def unindexed_results(after_id, limit):
+    """Stored lookups newer than result id ``after_id``, oldest first"""
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT s.id, r.case_type, r.case_number, r.case_year, s.storage
+        FROM results s JOIN requests r ON r.id = s.request_id
+        WHERE s.id > ? ORDER BY s.id LIMIT ?
+    ''', (after_id, limit)).fetchall()
+    # A result stored as "same" repeats one that is already indexed; only its id moves the watermark
+    return [(row_id, case_type, case_number, case_year,
+             *(_result_content(conn, row_id) if storage != 'same' else ('', '')))
+            for row_id, case_type, case_number, case_year, storage in rows]
+
+def unindexed_pdfs(checked_since, limit):
+    """Stored PDFs checked since ``checked_since`` whose current copy is not indexed yet.
+
+    Returns (url, sha256, checked_at, title, order_date, case_type, case_number, case_year) rows.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT u.url, u.sha256, u.checked_at, o.title, o.order_date, c.case_type, c.case_number, c.case_year
+        FROM pdf_urls u
+        LEFT JOIN search_docs d ON d.ref = 'pdf:' || u.url
+        LEFT JOIN orders o ON o.url = u.url
+        LEFT JOIN cases c ON c.id = o.case_id
+        WHERE u.checked_at >= ? AND d.version IS NOT u.sha256
+        GROUP BY u.url ORDER BY u.checked_at LIMIT ?
+    ''', (checked_since, limit))
+    return cursor.fetchall()
+
+def index_documents(documents, indexed_at, state=None):
+    """Replace the indexed text of each source and advance the indexer's watermarks in one transaction.
+
+    Each document is a dict with ``ref`` and ``version`` plus the SEARCH_FIELDS
+    and ``body``; a None body only records the version, leaving the source
+    out of the index. ``state`` maps watermark names to values.
+    """
+    with transaction() as cursor:
+        for doc in documents:
+            cursor.execute('SELECT doc_id FROM search_docs WHERE ref = ?', (doc['ref'],))
+            row = cursor.fetchone()
+            if row is not None and row[0] is not None:
+                cursor.execute('DELETE FROM search_index WHERE rowid = ?', (row[0],))
+            doc_id = None
+            if doc.get('body') is not None:
+                cursor.execute(f'''
+                    INSERT INTO search_index ({', '.join(SEARCH_FIELDS)}, body)
+                    VALUES ({', '.join('?' for _ in SEARCH_FIELDS)}, ?)
+                ''', (*(doc.get(field) for field in SEARCH_FIELDS), doc['body']))
+                doc_id = cursor.lastrowid
+            cursor.execute('''
+                INSERT OR REPLACE INTO search_docs (ref, doc_id, version, indexed_at) VALUES (?, ?, ?, ?)
+            ''', (doc['ref'], doc_id, doc['version'], indexed_at))
+        for name, value in (state or {}).items():
+            # Several indexers may run at once; a watermark never moves back
+            cursor.execute('''
+                INSERT INTO search_state (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)
+            ''', (name, value))
+
+def search(query, limit, offset=0, kind=None):
+    """Ranked page of index entries matching an FTS5 query, and the total number of matches.
+
+    Title matches weigh more than body ones. Snippets mark each matched term
+    with the control characters STX and ETX, for the caller to escape and style.
+    """
+    filters, params = ['search_index MATCH ?'], [query]
+    if kind:
+        filters.append('kind = ?')
+        params.append(kind)
+    where = ' AND '.join(filters)
+    cursor = get_connection().cursor()
+    cursor.execute(f'SELECT COUNT(*) FROM search_index WHERE {where}', params)
+    total = cursor.fetchone()[0]
+    cursor.execute(f'''
+        SELECT {', '.join(SEARCH_FIELDS)}, snippet(search_index, 6, char(2), char(3), '...', 16),
+               bm25(search_index, 0, 0, 0, 0, 0, 5.0, 1.0) AS score
+        FROM search_index WHERE {where}
+        ORDER BY score LIMIT ? OFFSET ?
+    ''', params + [limit, offset])
+    return [dict(zip(SEARCH_FIELDS + ('snippet', 'score'), row)) for row in cursor.fetchall()], total
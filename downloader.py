@@ -0,0 +1,115 @@
+"""Concurrent download of order PDFs, streamed out as a ZIP archive."""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
+import os
+import zipfile
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import outbound
+
+DOWNLOAD_CONCURRENCY = int(os.environ.get('DOWNLOAD_CONCURRENCY', '6'))
+DOWNLOAD_TIMEOUT = float(os.environ.get('DOWNLOAD_TIMEOUT', '30'))
+# PDFs larger than this spill from memory to a temporary file
+SPOOL_MAX_MEMORY = int(os.environ.get('DOWNLOAD_SPOOL_MAX_MEMORY', str(1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+# Shared keep-alive connection pool for every download
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_CONCURRENCY))
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_CONCURRENCY))
+
+
+def order_filename(url, index):
+    """Get filename from URL or create one"""
+    path = urlparse(url).path
+    if path.lower().endswith('.pdf'):
+        return os.path.basename(path)
+    return f"order_{index}.pdf"
+
+
+def fetch_pdf(url):
+    """Download one PDF into a spooled temporary file, or return None on failure"""
+    try:
+        with outbound.scheduler.request(url) as call, \
+                session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            outbound.response(call, response)
+            if response.status_code != 200:
+                print(f"Error downloading {url}: HTTP {response.status_code}")
+                return None
+            spool = SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                spool.write(chunk)
+            spool.seek(0)
+            return spool
+    except Exception as e:
+        print(f"Error downloading {url}: {e}")
+        return None
+
+
+class _ZipSink:
+    """Write-only, unseekable file object that collects bytes for streaming"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(urls, fetch=fetch_pdf, concurrency=DOWNLOAD_CONCURRENCY):
+    """Yield a ZIP archive of the given order PDFs while it is being built.
+
+    At most ``concurrency`` downloads are in flight and each finished PDF is
+    written out before the next one is started, so memory and temporary disk
+    stay bounded no matter how many orders a case has.
+    """
+    sink = _ZipSink()
+    pending = {}
+    used_names = set()
+    queue = list(enumerate(urls, 1))
+    queue.reverse()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        with zipfile.ZipFile(sink, 'w') as zipf:
+            while queue or pending:
+                while queue and len(pending) < concurrency:
+                    index, url = queue.pop()
+                    pending[executor.submit(fetch, url)] = (index, url)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, url = pending.pop(future)
+                    spool = future.result()
+                    if spool is None:
+                        continue
+                    with spool:
+                        filename = order_filename(url, index)
+                        if filename in used_names:
+                            filename = f"{index}_{filename}"
+                        used_names.add(filename)
+                        info = zipfile.ZipInfo(filename)
+                        info.file_size = spool.seek(0, os.SEEK_END)
+                        spool.seek(0)
+                        with zipf.open(info, 'w') as entry:
+                            for chunk in iter(lambda: spool.read(CHUNK_SIZE), b''):
+                                entry.write(chunk)
+                                data = sink.drain()
+                                if data:
+                                    yield data
+        yield sink.drain()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in pending:
+            if future.done() and future.result() is not None:
+                future.result().close()
@@ -0,0 +1,140 @@
+"""Chooses between the Selenium and plain-HTTP backends.
+
+FETCH_BACKEND=http tries http_worker first and falls back to the browser
+when the HTTP path fails. The backend that issued a user's captcha is
+remembered so the search is submitted where that captcha is valid.
+
+Every call goes through the court circuit breaker: while the site is known
+to be down they raise ``CircuitOpen`` straight away.
+
+With BROWSER_BROKER=1 the browser calls go to the shared broker process
+(browser_broker.py) instead of a Chrome pool in this process.
+"""
+from collections import OrderedDict
+import os
+import threading
+
+import broker_client
+import http_worker
+import metrics
+import selenium_worker
+from circuit_breaker import court, CircuitOpen
+from outbound import RateLimited
+
+FETCH_BACKEND = os.environ.get('FETCH_BACKEND', 'selenium').lower()
+USE_BROWSER_BROKER = broker_client.BROWSER_BROKER
+
+ISSUER_LIMIT = 10000
+
+_issuers = OrderedDict()
+_issuers_lock = threading.Lock()
+
+
+def browser():
+    """What drives Chrome for this process: the local pool or the shared broker"""
+    return broker_client.client if USE_BROWSER_BROKER else selenium_worker
+
+
+def backends():
+    if FETCH_BACKEND == 'http':
+        return [http_worker, browser()]
+    return [browser()]
+
+
+def _remember(session_key, backend):
+    with _issuers_lock:
+        _issuers.pop(session_key, None)
+        _issuers[session_key] = backend
+        while len(_issuers) > ISSUER_LIMIT:
+            _issuers.popitem(last=False)
+
+
+def site_failure(error):
+    """Whether an error counts against the court site rather than our own browsers"""
+    # Errors from the broker were already counted by the broker's own circuit breaker
+    if isinstance(error, (selenium_worker.PoolTimeout, CircuitOpen, RateLimited, broker_client.BrokerError)):
+        return False
+    return not selenium_worker.driver_failed(error)
+
+
+def _call(function, *args, **kwargs):
+    """Call a backend and tell the circuit breaker how it went"""
+    try:
+        result = function(*args, **kwargs)
+    except Exception as e:
+        if site_failure(e):
+            court.record_failure()
+        raise
+    court.record_success()
+    return result
+
+
+def _issue_captcha(name, session_key):
+    court.before_call()
+    *preferred, fallback = backends()
+    for backend in preferred:
+        try:
+            captcha = _call(getattr(backend, name), session_key)
+            _remember(session_key, backend)
+            return captcha
+        except Exception as e:
+            print(f"HTTP backend failed in {name}, falling back to Selenium: {e}")
+    captcha = _call(getattr(fallback, name), session_key)
+    _remember(session_key, fallback)
+    return captcha
+
+
+def claim_captcha(session_key):
+    """A captcha prepared ahead of time by the browser pool, or None if none is ready"""
+    if backends()[0] is http_worker:
+        return None
+    captcha = browser().claim_captcha(session_key)
+    if captcha is not None:
+        _remember(session_key, browser())
+    return captcha
+
+def start_prewarm():
+    """Start the browser pool's background threads: captcha prewarming and the health supervisor"""
+    if USE_BROWSER_BROKER:
+        # The broker runs both for its own pool; report that pool here
+        metrics.BROWSER_SESSIONS.set_function(broker_client.client.pool_sessions)
+        return
+    if backends()[0] is selenium_worker:
+        selenium_worker.pool.start_prewarm()
+    selenium_worker.pool.start_supervisor()
+
+def get_captcha(session_key=None):
+    return _issue_captcha('get_captcha', session_key)
+
+def refresh_captcha(session_key=None):
+    return _issue_captcha('refresh_captcha', session_key)
+
+def get_available_case_types():
+    try:
+        court.before_call()
+    except CircuitOpen:
+        return []
+    *preferred, fallback = backends()
+    for backend in preferred:
+        try:
+            case_types = backend.get_available_case_types()
+            if case_types:
+                return case_types
+        except Exception as e:
+            print(f"HTTP backend failed to list case types, falling back to Selenium: {e}")
+    return fallback.get_available_case_types()
+
+def submit_form(case_type, case_number, case_year, captcha_input, session_key=None, timings=None):
+    court.before_call()
+    with _issuers_lock:
+        backend = _issuers.get(session_key, backends()[0])
+    if backend is http_worker:
+        try:
+            return _call(http_worker.submit_form, case_type, case_number, case_year, captcha_input,
+                         session_key, timings=timings)
+        except Exception as e:
+            print(f"HTTP search failed, falling back to Selenium: {e}")
+            # The user's captcha belongs to the HTTP session; the browser enters its own
+            # (the Selenium search reports to the circuit breaker itself, as it returns errors as HTML)
+            return browser().submit_form(case_type, case_number, case_year, None, session_key, timings=timings)
+    return browser().submit_form(case_type, case_number, case_year, captcha_input, session_key, timings=timings)
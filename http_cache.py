@@ -0,0 +1,119 @@
+"""Response compression, ETags and Cache-Control.
+
+Every finished response passes through ``finalize``:
+
+- GET responses get a strong ETag hashed from their uncompressed body, and
+  a request whose If-None-Match already holds it is answered with an empty
+  304. Views may set their own Cache-Control; everything else is
+  ``no-cache``, i.e. always revalidated, which is what makes polling cheap.
+- Static files requested through ``static_url`` carry a content hash in
+  the URL and are cached for a year; bare static URLs revalidate.
+- Text, HTML, CSS, JS and JSON bodies of at least HTTP_COMPRESS_MIN_SIZE
+  bytes are sent brotli- or gzip-compressed when the client accepts it.
+  Brotli is used only if the ``brotli`` package is installed. Streamed
+  responses (ZIP downloads, NDJSON progress) are left alone.
+"""
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HTTP_COMPRESS_MIN_SIZE = int(os.environ.get('HTTP_COMPRESS_MIN_SIZE', '500'))
+HTTP_GZIP_LEVEL = int(os.environ.get('HTTP_GZIP_LEVEL', '6'))
+HTTP_BROTLI_QUALITY = int(os.environ.get('HTTP_BROTLI_QUALITY', '5'))
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', str(365 * 24 * 3600)))
+# How long clients may reuse results of disposed cases without asking again
+DISPOSED_MAX_AGE = int(os.environ.get('HTTP_DISPOSED_MAX_AGE', '3600'))
+
+COMPRESSIBLE = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                'application/json', 'application/x-ndjson', 'image/svg+xml'}
+
+_static_versions = {}
+
+
+def encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=HTTP_BROTLI_QUALITY)
+    # mtime=0 keeps the bytes, and so the ETag, identical between requests
+    return gzip.compress(data, HTTP_GZIP_LEVEL, mtime=0)
+
+
+def static_url(static_folder, filename):
+    """URL of a static file with a content hash, so it can be cached for good"""
+    path = os.path.join(static_folder, filename)
+    mtime = os.path.getmtime(path)
+    version = _static_versions.get(path)
+    if version is None or version[0] != mtime:
+        with open(path, 'rb') as f:
+            version = (mtime, hashlib.sha256(f.read()).hexdigest()[:12])
+        _static_versions[path] = version
+    return f"/static/{filename}?v={version[1]}"
+
+
+def cache_for(response, status, max_age=DISPOSED_MAX_AGE):
+    """Let clients reuse a response about a disposed case for max_age seconds"""
+    if (status or '').upper() == 'DISPOSED':
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+    return response
+
+
+def _matches(request, etag):
+    return any(request.if_none_match.contains(f"{etag}-{encoding}") for encoding in encodings()) or \
+        request.if_none_match.contains(etag)
+
+
+def finalize(request, response):
+    if response.status_code not in (200, 304):
+        return response
+
+    etag = None
+    if request.endpoint == 'static':
+        if request.args.get('v'):
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        if response.status_code == 304:
+            return response
+        # Static files are sent straight from disk unless they are compressed below
+        response.direct_passthrough = False
+        etag = response.get_etag()[0]
+    elif response.is_streamed:
+        return response
+    elif request.method in ('GET', 'HEAD') and response.status_code == 200:
+        etag = hashlib.sha256(response.get_data()).hexdigest()[:32]
+        response.set_etag(etag)
+        if not response.cache_control.max_age:
+            response.cache_control.no_cache = True
+
+    if response.status_code == 200 and response.mimetype in COMPRESSIBLE:
+        response.vary.add('Accept-Encoding')
+    if etag and _matches(request, etag):
+        response.status_code = 304
+        response.set_data(b'')
+        response.headers.pop('Content-Type', None)
+        response.headers.pop('Content-Length', None)
+        return response
+
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE:
+        return response
+    data = response.get_data()
+    encoding = request.accept_encodings.best_match(encodings())
+    if encoding is None or len(data) < HTTP_COMPRESS_MIN_SIZE or 'Content-Encoding' in response.headers:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # Each encoding is its own representation and needs its own strong ETag
+        response.set_etag(f"{etag}-{encoding}")
+    return response
@@ -0,0 +1,221 @@
+"""Plain-HTTP backend for the case-status lookup.
+
+Mirrors the public functions of selenium_worker but reproduces the search
+form POST and the Orders GET with pooled ``requests.Session`` objects, one
+per browser key, so the cookies and CSRF token that belong to a captcha stay
+together.
+"""
+from collections import OrderedDict
+from urllib.parse import urljoin
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+import metrics
+import outbound
+from selenium_worker import (CASE_STATUS_URL, parse_case_types, error_html,
+                             extract_result, extract_orders_table)
+
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '15'))
+HTTP_SESSION_LIMIT = int(os.environ.get('HTTP_SESSION_LIMIT', '200'))
+HTTP_SESSION_IDLE_TIMEOUT = float(os.environ.get('HTTP_SESSION_IDLE_TIMEOUT', '900'))
+
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/119.0 Safari/537.36")
+
+
+class HttpFetchError(Exception):
+    """Raised when the court site does not answer the way the HTTP path expects"""
+
+
+def new_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+class HttpSession:
+    """A cookie jar plus the search form it was last shown"""
+
+    def __init__(self):
+        self.session = new_session()
+        self.form = None
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+
+class SessionPool:
+    """LRU of HttpSessions keyed by browser key"""
+
+    def __init__(self, limit=HTTP_SESSION_LIMIT, idle_timeout=HTTP_SESSION_IDLE_TIMEOUT):
+        self.limit = limit
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+            if entry is None or now - entry.last_used > self.idle_timeout:
+                entry = HttpSession()
+            entry.last_used = now
+            self._sessions[key] = entry
+            while len(self._sessions) > self.limit:
+                _, evicted = self._sessions.popitem(last=False)
+                evicted.session.close()
+            return entry
+
+    def close(self):
+        with self._lock:
+            for entry in self._sessions.values():
+                entry.session.close()
+            self._sessions.clear()
+
+
+sessions = SessionPool()
+
+
+def parse_search_form(html):
+    """Pull the CSRF token, field names, case types and captcha out of the search page"""
+    soup = BeautifulSoup(html, 'html.parser')
+    captcha = soup.find(id="captcha-code")
+    if captcha is None or not captcha.get_text(strip=True):
+        raise HttpFetchError("Captcha not found on the search page")
+
+    form = soup.find("form")
+    token = None
+    token_name = '_token'
+    token_input = soup.find("input", attrs={"name": "_token"})
+    if token_input is not None:
+        token = token_input.get("value")
+    else:
+        meta = soup.find("meta", attrs={"name": "csrf-token"})
+        if meta is not None:
+            token = meta.get("content")
+
+    # The site addresses fields by id; post them under their name attribute
+    fields = {}
+    for field_id in ("case_type", "case_number", "case_year", "captchaInput"):
+        element = soup.find(id=field_id)
+        if element is None:
+            raise HttpFetchError(f"Field '{field_id}' not found on the search page")
+        fields[field_id] = element.get("name") or field_id
+
+    action = form.get("action") if form is not None and form.get("action") else CASE_STATUS_URL
+    return {
+        'action': urljoin(CASE_STATUS_URL, action),
+        'method': (form.get("method") or "POST").upper() if form is not None else "POST",
+        'token_name': token_name,
+        'token': token,
+        'fields': fields,
+        'case_types': [ct['value'] for ct in parse_case_types(html)],
+        'captcha': captcha.get_text(strip=True),
+    }
+
+
+def _send(session, method, url, **kwargs):
+    """Send one request to the court site through the outbound scheduler"""
+    with outbound.scheduler.request(url) as call:
+        response = session.request(method, url, timeout=HTTP_TIMEOUT, **kwargs)
+        outbound.response(call, response)
+    return response
+
+
+def _load_search_page(entry):
+    response = _send(entry.session, 'GET', CASE_STATUS_URL)
+    response.raise_for_status()
+    entry.form = parse_search_form(response.text)
+    return entry.form['captcha']
+
+
+def get_captcha(session_key=None):
+    entry = sessions.get(session_key)
+    with entry.lock:
+        if entry.form is None:
+            return _load_search_page(entry)
+        return entry.form['captcha']
+
+def refresh_captcha(session_key=None):
+    entry = sessions.get(session_key)
+    with entry.lock:
+        return _load_search_page(entry)
+
+def get_available_case_types():
+    """Get all available case types from the dropdown"""
+    session = new_session()
+    try:
+        response = _send(session, 'GET', CASE_STATUS_URL)
+        response.raise_for_status()
+        return parse_case_types(response.text)
+    finally:
+        session.close()
+
+def submit_form(case_type, case_number, case_year, captcha_input, session_key=None, timings=None):
+    """Search for a case over plain HTTP.
+
+    Same contract as selenium_worker.submit_form. Raises HttpFetchError when
+    the site answers in a way this backend cannot handle, so callers can fall
+    back to the browser.
+    """
+    entry = sessions.get(session_key)
+    with entry.lock:
+        return _submit_form(entry, case_type, case_number, case_year, captcha_input, timings)
+
+def _submit_form(entry, case_type, case_number, case_year, captcha_input, timings):
+    with metrics.span('form_fill', timings, backend='http'):
+        if entry.form is None:
+            _load_search_page(entry)
+        form = entry.form
+        # A captcha can only be used once
+        entry.form = None
+
+        if captcha_input is None:
+            captcha_input = form['captcha']
+        if case_type not in form['case_types']:
+            error_msg = f"Case type '{case_type}' not found. Available options: {', '.join(form['case_types'][:10])}..."
+            return error_html(error_msg), ""
+
+        data = {
+            form['fields']['case_type']: case_type,
+            form['fields']['case_number']: case_number,
+            form['fields']['case_year']: case_year,
+            form['fields']['captchaInput']: captcha_input,
+        }
+        headers = {'Referer': CASE_STATUS_URL}
+        if form['token']:
+            data[form['token_name']] = form['token']
+            headers['X-CSRF-TOKEN'] = form['token']
+
+    with metrics.span('search_wait', timings, backend='http'):
+        if form['method'] == 'GET':
+            response = _send(entry.session, 'GET', form['action'], params=data, headers=headers)
+        else:
+            response = _send(entry.session, 'POST', form['action'], data=data, headers=headers)
+        response.raise_for_status()
+        if 'html' not in response.headers.get('Content-Type', 'text/html'):
+            raise HttpFetchError(f"Unexpected search response type: {response.headers.get('Content-Type')}")
+
+    with metrics.span('parse', timings, backend='http'):
+        if 'table-responsive' not in response.text:
+            raise HttpFetchError("Result table not found in search response")
+        result_html, orders_url = extract_result(response.text, response.url)
+
+    orders_html = ""
+    if orders_url:
+        with metrics.span('orders_wait', timings, backend='http'):
+            try:
+                orders = _send(entry.session, 'GET', orders_url, headers={'Referer': response.url})
+                orders.raise_for_status()
+                orders_html = extract_orders_table(orders.text)
+            except requests.RequestException as e:
+                orders_html = f"<p class='scrape-error' style='color:red;'>Could not fetch Orders content: {str(e)}</p>"
+
+    return result_html, orders_html
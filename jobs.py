@@ -0,0 +1,183 @@
+"""Background queue for case lookups.
+
+Jobs are rows in the SQLite jobs table, so lookups queued before a restart
+are picked up again. A pool of worker threads runs them against the shared
+browser pool while the web request that queued them returns at once;
+clients poll the job or give a callback URL that receives the outcome.
+"""
+from urllib.parse import urlparse
+import ipaddress
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+
+import requests
+
+import db
+from selenium_worker import BROWSER_POOL_SIZE
+
+# One worker per pooled browser keeps every browser busy without queueing inside the pool
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', str(BROWSER_POOL_SIZE)))
+# A job still "running" after this long belonged to a process that died
+JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', '300'))
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', str(24 * 3600)))
+JOB_STATS_WINDOW = float(os.environ.get('JOB_STATS_WINDOW', '300'))
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', '10'))
+WEBHOOK_ATTEMPTS = int(os.environ.get('WEBHOOK_ATTEMPTS', '3'))
+# Comma-separated hosts job callbacks may go to, internal ones included; when empty any public host is allowed
+CALLBACK_ALLOWED_HOSTS = {host.strip().lower() for host in os.environ.get('CALLBACK_ALLOWED_HOSTS', '').split(',')
+                          if host.strip()}
+
+
+def describe(job, include_html=True):
+    """Public view of a job row"""
+    started_at, finished_at = job['started_at'], job['finished_at']
+    view = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'case_type': job['case_type'],
+        'case_number': job['case_number'],
+        'case_year': job['case_year'],
+        'created_at': job['created_at'],
+        'started_at': started_at,
+        'finished_at': finished_at,
+        # Durations are only given once known, so an unchanged job polls to an unchanged body (and ETag)
+        'wait_time': round(started_at - job['created_at'], 3) if started_at else None,
+        'run_time': round(finished_at - started_at, 3) if started_at and finished_at else None,
+        'cached': bool(job['cached']),
+        'timings': json.loads(job['timings']) if job['timings'] else {},
+        'error': job['error'],
+    }
+    if include_html and job['status'] == 'done':
+        view['result_html'] = job['result_html']
+        view['orders_html'] = job['orders_html']
+    return view
+
+
+def check_callback_url(url):
+    """Raise ValueError unless url is http(s) on a listed host, or on one that resolves only to public addresses.
+
+    Callback URLs come from anonymous clients, so they must not reach
+    loopback, private, link-local (cloud metadata) or other internal addresses.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('callback_url must be an http or https URL')
+    host = parsed.hostname.lower()
+    if CALLBACK_ALLOWED_HOSTS:
+        if host not in CALLBACK_ALLOWED_HOSTS:
+            raise ValueError(f"callback_url host {host} is not allowed")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or parsed.scheme)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError(f"callback_url host {host} could not be resolved")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ValueError(f"callback_url host {host} is not a public address")
+
+
+def deliver(url, payload, label, allow_redirects=True):
+    """POST a JSON payload to a webhook, retrying with backoff; True once delivered"""
+    for attempt in range(WEBHOOK_ATTEMPTS):
+        try:
+            response = requests.post(url, json=payload, timeout=WEBHOOK_TIMEOUT, allow_redirects=allow_redirects)
+            response.raise_for_status()
+            return True
+        except requests.RequestException as e:
+            print(f"Error delivering {label} to {url}: {str(e)}")
+            if attempt + 1 < WEBHOOK_ATTEMPTS:
+                time.sleep(2 ** attempt)
+    return False
+
+
+class JobQueue:
+    """Runs queued lookups on worker threads.
+
+    ``handler(job)`` does the work for one job row and returns
+    ``(result_html, orders_html, cached, timings)``.
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS):
+        self.handler = handler
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Requeue unfinished jobs from the database and start the workers"""
+        with self._lock:
+            if any(thread.is_alive() for thread in self._threads):
+                return self
+            # Threads don't survive a fork; a forked process starts its own workers on a queue of its own
+            self._threads, self._queue = [], queue.Queue()
+            now = time.time()
+            db.prune_jobs(now - JOB_RETENTION)
+            for job_id in db.recover_jobs(now - JOB_STALE_AFTER):
+                self._queue.put(job_id)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, case_type, case_number, case_year, captcha_entered=None, session_key=None,
+               force_refresh=False, callback_url=None):
+        """Queue a lookup and return its job id; raises ValueError for a callback URL that isn't allowed"""
+        if callback_url:
+            check_callback_url(callback_url)
+        job_id = uuid.uuid4().hex
+        db.create_job(job_id, case_type, case_number, case_year, captcha_entered, session_key, force_refresh,
+                      callback_url, time.time())
+        self._queue.put(job_id)
+        return job_id
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self.run(job_id)
+            except Exception as e:
+                print(f"Error running job {job_id}: {str(e)}")
+
+    def run(self, job_id):
+        if not db.claim_job(job_id, time.time()):
+            return
+        job = db.get_job(job_id)
+        try:
+            result_html, orders_html, cached, timings = self.handler(job)
+            db.finish_job(job_id, 'done', time.time(), result_html, orders_html, cached, json.dumps(timings))
+        except Exception as e:
+            db.finish_job(job_id, 'failed', time.time(), error=str(e))
+        if job['callback_url']:
+            # Deliver on a separate thread so a slow receiver never holds up the queue
+            threading.Thread(target=self.notify, args=(job_id, job['callback_url']), daemon=True).start()
+
+    def notify(self, job_id, callback_url):
+        # Checked again on delivery, since the host may resolve elsewhere by now; redirects are not followed
+        try:
+            check_callback_url(callback_url)
+        except ValueError as e:
+            print(f"Error delivering job {job_id} to {callback_url}: {str(e)}")
+            return False
+        return deliver(callback_url, describe(db.get_job(job_id)), f"job {job_id}", allow_redirects=False)
+
+    def stats(self):
+        stats = db.job_stats(time.time(), JOB_STATS_WINDOW)
+        stats['workers'] = len(self._threads)
+        return stats
+
+    def close(self, timeout=5):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
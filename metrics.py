@@ -0,0 +1,210 @@
+"""Counters, gauges and latency histograms in the Prometheus text format.
+
+Each phase of a lookup (browser checkout and startup, form fill, search
+wait, orders page, HTML parsing, SQLite writes) is timed with ``span``.
+The durations go into a histogram served at /metrics, into the caller's
+``timings`` dict if one is passed, and into the current request's
+breakdown, which the app returns as a ``Server-Timing`` header.
+"""
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+# Set METRICS_SERVER_TIMING=0 to leave the per-response Server-Timing header out
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '1') == '1'
+
+# Seconds; lookups range from cache hits in milliseconds to browser searches near a minute
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """A value read when /metrics is scraped, from ``set`` or from a function"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """``function()`` returns a number, or a dict of label-value tuples to numbers"""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception as e:
+                print(f"Error collecting {self.name}: {str(e)}")
+                values = {}
+            if not isinstance(values, dict):
+                values = {(): values}
+            with self._lock:
+                self._values = {tuple(str(v) for v in key): value for key, value in values.items()}
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0] * len(self.buckets), 0.0))
+        return counts[-1]
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + '_bucket', key, (('le', _format_value(bound)),), count))
+                samples.append((self.name + '_sum', key, (), total))
+                samples.append((self.name + '_count', key, (), counts[-1]))
+        return samples
+
+
+registry = []
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests served', ('method', 'endpoint', 'status'))
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time to produce a response', ('endpoint',))
+PHASE_SECONDS = Histogram('lookup_phase_seconds', 'Time spent in each phase of a lookup', ('backend', 'phase'))
+RESULT_CACHE = Counter('result_cache_lookups_total', 'Result cache lookups by outcome', ('result',))
+BROWSER_STARTS = Counter('browser_starts_total', 'Chrome sessions started', ('reason',))
+BROWSER_CHECKOUT_TIMEOUTS = Counter('browser_checkout_timeouts_total', 'Checkouts that found no free browser in time')
+BROWSER_SESSIONS = Gauge('browser_pool_sessions', 'Pooled browsers by state', ('state',))
+PDF_STORE = Counter('pdf_store_requests_total', 'Order PDF requests by outcome', ('result',))
+PDF_BYTES = Counter('pdf_bytes_total', 'Order PDF bytes served, by where they came from', ('source',))
+BROWSER_FAILURES = Counter('browser_failures_total', 'Browsers discarded as crashed or hung', ('reason',))
+CIRCUIT_OPEN = Gauge('court_circuit_open', 'Whether calls to the court site are being failed fast')
+LOOKUP_FLIGHTS = Counter('lookup_flights_total', 'Scrapes run, or shared between identical concurrent lookups',
+                         ('result',))
+CIRCUIT_REJECTED = Counter('court_circuit_rejected_total', 'Calls failed fast by an open circuit', ('circuit',))
+OUTBOUND_WAIT_SECONDS = Histogram('outbound_wait_seconds', 'Time requests to the court site queued for a turn',
+                                  ('host', 'priority'))
+OUTBOUND_REQUESTS = Counter('outbound_requests_total', 'Requests sent to the court site by outcome',
+                            ('host', 'priority', 'outcome'))
+SEARCH_INDEXED = Counter('search_documents_indexed_total', 'Case results and order PDFs added to the search index',
+                         ('kind',))
+OUTBOUND_RATE = Gauge('outbound_rate', 'Requests per second currently allowed to each upstream host', ('host',))
+
+
+@contextmanager
+def span(phase, timings=None, backend='app'):
+    """Time a phase of the work; also recorded in ``timings`` and the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start, timings, backend)
+
+
+def record(phase, seconds, timings=None, backend='app'):
+    """Record a phase that was timed by the caller"""
+    PHASE_SECONDS.observe(seconds, backend=backend, phase=phase)
+    if timings is not None:
+        timings[phase] = round(seconds, 3)
+    current = getattr(_local, 'timings', None)
+    if current is not None:
+        current[phase] = current.get(phase, 0) + seconds
+
+
+def begin_request():
+    _local.timings = {}
+
+
+def end_request():
+    """Seconds per phase spent on this thread since begin_request"""
+    timings, _local.timings = getattr(_local, 'timings', None) or {}, None
+    return timings
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value, durations in milliseconds"""
+    parts = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,267 @@
+"""Scheduler for every request we send to the court site.
+
+Requests to each upstream host draw from a token bucket refilled at
+OUTBOUND_RATE requests per second, with bursts of up to OUTBOUND_BURST.
+When requests have to queue, interactive ones (someone is waiting on the
+page) go before background ones (batches, tracked-case syncs, captcha
+prewarming), and within a class clients take turns, so one large batch or
+one busy user cannot take every slot.
+
+The rate adapts to how the site copes: an error (429, 5xx, timeout, refused
+connection) or an answer slower than OUTBOUND_SLOW_AFTER seconds halves the
+host's rate, down to OUTBOUND_MIN_RATE; each good answer wins a little of it
+back. A Retry-After header holds the host off for as long as it asks.
+
+Threads say who they are working for with ``context``; web requests set
+it in a before_request hook, batches and the tracker set it for their own
+threads, and ``bind`` carries it into thread pools.
+"""
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import os
+import threading
+import time
+
+import metrics
+
+# Requests per second per host; 0 turns the limiter off (waits only, metrics are still kept)
+OUTBOUND_RATE = float(os.environ.get('OUTBOUND_RATE', '5'))
+OUTBOUND_BURST = float(os.environ.get('OUTBOUND_BURST', '10'))
+OUTBOUND_MIN_RATE = float(os.environ.get('OUTBOUND_MIN_RATE', '0.2'))
+OUTBOUND_SLOW_AFTER = float(os.environ.get('OUTBOUND_SLOW_AFTER', '10'))
+# Share of the full rate won back per good answer after a backoff
+OUTBOUND_RECOVERY = float(os.environ.get('OUTBOUND_RECOVERY', '0.05'))
+# Longest a request waits for its turn before giving up with RateLimited
+OUTBOUND_MAX_WAIT = float(os.environ.get('OUTBOUND_MAX_WAIT', '60'))
+
+INTERACTIVE, BACKGROUND = 'interactive', 'background'
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+_local = threading.local()
+
+
+class RateLimited(Exception):
+    """Raised when a request waited OUTBOUND_MAX_WAIT without getting a turn"""
+
+
+def current():
+    """(priority, client) this thread is working for; background if nobody said otherwise"""
+    return getattr(_local, 'priority', BACKGROUND), getattr(_local, 'client', None)
+
+
+def set_context(priority, client=None):
+    _local.priority, _local.client = priority, client
+
+
+@contextmanager
+def context(priority, client=None):
+    previous = current()
+    set_context(priority, client)
+    try:
+        yield
+    finally:
+        set_context(*previous)
+
+
+def bind(function):
+    """Wrap function to run under the calling thread's context, e.g. on a thread pool"""
+    priority, client = current()
+
+    def bound(*args, **kwargs):
+        with context(priority, client):
+            return function(*args, **kwargs)
+    return bound
+
+
+class Ticket:
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+
+class HostLimiter:
+    """Token bucket with priority queues and adaptive rate for one upstream host"""
+
+    def __init__(self, host, rate=OUTBOUND_RATE, burst=OUTBOUND_BURST, min_rate=OUTBOUND_MIN_RATE,
+                 slow_after=OUTBOUND_SLOW_AFTER, recovery=OUTBOUND_RECOVERY):
+        self.host = host
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.min_rate = min(min_rate, rate) if rate > 0 else 0
+        self.slow_after = slow_after
+        self.recovery = recovery
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        # Per priority: client -> tickets in arrival order; clients are served round-robin
+        self._waiting = {priority: OrderedDict() for priority in PRIORITIES}
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _next_ticket(self):
+        for priority in PRIORITIES:
+            queues = self._waiting[priority]
+            if queues:
+                client, tickets = next(iter(queues.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    queues.move_to_end(client)
+                else:
+                    del queues[client]
+                return ticket
+        return None
+
+    def _grant(self):
+        # Caller holds self._cond
+        self._refill(time.monotonic())
+        granted = False
+        while self.tokens >= 1:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self.tokens -= 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _withdraw(self, ticket, priority, client):
+        tickets = self._waiting[priority].get(client)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._waiting[priority][client]
+
+    def acquire(self, priority=INTERACTIVE, client=None, timeout=OUTBOUND_MAX_WAIT):
+        """Wait for this host's next free slot; returns the seconds spent waiting"""
+        if self.max_rate <= 0:
+            return 0.0
+        start = time.monotonic()
+        ticket = Ticket()
+        with self._cond:
+            self._waiting[priority].setdefault(client, deque()).append(ticket)
+            while True:
+                self._grant()
+                if ticket.granted:
+                    return time.monotonic() - start
+                remaining = start + timeout - time.monotonic()
+                if remaining <= 0:
+                    self._withdraw(ticket, priority, client)
+                    raise RateLimited(f"No turn for a request to {self.host} within {timeout:.0f}s")
+                # Sleep until the next token is due; a grant by another thread wakes us sooner
+                self._cond.wait(min(remaining, max((1 - self.tokens) / self.rate, 0.001)))
+
+    def feedback(self, ok, seconds, retry_after=None):
+        """Adapt the rate to one finished request"""
+        if self.max_rate <= 0:
+            return 'ok' if ok else 'error'
+        outcome = 'ok' if ok and seconds <= self.slow_after else ('slow' if ok else 'error')
+        with self._cond:
+            if outcome == 'ok':
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+            else:
+                self.rate = max(self.min_rate, self.rate / 2)
+                # Spend the banked burst too, so the backoff takes effect at once
+                self.tokens = min(self.tokens, 0)
+            if retry_after:
+                self._refill(time.monotonic())
+                self.tokens = min(self.tokens, -retry_after * self.rate)
+        return outcome
+
+    def stats(self):
+        with self._cond:
+            return {
+                'rate': round(self.rate, 3),
+                'max_rate': self.max_rate,
+                'tokens': round(self.tokens, 2),
+                'waiting': {priority: sum(len(t) for t in queues.values())
+                            for priority, queues in self._waiting.items()},
+            }
+
+
+class Call:
+    """One scheduled request; report the response with ``response`` to adapt the rate"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.status = None
+        self.retry_after = None
+        self.seconds = None
+
+    def response(self, status, retry_after=None):
+        # Response time is taken here, so streaming a large body afterwards doesn't count as slow
+        self.seconds = time.monotonic() - self.started
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Scheduler:
+    def __init__(self, **limiter_options):
+        self.limiter_options = limiter_options
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, host):
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = HostLimiter(host, **self.limiter_options)
+            return limiter
+
+    @contextmanager
+    def request(self, url, priority=None, client=None):
+        """Hold a slot for one request to url's host.
+
+        Priority and client default to the thread's context. Exceptions
+        count as errors; otherwise call ``response(status)`` on the yielded
+        object once the status is known (without it the request counts as ok).
+        """
+        default_priority, default_client = current()
+        priority = priority or default_priority
+        client = client if client is not None else default_client
+        host = urlparse(url).hostname or url
+        limiter = self.limiter(host)
+        waited = limiter.acquire(priority, client)
+        metrics.OUTBOUND_WAIT_SECONDS.observe(waited, host=host, priority=priority)
+        metrics.record('outbound_wait', waited)
+
+        call = Call()
+        try:
+            yield call
+        except Exception:
+            outcome = limiter.feedback(False, time.monotonic() - call.started)
+            metrics.OUTBOUND_REQUESTS.inc(host=host, priority=priority, outcome=outcome)
+            raise
+        if call.seconds is None:
+            call.seconds = time.monotonic() - call.started
+        ok = call.status is None or not (call.status == 429 or call.status >= 500)
+        outcome = limiter.feedback(ok, call.seconds, call.retry_after)
+        metrics.OUTBOUND_REQUESTS.inc(host=host, priority=priority, outcome=outcome)
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.host: limiter.stats() for limiter in limiters}
+
+
+def retry_after(response):
+    """Seconds from a numeric Retry-After header, or None"""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def response(call, http_response):
+    """Report a requests response to the scheduler"""
+    call.response(http_response.status_code, retry_after(http_response))
+
+
+scheduler = Scheduler()
+metrics.OUTBOUND_RATE.set_function(
+    lambda: {(host,): stats['rate'] for host, stats in scheduler.stats().items()})
@@ -0,0 +1,150 @@
+"""Content-addressed on-disk store for order PDFs.
+
+PDFs are kept once per SHA-256 under PDF_STORE_DIR and indexed by URL in
+SQLite together with the ETag/Last-Modified validators. Stored copies are
+served without touching the network until they are older than
+PDF_STORE_REVALIDATE_AFTER, then revalidated with a conditional GET. The
+store is capped at PDF_STORE_MAX_BYTES with least-recently-used eviction.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import db
+import downloader
+import metrics
+import outbound
+
+PDF_STORE_DIR = os.environ.get('PDF_STORE_DIR', 'pdf_store')
+PDF_STORE_MAX_BYTES = int(os.environ.get('PDF_STORE_MAX_BYTES', str(2 * 1024 ** 3)))
+PDF_STORE_REVALIDATE_AFTER = float(os.environ.get('PDF_STORE_REVALIDATE_AFTER', str(24 * 3600)))
+
+
+class PdfStore:
+    def __init__(self, root=PDF_STORE_DIR, max_bytes=PDF_STORE_MAX_BYTES,
+                 revalidate_after=PDF_STORE_REVALIDATE_AFTER, session=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.session = session or downloader.session
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'dedup': 0,
+            'evictions': 0,
+            'bytes_saved': 0,
+            'bytes_downloaded': 0,
+        }
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256 + '.pdf')
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+        if 'hits' in increments:
+            metrics.PDF_STORE.inc(result='revalidated' if 'revalidated' in increments else 'hit')
+            metrics.PDF_BYTES.inc(increments['bytes_saved'], source='store')
+        elif 'misses' in increments:
+            metrics.PDF_STORE.inc(result='downloaded')
+            metrics.PDF_BYTES.inc(increments['bytes_downloaded'], source='court')
+
+    def fetch(self, url):
+        """Return an open file with the PDF at ``url``, or None if it can't be had"""
+        now = time.time()
+        row = db.get_pdf_url(url)
+        headers = {}
+        if row is not None:
+            sha256, etag, last_modified, checked_at, size = row
+            path = self.blob_path(sha256)
+            if not os.path.exists(path):
+                row = None
+            elif now - (checked_at or 0) < self.revalidate_after:
+                db.touch_pdf(url, sha256, now)
+                self._count(hits=1, bytes_saved=size)
+                return open(path, 'rb')
+            else:
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+
+        try:
+            with outbound.scheduler.request(url) as call, \
+                    self.session.get(url, headers=headers, stream=True,
+                                     timeout=downloader.DOWNLOAD_TIMEOUT) as response:
+                outbound.response(call, response)
+                if response.status_code == 304 and row is not None:
+                    db.touch_pdf(url, sha256, now, revalidated=True)
+                    self._count(hits=1, revalidated=1, bytes_saved=size)
+                    return open(path, 'rb')
+                if response.status_code != 200:
+                    print(f"Error downloading {url}: HTTP {response.status_code}")
+                    return None
+                tmp_path, sha256, size = self._write_temp(response)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except Exception as e:
+            if row is not None:
+                # The court site is unreachable; the stored copy beats nothing
+                self._count(hits=1, bytes_saved=size)
+                return open(path, 'rb')
+            print(f"Error downloading {url}: {e}")
+            return None
+
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        if db.save_pdf(url, sha256, size, etag, last_modified, now):
+            self._count(dedup=1)
+        self._count(misses=1, bytes_downloaded=size)
+
+        pdf = open(path, 'rb')
+        self._evict()
+        return pdf
+
+    def _write_temp(self, response):
+        digest = hashlib.sha256()
+        size = 0
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(downloader.CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        sha256 = digest.hexdigest()
+        os.makedirs(os.path.dirname(self.blob_path(sha256)), exist_ok=True)
+        return tmp_path, sha256, size
+
+    def _evict(self):
+        evicted = db.evict_pdfs(self.max_bytes)
+        for sha256 in evicted:
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+        if evicted:
+            self._count(evictions=len(evicted))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['bytes_stored'], stats['blobs'] = db.pdf_store_size()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+store = PdfStore()
@@ -0,0 +1,95 @@
+"""Read-through cache of case lookups keyed by (case_type, case_number, case_year).
+
+Recent results are kept in an in-memory LRU backed by the SQLite results
+table. How long a result stays fresh depends on the case status: disposed
+cases barely change, pending ones are re-scraped after a few minutes.
+"""
+from collections import OrderedDict
+import os
+import threading
+import time
+
+import db
+import metrics
+from case_parser import lookup_ok
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '512'))
+RESULT_TTL_DISPOSED = float(os.environ.get('RESULT_TTL_DISPOSED', str(3 * 24 * 3600)))
+RESULT_TTL_PENDING = float(os.environ.get('RESULT_TTL_PENDING', '600'))
+
+
+def case_status(result_html):
+    return 'disposed' if 'DISPOSED' in result_html.upper() else 'pending'
+
+
+def is_cacheable(case_number, result_html, orders_html):
+    """Only cache lookups that actually found the case and fetched cleanly"""
+    return lookup_ok(case_number, result_html, orders_html)
+
+
+class ResultCache:
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl_disposed=RESULT_TTL_DISPOSED,
+                 ttl_pending=RESULT_TTL_PENDING):
+        self.maxsize = maxsize
+        self.ttl = {'disposed': ttl_disposed, 'pending': ttl_pending}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_fresh(self, result_html, fetched_at, now=None):
+        now = time.time() if now is None else now
+        return now - fetched_at <= self.ttl[case_status(result_html)]
+
+    def get(self, key):
+        """Return (result_html, orders_html, fetched_at) if a fresh result is known"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self.is_fresh(entry[0], entry[2], now):
+                    self._entries.move_to_end(key)
+                    metrics.RESULT_CACHE.inc(result='memory')
+                    return entry
+                del self._entries[key]
+
+        row = db.latest_result(*key)
+        if row is None or row[2] is None:
+            metrics.RESULT_CACHE.inc(result='miss')
+            return None
+        result_html, orders_html, fetched_at = row
+        if not self.is_fresh(result_html, fetched_at, now):
+            metrics.RESULT_CACHE.inc(result='miss')
+            return None
+        entry = (result_html, orders_html or '', fetched_at)
+        self._store(key, entry)
+        metrics.RESULT_CACHE.inc(result='database')
+        return entry
+
+    def get_stale(self, key):
+        """The last good result however old it is, for when the court site can't be reached"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            row = db.latest_result(*key)
+            if row is None or row[2] is None:
+                return None
+            entry = (row[0], row[1] or '', row[2])
+        metrics.RESULT_CACHE.inc(result='stale')
+        return entry
+
+    def put(self, key, result_html, orders_html, fetched_at=None):
+        if is_cacheable(key[1], result_html, orders_html):
+            self._store(key, (result_html, orders_html, fetched_at or time.time()))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+cache = ResultCache()
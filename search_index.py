@@ -0,0 +1,247 @@
+"""Full-text search over stored case results and order PDFs.
+
+A background indexer picks up new rows of ``results`` (by id) and newly
+stored order PDFs (by their pdf_urls check time) every
+SEARCH_INDEX_INTERVAL seconds and writes their text to the SQLite FTS5
+table ``search_index``: one entry per case with its latest result and
+orders list, and one per order PDF. Text is extracted on a pool of
+SEARCH_INDEX_WORKERS processes, so parsing long PDFs never holds up web
+requests. PDF text needs the ``pypdf`` package; without it only case
+results are indexed.
+
+Under ``python app.py`` the indexer runs in the app process. Under a WSGI
+server it is off unless SEARCH_INDEXER=1, since every worker would run its
+own; run one indexer next to the workers instead:
+
+    gunicorn -w 8 app:app
+    python search_index.py
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+from bs4 import BeautifulSoup
+
+import db
+import metrics
+import pdf_store
+from case_parser import parse_result
+from result_cache import is_cacheable
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+# "1" indexes in every web process, "0" leaves it to a separately started ``python search_index.py``,
+# "auto" indexes only when the app runs as a single process with ``python app.py``
+SEARCH_INDEXER = os.environ.get('SEARCH_INDEXER', 'auto')
+SEARCH_INDEX_INTERVAL = float(os.environ.get('SEARCH_INDEX_INTERVAL', '2'))
+# Extraction processes; 0 extracts on the indexer thread itself
+SEARCH_INDEX_WORKERS = int(os.environ.get('SEARCH_INDEX_WORKERS', '2'))
+SEARCH_INDEX_BATCH = int(os.environ.get('SEARCH_INDEX_BATCH', '200'))
+# Pages read from each order PDF
+SEARCH_PDF_MAX_PAGES = int(os.environ.get('SEARCH_PDF_MAX_PAGES', '50'))
+# PDFs stored by another process may carry a slightly earlier check time than ones already indexed
+PDF_CLOCK_SLACK = 60
+
+
+def _html_text(markup):
+    if not markup or not markup.strip():
+        return ''
+    if lxml is not None:
+        return ' '.join(' '.join(lxml.html.fromstring(markup).itertext()).split())
+    return ' '.join(BeautifulSoup(markup, 'html.parser').get_text(' ').split())
+
+
+def result_text(result_html, orders_html):
+    """(case title, text) of a stored lookup; runs on the extraction pool"""
+    record = parse_result(result_html) or {}
+    text = ' '.join(part for part in (_html_text(result_html), _html_text(orders_html)) if part)
+    return record.get('case_title'), text
+
+
+def pdf_text(path, max_pages=SEARCH_PDF_MAX_PAGES):
+    """Text of the first ``max_pages`` pages of a stored PDF, or None; runs on the extraction pool"""
+    try:
+        reader = pypdf.PdfReader(path)
+        pages = (page.extract_text() or '' for page in reader.pages[:max_pages])
+        return ' '.join(' '.join(page.split()) for page in pages)
+    except Exception as e:
+        print(f"Error extracting text from {path}: {str(e)}")
+        return None
+
+
+def match_query(text):
+    """FTS5 query matching every word of free text; a word ending in * matches as a prefix"""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def search(text, page, limit, kind=None):
+    """Page ``page`` (from 1) of ranked hits for free text, with matches marked in each snippet"""
+    query = match_query(text or '')
+    if not query:
+        raise ValueError('No search terms given')
+    with metrics.span('search'):
+        hits, total = db.search(query, limit, (page - 1) * limit, kind)
+    for hit in hits:
+        # Indexed text comes from the court site; escape it before marking the matches
+        hit['snippet'] = html.escape(hit['snippet'] or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+        hit['score'] = round(-hit['score'], 3)
+    return {
+        'query': text,
+        'results': hits,
+        'total': total,
+        'page': page,
+        'next_page': page + 1 if page * limit < total else None,
+    }
+
+
+class Indexer:
+    """Indexes new results and PDFs in the background every ``interval`` seconds, or on demand"""
+
+    def __init__(self, interval=SEARCH_INDEX_INTERVAL, workers=SEARCH_INDEX_WORKERS, batch_size=SEARCH_INDEX_BATCH):
+        self.interval = interval
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_summary = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='search-indexer', daemon=True)
+                self._thread.start()
+        return self
+
+    def trigger(self):
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.clear()
+            try:
+                self.last_summary = self.index_pending()
+            except Exception as e:
+                print(f"Error indexing for search: {str(e)}")
+            self._wake.wait(self.interval)
+
+    def _map(self, function, *iterables):
+        if self.workers <= 0:
+            return list(map(function, *iterables))
+        if self._pool is None:
+            # Web processes run browser, job and scheduler threads; forking them as they are can deadlock a child
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+        return list(self._pool.map(function, *iterables))
+
+    def index_pending(self):
+        """Index everything stored since the last run; returns the number of results and PDFs read"""
+        summary = {'results': 0, 'orders': 0}
+        while True:
+            results, orders = self.index_results(), self.index_pdfs()
+            summary['results'] += results
+            summary['orders'] += orders
+            if results < self.batch_size and orders < self.batch_size:
+                return summary
+
+    def index_results(self):
+        rows = db.unindexed_results(db.search_state('results'), self.batch_size)
+        if not rows:
+            return 0
+        # Only the newest good result of each case is kept in the index
+        latest = {}
+        for row in rows:
+            if is_cacheable(row[2], row[4], row[5]):
+                latest[row[1:4]] = row
+        cases = list(latest.values())
+        with metrics.span('search_extract'):
+            extracted = self._map(result_text, [row[4] for row in cases], [row[5] for row in cases])
+        documents = [{
+            'ref': 'case:' + '|'.join(key),
+            'version': str(row_id),
+            'kind': 'case',
+            'case_type': key[0],
+            'case_number': key[1],
+            'case_year': key[2],
+            'url': None,
+            'title': title or f"{key[0]} {key[1]}/{key[2]}",
+            'body': text,
+        } for (row_id, *key, _, _), (title, text) in zip(cases, extracted)]
+        db.index_documents(documents, time.time(), {'results': rows[-1][0]})
+        metrics.SEARCH_INDEXED.inc(len(documents), kind='case')
+        return len(rows)
+
+    def index_pdfs(self):
+        if pypdf is None:
+            return 0
+        rows = db.unindexed_pdfs(db.search_state('pdfs') - PDF_CLOCK_SLACK, self.batch_size)
+        if not rows:
+            return 0
+        with metrics.span('search_extract'):
+            texts = self._map(pdf_text, [pdf_store.store.blob_path(row[1]) for row in rows])
+        # A PDF that can't be read is recorded without text so it isn't retried until it changes
+        documents = [{
+            'ref': 'pdf:' + url,
+            'version': sha256,
+            'kind': 'order',
+            'case_type': case_type,
+            'case_number': case_number,
+            'case_year': case_year,
+            'url': url,
+            'title': ' '.join(filter(None, (title, order_date))),
+            'body': text,
+        } for (url, sha256, _, title, order_date, case_type, case_number, case_year), text in zip(rows, texts)]
+        db.index_documents(documents, time.time(), {'pdfs': max(row[2] for row in rows)})
+        metrics.SEARCH_INDEXED.inc(sum(1 for doc in documents if doc['body'] is not None), kind='order')
+        return len(rows)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+indexer = Indexer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index stored case results and order PDFs for /search')
+    parser.add_argument('--once', action='store_true', help='index what is pending and exit')
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    if args.once:
+        print(json.dumps(indexer.index_pending()))
+        indexer.close()
+        return
+    indexer.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        indexer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,169 +5,793 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import (NoSuchElementException, TimeoutException, WebDriverException,
+                                        InvalidSessionIdException, NoSuchWindowException, NoSuchDriverException,
+                                        SessionNotCreatedException)
 from bs4 import BeautifulSoup
+from contextlib import contextmanager
+import atexit
+import os
+import threading
 import time
+from urllib.parse import urljoin
 
-driver = None
+import metrics
+import outbound
+from circuit_breaker import court
 
-def start_browser():
-    global driver
-    if driver is None:
-        options = Options()
-        options.add_argument("--headless=new")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
+# Point at a local stub of the court site for tests and benchmarks
+COURT_BASE_URL = os.environ.get('COURT_BASE_URL', 'https://delhihighcourt.nic.in')
+CASE_STATUS_URL = urljoin(COURT_BASE_URL, '/app/get-case-type-status')
+
+# Pool sizing and recycling can be tuned per deployment
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', '2'))
+BROWSER_MAX_NAVIGATIONS = int(os.environ.get('BROWSER_MAX_NAVIGATIONS', '200'))
+BROWSER_IDLE_TIMEOUT = float(os.environ.get('BROWSER_IDLE_TIMEOUT', '600'))
+BROWSER_CHECKOUT_TIMEOUT = float(os.environ.get('BROWSER_CHECKOUT_TIMEOUT', '60'))
+
+# Browsers keep a captcha ready for the next page load; a handed-out captcha
+# reserves its browser for that user until the reservation runs out
+CAPTCHA_PREWARM = int(os.environ.get('CAPTCHA_PREWARM', str(BROWSER_POOL_SIZE)))
+CAPTCHA_RESERVATION_TIMEOUT = float(os.environ.get('CAPTCHA_RESERVATION_TIMEOUT', '300'))
+CAPTCHA_MAX_AGE = float(os.environ.get('CAPTCHA_MAX_AGE', '300'))
+CAPTCHA_PREWARM_INTERVAL = float(os.environ.get('CAPTCHA_PREWARM_INTERVAL', '30'))
+
+# Upper bounds for the readiness waits; the waits return as soon as the
+# court site has actually rendered what we need
+PAGE_READY_TIMEOUT = float(os.environ.get('SELENIUM_TIMEOUT', '10'))
+CAPTCHA_REFRESH_TIMEOUT = float(os.environ.get('CAPTCHA_REFRESH_TIMEOUT', '3'))
+SEARCH_TIMEOUT = float(os.environ.get('SEARCH_TIMEOUT', '15'))
+ORDERS_TIMEOUT = float(os.environ.get('ORDERS_TIMEOUT', '10'))
+# Cap on any navigation, so a wedged page can't hold a browser for WebDriver's default 300s
+PAGE_LOAD_TIMEOUT = float(os.environ.get('PAGE_LOAD_TIMEOUT', '30'))
+
+# The supervisor checks idle browsers this often; one that takes longer than
+# BROWSER_PROBE_TIMEOUT to run a trivial script is treated as hung
+BROWSER_HEALTH_INTERVAL = float(os.environ.get('BROWSER_HEALTH_INTERVAL', '30'))
+BROWSER_PROBE_TIMEOUT = float(os.environ.get('BROWSER_PROBE_TIMEOUT', '5'))
+
+# Errors after which the browser itself is gone, rather than the page being slow
+DEAD_DRIVER_ERRORS = ('invalid session id', 'chrome not reachable', 'tab crashed', 'target crashed',
+                      'session deleted', 'disconnected', 'no such window', 'connection refused',
+                      'max retries exceeded')
+
+
+class PoolTimeout(Exception):
+    """Raised when no browser could be checked out in time"""
+
+
+def driver_failed(error):
+    """True if an error means Chrome or chromedriver has died or won't start, not that the court site misbehaved"""
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException, NoSuchDriverException,
+                          SessionNotCreatedException, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return isinstance(error, (WebDriverException, OSError)) and any(text in message for text in DEAD_DRIVER_ERRORS)
+
+
+# "lite" keeps Chrome to what the search form and result tables need;
+# "full" loads every resource the court site references
+BROWSER_PROFILE = os.environ.get('BROWSER_PROFILE', 'lite')
+BROWSER_WINDOW_SIZE = os.environ.get('BROWSER_WINDOW_SIZE', '1280,800')
+BROWSER_BLOCK_CSS = os.environ.get('BROWSER_BLOCK_CSS', '0') == '1'
+# Images, fonts, media and third-party trackers; extend with comma-separated wildcard patterns
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*facebook.net*', '*twitter.com/widgets*', '*fonts.googleapis.com*', '*fonts.gstatic.com*',
+] + [pattern.strip() for pattern in os.environ.get('BROWSER_BLOCK_URLS', '').split(',') if pattern.strip()]
+
+
+def create_driver(profile=None):
+    profile = profile or BROWSER_PROFILE
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--mute-audio")
+    options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    if profile == 'full':
         options.add_argument("--window-size=1920,1080")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--mute-audio")
-        options.add_experimental_option("excludeSwitches", ["enable-logging"])
-        service = Service()
-        driver = webdriver.Chrome(service=service, options=options)
-        driver.get("https://delhihighcourt.nic.in/app/get-case-type-status")
-        time.sleep(3)
+        driver = webdriver.Chrome(service=Service(), options=options)
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+        return driver
+
+    options.add_argument(f"--window-size={BROWSER_WINDOW_SIZE}")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-background-networking")
+    options.add_argument("--disable-default-apps")
+    options.add_argument("--disable-sync")
+    options.add_argument("--no-first-run")
+    options.add_argument("--disable-features=Translate,MediaRouter,OptimizationHints")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", {
+        'profile.managed_default_content_settings.images': 2,
+        'profile.default_content_setting_values.notifications': 2,
+        'profile.default_content_setting_values.geolocation': 2,
+    })
+    # The readiness waits poll for the elements we need, so don't also wait for every subresource
+    options.page_load_strategy = 'eager'
+    driver = webdriver.Chrome(service=Service(), options=options)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    blocked = BLOCKED_URLS + (['*.css'] if BROWSER_BLOCK_CSS else [])
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked})
+    except Exception as e:
+        print(f"Error setting up request blocking: {e}")
     return driver
 
-def get_captcha():
-    driver = start_browser()
-    return driver.find_element(By.ID, "captcha-code").text
 
-def refresh_captcha():
-    """Refresh captcha without reloading the entire page"""
-    global driver
-    if driver is None:
-        return get_captcha()
-    
-    try:
-        # First, make sure we're on the main search page
-        current_url = driver.current_url
-        if "get-case-type-status" not in current_url:
-            # If we're not on the main page, navigate back to it
-            driver.get("https://delhihighcourt.nic.in/app/get-case-type-status")
-            time.sleep(3)
-        
-        # Try to refresh the captcha by clicking a refresh button or reloading just the captcha area
-        # First, try to find a refresh button for captcha
+class BrowserSession:
+    """One pooled Chrome instance plus the bookkeeping the pool needs"""
+
+    def __init__(self, driver_factory):
+        self.driver_factory = driver_factory
+        self.driver = None
+        self.navigations = 0
+        self.owner = None
+        self.reserved_until = 0
+        self.ready_captcha = None
+        self.ready_at = 0
+        self.loaded_at = 0
+        self.in_use = False
+        self.last_used = time.time()
+        self.checked_at = 0
+        # Set by whoever saw it fail: broken browsers are discarded on release,
+        # suspect ones go to the supervisor for a health check first
+        self.broken = False
+        self.suspect = False
+
+    def reserved(self, now):
+        return self.owner is not None and self.reserved_until > now
+
+    def start(self, reason='new'):
+        metrics.BROWSER_STARTS.inc(reason=reason)
+        with metrics.span('browser_start', backend='selenium'):
+            self.driver = self.driver_factory()
+            self.navigations = 0
+            self.get(CASE_STATUS_URL)
+            _wait_for_search_page(self.driver)
+            self.checked_at = time.time()
+
+    def get(self, url):
+        with outbound.scheduler.request(url):
+            self.driver.get(url)
+        self.navigations += 1
+        self.loaded_at = time.time()
+
+    def reload(self):
+        with outbound.scheduler.request(CASE_STATUS_URL):
+            self.driver.refresh()
+        self.navigations += 1
+        self.loaded_at = time.time()
+
+    def is_healthy(self):
         try:
-            refresh_button = driver.find_element(By.ID, "refresh-captcha")
-            refresh_button.click()
-            time.sleep(1)
-        except:
-            # If no refresh button, try to reload the page but keep the driver instance
-            driver.refresh()
-            time.sleep(3)
-        
-        # Wait for the captcha element to be present
-        wait = WebDriverWait(driver, 10)
-        captcha_element = wait.until(EC.presence_of_element_located((By.ID, "captcha-code")))
-        return captcha_element.text
-    except Exception as e:
-        print(f"Error refreshing captcha: {e}")
-        # Fallback to getting a fresh captcha by restarting the browser
-        if driver:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def probe(self, timeout=BROWSER_PROBE_TIMEOUT):
+        """Like is_healthy, but runs a script in the page and gives up after timeout, catching hung tabs"""
+        answered = []
+
+        def run():
+            try:
+                answered.append(self.driver.execute_script('return document.readyState') is not None)
+            except Exception:
+                answered.append(False)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        return bool(answered and answered[0])
+
+    def quit(self):
+        if self.driver is not None:
             try:
-                driver.quit()
-            except:
+                self.driver.quit()
+            except Exception:
                 pass
-        driver = None
-        return get_captcha()
+        self.driver = None
+
+    def restart(self, reason):
+        self.quit()
+        self.start(reason)
+
+    def discard(self):
+        """Quit without waiting; a hung chromedriver can block quit() too"""
+        threading.Thread(target=self.quit, daemon=True).start()
+
+
+class DriverPool:
+    """Bounded pool of Chrome sessions with per-user affinity.
+
+    A session is bound to the key that last checked it out, so the captcha
+    shown to a user is solved on the same browser that issued it. The
+    binding is a reservation that lapses after ``reservation_timeout``
+    seconds without use. Idle sessions are evicted and busy ones are
+    recycled after a number of navigations to keep memory from creeping.
+
+    Once started with ``start_prewarm``, a background thread keeps up to
+    ``prewarm`` free sessions on the search page with a captcha already
+    read, so ``claim_captcha`` can hand one out without touching Chrome.
+
+    Once started with ``start_supervisor``, another thread takes care of
+    failed browsers off the request path: a browser released as ``broken``
+    is dropped at once and one marked ``suspect`` is held back until it
+    passes a health check. The supervisor also probes idle browsers every
+    ``health_interval`` seconds and starts replacements for the ones dropped.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_navigations=BROWSER_MAX_NAVIGATIONS,
+                 idle_timeout=BROWSER_IDLE_TIMEOUT, driver_factory=create_driver, prewarm=CAPTCHA_PREWARM,
+                 reservation_timeout=CAPTCHA_RESERVATION_TIMEOUT, captcha_max_age=CAPTCHA_MAX_AGE,
+                 health_interval=BROWSER_HEALTH_INTERVAL):
+        self.size = size
+        self.max_navigations = max_navigations
+        self.idle_timeout = idle_timeout
+        self.driver_factory = driver_factory
+        self.prewarm = min(prewarm, size)
+        self.reservation_timeout = reservation_timeout
+        self.captcha_max_age = captcha_max_age
+        self.health_interval = health_interval
+        self._sessions = []
+        self._cond = threading.Condition()
+        self._prewarm_wanted = threading.Event()
+        self._prewarmer = None
+        self._supervise_wanted = threading.Event()
+        self._supervisor = None
+        self._suspects = []
+        self._replacements = 0
+        self._closed = False
+
+    @contextmanager
+    def checkout(self, key=None, timeout=BROWSER_CHECKOUT_TIMEOUT):
+        try:
+            session = self._acquire(key, timeout)
+        except PoolTimeout:
+            # Counted here only: prewarming polls with timeout=0 whenever nothing needs warming
+            metrics.BROWSER_CHECKOUT_TIMEOUTS.inc()
+            raise
+        try:
+            yield session
+        finally:
+            self._release(session)
+
+    def _acquire(self, key, timeout, pick=None):
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                expired = self._evict_idle()
+                session = (pick or self._pick)(key)
+                if session is not None:
+                    session.in_use = True
+                    # Whoever holds the browser may change the page under the prepared captcha
+                    session.ready_captcha = None
+                    if key is not None:
+                        self._bind(session, key, time.time())
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout("No browser available within %.0fs" % timeout)
+                self._cond.wait(remaining)
+
+        for stale in expired:
+            stale.quit()
+
+        try:
+            if session.driver is None:
+                session.start()
+            elif session.navigations >= self.max_navigations:
+                session.restart('recycled')
+            elif not session.is_healthy():
+                session.restart('unhealthy')
+        except Exception:
+            with self._cond:
+                session.quit()
+                self._sessions.remove(session)
+                self._cond.notify()
+            raise
+        return session
+
+    def _bind(self, session, key, now):
+        # Caller holds self._cond; a key is only ever bound to one browser
+        for other in self._sessions:
+            if other.owner == key and other is not session:
+                other.owner, other.reserved_until = None, 0
+        session.owner = key
+        session.reserved_until = now + self.reservation_timeout
+
+    def _pick(self, key):
+        if key is not None:
+            for session in self._sessions:
+                if session.owner == key:
+                    return None if session.in_use else session
+
+        now = time.time()
+        idle = [s for s in self._sessions if not s.in_use]
+        free = [s for s in idle if not s.reserved(now)]
+        # Leave prepared captchas for page loads when another free browser will do
+        for session in free:
+            if session.ready_captcha is None:
+                return session
+        if free:
+            return free[0]
+
+        if len(self._sessions) < self.size:
+            session = BrowserSession(self.driver_factory)
+            self._sessions.append(session)
+            return session
+
+        # Every browser is bound to someone; take the least recently used one
+        if idle:
+            return min(idle, key=lambda s: s.last_used)
+        return None
+
+    def _evict_idle(self):
+        # Browsers holding a prepared captcha are the warm spares and are kept
+        now = time.time()
+        expired = [s for s in self._sessions
+                   if not s.in_use and s.ready_captcha is None and now - s.last_used > self.idle_timeout]
+        for session in expired:
+            self._sessions.remove(session)
+        return expired
+
+    def _release(self, session):
+        dropped = False
+        with self._cond:
+            session.last_used = time.time()
+            if session.broken:
+                # Never hand a crashed browser to the next user
+                if session in self._sessions:
+                    self._sessions.remove(session)
+                self._replacements += 1
+                dropped = True
+            elif session.suspect and self._supervisor is not None:
+                # Stays checked out until the supervisor has looked at it
+                self._suspects.append(session)
+            else:
+                session.in_use = False
+                session.suspect = False
+            self._cond.notify()
+        if dropped:
+            metrics.BROWSER_FAILURES.inc(reason='crashed')
+            session.discard()
+        if session.broken or session.suspect:
+            self._supervise_wanted.set()
+        self._prewarm_wanted.set()
+
+    def claim_captcha(self, key):
+        """Hand out a prepared captcha and reserve its browser for key; None if none is ready"""
+        now = time.time()
+        with self._cond:
+            ready = [s for s in self._sessions
+                     if not s.in_use and s.ready_captcha is not None and now - s.ready_at <= self.captcha_max_age
+                     and (s.owner == key or not s.reserved(now))]
+            session = None
+            if ready:
+                session = next((s for s in ready if s.owner == key), ready[0])
+                captcha, session.ready_captcha = session.ready_captcha, None
+                self._bind(session, key, now)
+                session.last_used = now
+        self._prewarm_wanted.set()
+        return captcha if session is not None else None
+
+    def start_prewarm(self):
+        """Start the background thread that keeps captchas ready"""
+        with self._cond:
+            if self._prewarmer is not None or self.prewarm <= 0:
+                return
+            self._prewarmer = threading.Thread(target=self._prewarm_loop, name='captcha-prewarm', daemon=True)
+            self._prewarmer.start()
+
+    def _prewarm_loop(self):
+        while not self._closed:
+            self._prewarm_wanted.clear()
+            try:
+                warmed = self.prewarm_one()
+            except Exception as e:
+                print(f"Error preparing captcha: {e}")
+                warmed = False
+            if not warmed:
+                self._prewarm_wanted.wait(CAPTCHA_PREWARM_INTERVAL)
+
+    def _pick_for_prewarm(self, key):
+        now = time.time()
+        ready = [s for s in self._sessions if s.ready_captcha is not None and now - s.ready_at <= self.captcha_max_age]
+        if len(ready) >= self.prewarm:
+            return None
+        for session in self._sessions:
+            if not session.in_use and not session.reserved(now) and session not in ready:
+                session.owner = None
+                return session
+        if len(self._sessions) < self.size:
+            session = BrowserSession(self.driver_factory)
+            self._sessions.append(session)
+            return session
+        return None
+
+    def prewarm_one(self):
+        """Prepare a captcha on one free browser; False if enough are ready or none is free"""
+        try:
+            session = self._acquire(None, 0, self._pick_for_prewarm)
+        except PoolTimeout:
+            return False
+        try:
+            if "get-case-type-status" not in session.driver.current_url:
+                session.get(CASE_STATUS_URL)
+            elif session.last_used > session.loaded_at:
+                # Someone used the page since it loaded, or its captcha went stale
+                session.reload()
+            captcha = _wait_for_search_page(session.driver)
+            with self._cond:
+                session.ready_captcha, session.ready_at = captcha, time.time()
+        finally:
+            self._release(session)
+        return True
+
+    def start_supervisor(self):
+        """Start the background thread that health-checks browsers and replaces failed ones"""
+        with self._cond:
+            if self._supervisor is not None:
+                return
+            self._supervisor = threading.Thread(target=self._supervise_loop, name='browser-supervisor', daemon=True)
+            self._supervisor.start()
+
+    def _supervise_loop(self):
+        while not self._closed:
+            self._supervise_wanted.clear()
+            try:
+                self.supervise()
+            except Exception as e:
+                print(f"Error supervising browsers: {e}")
+            self._supervise_wanted.wait(self.health_interval)
+
+    def supervise(self):
+        """Probe suspect and idle browsers, drop the dead or hung ones and start replacements"""
+        now = time.time()
+        with self._cond:
+            suspects, self._suspects = self._suspects, []
+            idle = [s for s in self._sessions
+                    if not s.in_use and s.driver is not None and now - s.checked_at >= self.health_interval]
+            for session in idle:
+                session.in_use = True
+
+        for session in suspects + idle:
+            healthy = session.driver is not None and session.probe()
+            with self._cond:
+                session.in_use = session.suspect = False
+                session.checked_at = time.time()
+                if not healthy:
+                    if session in self._sessions:
+                        self._sessions.remove(session)
+                    self._replacements += 1
+                self._cond.notify()
+            if not healthy:
+                metrics.BROWSER_FAILURES.inc(reason='unresponsive')
+                session.discard()
+
+        self._replace()
+
+    def _replace(self):
+        """Start browsers in place of the dropped ones, as long as the pool has room"""
+        while not self._closed:
+            with self._cond:
+                if len(self._sessions) >= self.size:
+                    # Checkouts already filled the free slots
+                    self._replacements = 0
+                if self._replacements <= 0:
+                    return
+                self._replacements -= 1
+                session = BrowserSession(self.driver_factory)
+                session.in_use = True
+                self._sessions.append(session)
+            try:
+                session.start('replaced')
+            except Exception as e:
+                print(f"Error starting replacement browser: {e}")
+                with self._cond:
+                    self._sessions.remove(session)
+                    self._replacements += 1
+                    self._cond.notify()
+                session.discard()
+                return
+            self._release(session)
+
+    def stats(self):
+        now = time.time()
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': len(self._sessions),
+                'in_use': sum(1 for s in self._sessions if s.in_use),
+                'bound': sum(1 for s in self._sessions if s.reserved(now)),
+                'captchas_ready': sum(1 for s in self._sessions if s.ready_captcha is not None),
+                'checking': len(self._suspects),
+                'replacing': self._replacements,
+            }
+
+    def close(self):
+        self._closed = True
+        self._prewarm_wanted.set()
+        self._supervise_wanted.set()
+        with self._cond:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.quit()
+
+
+pool = DriverPool()
+atexit.register(pool.close)
+
+
+def pool_sessions(stats):
+    """Pool stats as browser_pool_sessions gauge values"""
+    return {('open',): stats['open'], ('in_use',): stats['in_use'], ('bound',): stats['bound'],
+            ('captcha_ready',): stats['captchas_ready'], ('checking',): stats['checking'],
+            ('capacity',): stats['size']}
+
+metrics.BROWSER_SESSIONS.set_function(lambda: pool_sessions(pool.stats()))
+
+
+def _mark_failed(session, error):
+    """Flag a browser after an error so the pool doesn't hand it out as is"""
+    if isinstance(error, outbound.RateLimited):
+        # The browser never got to send the request
+        return
+    if driver_failed(error):
+        session.broken = True
+    else:
+        session.suspect = True
+
+
+@contextmanager
+def _watched(session):
+    try:
+        yield
+    except Exception as e:
+        _mark_failed(session, e)
+        raise
+
+
+def _timed(timings, step):
+    """Record how long a step of the scraping flow took, in seconds"""
+    return metrics.span(step, timings, backend='selenium')
+
+
+def _captcha_text(driver):
+    """Return the captcha text once it has been rendered, otherwise False"""
+    try:
+        text = driver.find_element(By.ID, "captcha-code").text.strip()
+    except NoSuchElementException:
+        return False
+    return text or False
+
+
+def _wait_for_search_page(driver):
+    wait = WebDriverWait(driver, PAGE_READY_TIMEOUT)
+    wait.until(EC.presence_of_element_located((By.ID, "case_type")))
+    return wait.until(_captcha_text)
+
+
+def _search_settled(driver):
+    """True once the search has produced result rows or an explicit outcome"""
+    try:
+        processing = driver.find_elements(By.CSS_SELECTOR, ".dataTables_processing")
+        if any(p.is_displayed() for p in processing):
+            return False
+        rows = driver.find_elements(By.CSS_SELECTOR, "div.table-responsive table tbody tr")
+    except Exception:
+        return False
+    return len(rows) > 0
+
+
+def _ensure_search_page(session):
+    if "get-case-type-status" not in session.driver.current_url:
+        # If we're not on the main page, navigate back to it
+        session.get(CASE_STATUS_URL)
+        _wait_for_search_page(session.driver)
+
+
+def claim_captcha(session_key):
+    """A prepared captcha reserved for session_key, or None; never waits on Chrome"""
+    return pool.claim_captcha(session_key)
+
+def get_captcha(session_key=None):
+    with pool.checkout(session_key) as session, _watched(session):
+        _ensure_search_page(session)
+        return _wait_for_search_page(session.driver)
+
+def refresh_captcha(session_key=None):
+    """Refresh captcha without reloading the entire page"""
+    with pool.checkout(session_key) as session:
+        driver = session.driver
+        try:
+            # First, make sure we're on the main search page
+            _ensure_search_page(session)
+            previous = _captcha_text(driver)
+
+            # Try to refresh the captcha by clicking a refresh button or reloading just the captcha area
+            # First, try to find a refresh button for captcha
+            try:
+                refresh_button = driver.find_element(By.ID, "refresh-captcha")
+                refresh_button.click()
+                # Wait for the captcha element to show a new value
+                WebDriverWait(driver, CAPTCHA_REFRESH_TIMEOUT).until(
+                    lambda d: _captcha_text(d) not in (False, previous))
+            except (NoSuchElementException, TimeoutException):
+                # If no refresh button, try to reload the page but keep the driver instance
+                session.reload()
+
+            return _wait_for_search_page(driver)
+        except Exception as e:
+            print(f"Error refreshing captcha: {e}")
+            # A dead browser is replaced in the background; after a site error it is only health-checked
+            _mark_failed(session, e)
+    # A captcha prepared by another browser, or a fresh one from whichever is free
+    return pool.claim_captcha(session_key) or get_captcha(session_key)
+
+def parse_case_types(html):
+    """Extract the case-type options from the search page HTML in one pass"""
+    soup = BeautifulSoup(html, 'html.parser')
+    select = soup.find("select", id="case_type")
+    if select is None:
+        return []
+    case_types = []
+    for option in select.find_all("option"):
+        value = (option.get("value") or "").strip()
+        if value:
+            case_types.append({
+                'value': value,
+                'text': option.get_text(strip=True)
+            })
+    return case_types
+
+def error_html(message):
+    return f"<div class='scrape-error' style='color: red; padding: 20px; border: 1px solid red;'><h3>Error</h3><p>{message}</p></div>"
+
+def extract_result(html, page_url=CASE_STATUS_URL):
+    """Return (result_html, orders_url) from a search results page"""
+    soup = BeautifulSoup(html, 'html.parser')
+    result_div = soup.find("div", class_="table-responsive") or soup
+    orders_url = None
+    orders_link_tag = soup.find("a", string="Orders")
+    if orders_link_tag and orders_link_tag.get("href"):
+        orders_url = urljoin(page_url, orders_link_tag["href"])
+    return str(result_div), orders_url
+
+def extract_orders_table(html):
+    orders_soup = BeautifulSoup(html, "html.parser")
+    orders_table = orders_soup.find("table", id="caseTable")
+    if orders_table:
+        return str(orders_table)
+    return "<p class='scrape-error' style='color:red;'>Orders table not found on the page.</p>"
 
 def get_available_case_types():
     """Get all available case types from the dropdown"""
-    driver = start_browser()
     try:
-        # Make sure we're on the main search page
-        current_url = driver.current_url
-        if "get-case-type-status" not in current_url:
-            # If we're not on the main page, navigate back to it
-            driver.get("https://delhihighcourt.nic.in/app/get-case-type-status")
-            time.sleep(3)
-        
-        # Wait for the case type select to be present
-        wait = WebDriverWait(driver, 10)
-        case_type_select = wait.until(EC.presence_of_element_located((By.ID, "case_type")))
-        select = Select(case_type_select)
-        options = select.options
-        case_types = []
-        for option in options:
-            if option.get_attribute("value") and option.get_attribute("value").strip():
-                case_types.append({
-                    'value': option.get_attribute("value"),
-                    'text': option.text
-                })
-        return case_types
+        with pool.checkout() as session:
+            # Make sure we're on the main search page
+            _ensure_search_page(session)
+
+            # Wait for the case type select to be present, then read every
+            # option from a single page_source snapshot
+            wait = WebDriverWait(session.driver, PAGE_READY_TIMEOUT)
+            wait.until(EC.presence_of_element_located((By.ID, "case_type")))
+            return parse_case_types(session.driver.page_source)
     except Exception as e:
         print(f"Error getting case types: {e}")
         return []
 
-def submit_form(case_type, case_number, case_year, captcha_input):
-    driver = start_browser()
+def submit_form(case_type, case_number, case_year, captcha_input, session_key=None, timings=None):
+    """Search for a case and fetch its Orders page.
+
+    If a ``timings`` dict is passed it is filled with the seconds spent in
+    each step (checkout, form_fill, search_wait, orders_wait, parse). When
+    ``captcha_input`` is None the captcha shown on the page is entered.
+    """
+    start = time.perf_counter()
+    with pool.checkout(session_key) as session:
+        metrics.record('checkout', time.perf_counter() - start, timings, backend='selenium')
+        return _submit_form(session, case_type, case_number, case_year, captcha_input, timings)
+
+def _submit_form(session, case_type, case_number, case_year, captcha_input, timings=None):
+    driver = session.driver
     
     try:
-        # Wait for elements to be present
-        wait = WebDriverWait(driver, 10)
-        
-        # Select case type with error handling
-        case_type_select = wait.until(EC.presence_of_element_located((By.ID, "case_type")))
-        select = Select(case_type_select)
-        
-        # Check if the case type exists
-        available_options = [option.get_attribute("value") for option in select.options]
-        if case_type not in available_options:
-            error_msg = f"Case type '{case_type}' not found. Available options: {', '.join(available_options[:10])}..."
-            return f"<div style='color: red; padding: 20px; border: 1px solid red;'><h3>Error</h3><p>{error_msg}</p></div>", ""
-        
-        select.select_by_value(case_type)
-        
-        # Fill other fields
-        case_number_input = wait.until(EC.presence_of_element_located((By.ID, "case_number")))
-        case_number_input.clear()
-        case_number_input.send_keys(case_number)
-        
-        year_select = wait.until(EC.presence_of_element_located((By.ID, "case_year")))
-        year_select_element = Select(year_select)
-        year_select_element.select_by_value(case_year)
-        
-        captcha_input_element = wait.until(EC.presence_of_element_located((By.ID, "captchaInput")))
-        captcha_input_element.clear()
-        captcha_input_element.send_keys(captcha_input)
-        
-        # Submit form
-        search_button = wait.until(EC.element_to_be_clickable((By.ID, "search")))
-        search_button.click()
-        time.sleep(5)
+        with _timed(timings, 'form_fill'):
+            _ensure_search_page(session)
+            if captcha_input is None:
+                captcha_input = _wait_for_search_page(driver)
+
+            # Wait for elements to be present
+            wait = WebDriverWait(driver, PAGE_READY_TIMEOUT)
+
+            # Select case type with error handling
+            case_type_select = wait.until(EC.presence_of_element_located((By.ID, "case_type")))
+            select = Select(case_type_select)
+
+            # Check if the case type exists
+            available_options = [option.get_attribute("value") for option in select.options]
+            if case_type not in available_options:
+                error_msg = f"Case type '{case_type}' not found. Available options: {', '.join(available_options[:10])}..."
+                return error_html(error_msg), ""
+
+            select.select_by_value(case_type)
+
+            # Fill other fields
+            case_number_input = wait.until(EC.presence_of_element_located((By.ID, "case_number")))
+            case_number_input.clear()
+            case_number_input.send_keys(case_number)
+
+            year_select = wait.until(EC.presence_of_element_located((By.ID, "case_year")))
+            year_select_element = Select(year_select)
+            year_select_element.select_by_value(case_year)
+
+            captcha_input_element = wait.until(EC.presence_of_element_located((By.ID, "captchaInput")))
+            captcha_input_element.clear()
+            captcha_input_element.send_keys(captcha_input)
+
+            # Remember the current first row so we can tell when the table is redrawn
+            old_rows = driver.find_elements(By.CSS_SELECTOR, "div.table-responsive table tbody tr")
 
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'html.parser')
+        with _timed(timings, 'search_wait'):
+            # Submit form
+            search_button = wait.until(EC.element_to_be_clickable((By.ID, "search")))
+            # The search posts to the court site from the page; it takes a turn like a navigation
+            with outbound.scheduler.request(CASE_STATUS_URL):
+                search_button.click()
+                try:
+                    search_wait = WebDriverWait(driver, SEARCH_TIMEOUT)
+                    if old_rows:
+                        search_wait.until(EC.staleness_of(old_rows[0]))
+                    search_wait.until(_search_settled)
+                except TimeoutException:
+                    # Fall through and use whatever the page shows after the upper bound
+                    pass
+            html = driver.page_source
 
-        result_div = soup.find("div", class_="table-responsive") or soup
-        result_html = str(result_div)
+        with _timed(timings, 'parse'):
+            result_html, orders_url = extract_result(html, driver.current_url)
 
-        # Extract Orders link and fetch that page
+        # Fetch the Orders page linked from the result
         orders_html = ""
         try:
-            orders_link_tag = soup.find("a", string="Orders")
-            if orders_link_tag and orders_link_tag.get("href"):
-                orders_url = orders_link_tag["href"]
-                driver.get(orders_url)
-                time.sleep(3)
-                orders_soup = BeautifulSoup(driver.page_source, "html.parser")
-                orders_table = orders_soup.find("table", id="caseTable")
-                if orders_table:
-                    orders_html = str(orders_table)
-                else:
-                    orders_html = "<p style='color:red;'>Orders table not found on the page.</p>"
+            if orders_url:
+                with _timed(timings, 'orders_wait'):
+                    session.get(orders_url)
+                    try:
+                        WebDriverWait(driver, ORDERS_TIMEOUT).until(
+                            EC.presence_of_element_located((By.CSS_SELECTOR, "table#caseTable tbody")))
+                    except TimeoutException:
+                        pass
+                    orders_source = driver.page_source
+                orders_html = extract_orders_table(orders_source)
         except Exception as e:
-            orders_html = f"<p style='color:red;'>Could not fetch Orders content: {str(e)}</p>"
+            _mark_failed(session, e)
+            orders_html = f"<p class='scrape-error' style='color:red;'>Could not fetch Orders content: {str(e)}</p>"
 
+        court.record_success()
         return result_html, orders_html
         
     except NoSuchElementException as e:
-        error_msg = f"Element not found: {str(e)}"
-        return f"<div style='color: red; padding: 20px; border: 1px solid red;'><h3>Error</h3><p>{error_msg}</p></div>", ""
+        court.record_failure()
+        return error_html(f"Element not found: {str(e)}"), ""
     except TimeoutException as e:
-        error_msg = f"Timeout waiting for element: {str(e)}"
-        return f"<div style='color: red; padding: 20px; border: 1px solid red;'><h3>Error</h3><p>{error_msg}</p></div>", ""
+        # The page never rendered; health-check the browser before anyone else gets it
+        session.suspect = True
+        court.record_failure()
+        return error_html(f"Timeout waiting for element: {str(e)}"), ""
+    except outbound.RateLimited as e:
+        return error_html(str(e)), ""
     except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        return f"<div style='color: red; padding: 20px; border: 1px solid red;'><h3>Error</h3><p>{error_msg}</p></div>", ""
+        _mark_failed(session, e)
+        if not session.broken:
+            court.record_failure()
+        return error_html(f"Unexpected error: {str(e)}"), ""
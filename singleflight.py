@@ -0,0 +1,109 @@
+"""Coalesces concurrent identical case lookups into one scrape.
+
+When many people look up the same case at once, the first caller in the
+process becomes the leader and the others wait for its result instead of
+each driving a browser through the search and the Orders page. Across
+processes the leader first claims the case in the SQLite ``lookup_flights``
+table; if another process already holds the claim it waits for that
+process to publish its result there.
+
+Only results worth sharing (as decided by the caller, e.g. a found case
+without scrape errors) are handed to waiters. If the leader's scrape fails
+- a wrong captcha, say - each waiter goes on to run its own lookup.
+"""
+import os
+import threading
+import time
+import uuid
+
+import db
+import metrics
+
+# How long a claim holds before other processes stop waiting for it; above the worst-case scrape time
+LOOKUP_FLIGHT_LEASE = float(os.environ.get('LOOKUP_FLIGHT_LEASE', '120'))
+LOOKUP_FLIGHT_POLL = float(os.environ.get('LOOKUP_FLIGHT_POLL', '0.25'))
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.shareable = False
+
+
+class SingleFlight:
+    def __init__(self, lease=LOOKUP_FLIGHT_LEASE, poll=LOOKUP_FLIGHT_POLL):
+        self.lease = lease
+        self.poll = poll
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, scrape, shareable):
+        """Return (result, shared): scrape() run once for all concurrent callers with key.
+
+        ``scrape`` returns (result_html, orders_html) and ``shareable(result)``
+        says whether waiters may use it; ``shared`` is True if this caller
+        got another caller's result.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Flight()
+            if leader:
+                break
+            start = time.perf_counter()
+            finished = flight.done.wait(self.lease)
+            metrics.record('flight_wait', time.perf_counter() - start)
+            if finished and flight.shareable:
+                metrics.LOOKUP_FLIGHTS.inc(result='shared')
+                return flight.result, True
+            if not finished:
+                # The leader is stuck; don't wait any longer than another process would
+                return self._run(key, scrape, shareable), False
+
+        try:
+            flight.result, shared = self._lead(key, scrape, shareable)
+            flight.shareable = shared or shareable(flight.result)
+            return flight.result, shared
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _lead(self, key, scrape, shareable):
+        """Scrape under a cross-process claim, or wait for the process that holds it"""
+        owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        waiting_since = time.time()
+        start = time.perf_counter()
+        while True:
+            # A result published while we waited beats starting a scrape of our own
+            result = db.flight_result(*key, waiting_since)
+            if result is not None:
+                metrics.record('flight_wait', time.perf_counter() - start)
+                metrics.LOOKUP_FLIGHTS.inc(result='shared_process')
+                return result, True
+            now = time.time()
+            if db.claim_flight(*key, owner, now, now + self.lease):
+                break
+            if now - waiting_since >= self.lease:
+                return self._run(key, scrape, shareable), False
+            time.sleep(self.poll)
+        return self._run(key, scrape, shareable, owner=owner), False
+
+    def _run(self, key, scrape, shareable, owner=None):
+        """Scrape, publishing the result to other processes if we hold the claim"""
+        metrics.LOOKUP_FLIGHTS.inc(result='leader' if owner is not None else 'unclaimed')
+        try:
+            result = scrape()
+        except Exception:
+            if owner is not None:
+                db.finish_flight(*key, owner, time.time())
+            raise
+        if owner is not None:
+            db.finish_flight(*key, owner, time.time(), *(result if shareable(result) else (None, None)))
+        return result
+
+
+lookups = SingleFlight()
@@ -0,0 +1,75 @@
+"""Row-level deltas between stored versions of a case's result and orders HTML.
+
+A version is split into lines at table-row boundaries without changing a
+character, so joining the lines gives back the exact HTML. Lines are
+compared with whitespace collapsed, which makes re-indented but otherwise
+identical pages count as unchanged; deltas still rebuild changed pages
+byte for byte. A delta is a list of ops that rebuild the new lines from a
+base version: ``[start, end]`` copies base lines, a string is a new line.
+"""
+from difflib import SequenceMatcher
+import html
+import re
+
+ROW_BOUNDARY_RE = re.compile(r'(?=<tr[\s>])|(?=</tbody>)|(?=</table>)', re.I)
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def split_rows(markup):
+    """Lines of markup, one per table row; ''.join(lines) == markup"""
+    return [line for line in ROW_BOUNDARY_RE.split(markup or '') if line]
+
+
+def _normalized(lines):
+    return [' '.join(line.split()) for line in lines]
+
+
+def same(old_lines, new_lines):
+    return _normalized(old_lines) == _normalized(new_lines)
+
+
+def _opcodes(old_lines, new_lines):
+    return SequenceMatcher(None, _normalized(old_lines), _normalized(new_lines), autojunk=False).get_opcodes()
+
+
+def delta(base_lines, new_lines):
+    """Ops that rebuild new_lines from base_lines"""
+    ops = []
+    for tag, i1, i2, j1, j2 in _opcodes(base_lines, new_lines):
+        if tag != 'equal':
+            ops.extend(new_lines[j1:j2])
+            continue
+        # Rows that only match with whitespace collapsed are kept as they are, so the rebuild is exact
+        for i, j in zip(range(i1, i2), range(j1, j2)):
+            if base_lines[i] != new_lines[j]:
+                ops.append(new_lines[j])
+            elif ops and not isinstance(ops[-1], str) and ops[-1][1] == i:
+                ops[-1][1] = i + 1
+            else:
+                ops.append([i, i + 1])
+    return ops
+
+
+def apply(base_lines, ops):
+    lines = []
+    for op in ops:
+        if isinstance(op, str):
+            lines.append(op)
+        else:
+            lines.extend(base_lines[op[0]:op[1]])
+    return lines
+
+
+def row_text(line):
+    """Readable text of one row: tags dropped, entities decoded, whitespace collapsed"""
+    return ' '.join(html.unescape(TAG_RE.sub(' ', line)).split())
+
+
+def changes(old_lines, new_lines):
+    """{'added': [...], 'removed': [...]} row texts between two versions"""
+    added, removed = [], []
+    for tag, i1, i2, j1, j2 in _opcodes(old_lines, new_lines):
+        if tag != 'equal':
+            removed.extend(text for text in map(row_text, old_lines[i1:i2]) if text)
+            added.extend(text for text in map(row_text, new_lines[j1:j2]) if text)
+    return {'added': added, 'removed': removed}
@@ -0,0 +1,300 @@
+"""Local stand-in for the Delhi High Court case-status site.
+
+Serves the recorded search, result and Orders pages in tests/fixtures so
+the scraping backends can be exercised offline. Response latency and PDF
+sizes are configurable so it can stand in for the real site under load:
+
+    python tests/stub_court.py --port 8001 --cases 500 --latency 0.5 --pdf-size 100000-2000000
+"""
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+from string import Template
+from urllib.parse import parse_qs, urlparse
+import argparse
+import hashlib
+import os
+import random
+import string
+import threading
+import time
+import uuid
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+DEFAULT_CASES = {
+    ('W.P.(C)', '1234', '2024'): {
+        'status': 'PENDING',
+        'petitioner': 'RAMESH KUMAR',
+        'respondent': 'UNION OF INDIA &amp; ORS.',
+        'next_date': '15/03/2024',
+        'last_date': '12/02/2024',
+        'court_no': '12',
+        'orders': ['12/02/2024', '20/01/2024', '05/01/2024'],
+    },
+    ('CRL.A.', '77', '2023'): {
+        'status': 'DISPOSED',
+        'petitioner': 'STATE',
+        'respondent': 'MOHAN LAL',
+        'next_date': 'NA',
+        'last_date': '01/11/2023',
+        'court_no': '3',
+        'orders': ['01/11/2023'],
+    },
+}
+
+
+FIRST_ORDER_DATE = date(2015, 1, 1)
+
+# Request kinds that latency can be set for
+LATENCY_KINDS = ('search_page', 'search', 'orders', 'pdf')
+
+
+def synthetic_cases(count, orders_per_case=10, seed=0):
+    """``count`` generated W.P.(C) cases with ``orders_per_case`` orders each"""
+    rng = random.Random(seed)
+    cases = {}
+    for i in range(count):
+        # Distinct order dates, newest first as the court lists them
+        days = sorted(rng.sample(range(3650), orders_per_case), reverse=True)
+        dates = [(FIRST_ORDER_DATE + timedelta(days=day)).strftime('%d/%m/%Y') for day in days]
+        cases[('W.P.(C)', str(1000 + i), '2024')] = {
+            'status': rng.choice(('PENDING', 'DISPOSED')),
+            'petitioner': f"PETITIONER {i}",
+            'respondent': 'UNION OF INDIA &amp; ORS.',
+            'next_date': '15/03/2025',
+            'last_date': dates[0] if dates else 'NA',
+            'court_no': str(rng.randint(1, 40)),
+            'orders': dates,
+        }
+    return cases
+
+
+def parse_size(text):
+    """'2048' or a '1000-50000' range of bytes"""
+    low, _, high = text.partition('-')
+    return (int(low), int(high)) if high else int(low)
+
+
+def _template(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return Template(f.read())
+
+
+def case_slug(case_type, case_number, case_year):
+    return ''.join(c for c in case_type if c.isalnum()) + f"-{case_number}-{case_year}"
+
+
+class StubCourt:
+    """Threaded HTTP server replaying the court site's pages"""
+
+    def __init__(self, cases=None, pdf_size=2048, latency=0, jitter=0, host='127.0.0.1', port=0):
+        """``pdf_size`` is a byte count or a (min, max) range; each PDF keeps its size.
+
+        ``latency`` is seconds added before every response, or a dict keyed
+        by LATENCY_KINDS; ``jitter`` varies it by up to that fraction either way.
+        """
+        self.cases = dict(DEFAULT_CASES if cases is None else cases)
+        self.pdf_size = pdf_size
+        self.latency = latency if isinstance(latency, dict) else dict.fromkeys(LATENCY_KINDS, latency)
+        self.jitter = jitter
+        self.sessions = {}
+        self.hits = {}
+        self.lock = threading.Lock()
+        self.search_page = _template('search_page.html')
+        self.result_row = _template('result_row.html')
+        self.empty_row = _template('empty_row.html').template
+        self.orders_page = _template('orders_page.html')
+        self.order_row = _template('order_row.html')
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, path):
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+
+    def delay(self, kind):
+        seconds = self.latency.get(kind, 0)
+        if seconds and self.jitter:
+            seconds *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def new_form(self, session_id):
+        form = {
+            'token': uuid.uuid4().hex,
+            'captcha': ''.join(random.choices(string.ascii_uppercase + string.digits, k=6)),
+        }
+        with self.lock:
+            self.sessions[session_id] = form
+        return form
+
+    def render_search(self, form, rows=None):
+        return self.search_page.substitute(token=form['token'], captcha=form['captcha'],
+                                           rows=rows if rows is not None else self.empty_row)
+
+    def render_result(self, key):
+        case = self.cases[key]
+        case_type, case_number, case_year = key
+        return self.result_row.substitute(
+            case_type=case_type, case_number=case_number, case_year=case_year,
+            case_slug=case_slug(*key), **{k: v for k, v in case.items() if k != 'orders'})
+
+    def render_orders(self, key):
+        case_type, case_number, case_year = key
+        rows = []
+        for serial, order_date in enumerate(self.cases[key]['orders'], 1):
+            pdf_name = f"{case_slug(*key)}-{order_date.replace('/', '')}.pdf"
+            rows.append(self.order_row.substitute(
+                serial=serial, pdf_name=pdf_name, case_type=case_type,
+                case_number=case_number, case_year=case_year, order_date=order_date))
+        return self.orders_page.substitute(rows='\n'.join(rows))
+
+    def find_case(self, slug):
+        for key in self.cases:
+            if case_slug(*key) == slug:
+                return key
+        return None
+
+    def pdf_length(self, name):
+        if isinstance(self.pdf_size, int):
+            return self.pdf_size
+        low, high = self.pdf_size
+        # Derived from the name so a PDF has the same size (and ETag) on every request
+        return random.Random(name).randint(low, high)
+
+    def pdf_body(self, name):
+        header = b"%PDF-1.4\n% " + name.encode() + b"\n"
+        return header + b"0" * max(self.pdf_length(name) - len(header), 0)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def session_id(self):
+                cookie = SimpleCookie(self.headers.get('Cookie', ''))
+                if 'court_session' in cookie:
+                    return cookie['court_session'].value, False
+                return uuid.uuid4().hex, True
+
+            def send(self, status, body, content_type='text/html; charset=utf-8', session_id=None, headers=None):
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if session_id is not None:
+                    self.send_header('Set-Cookie', f'court_session={session_id}; Path=/')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                stub.count(path)
+                if path == '/app/get-case-type-status':
+                    stub.delay('search_page')
+                    sid, new = self.session_id()
+                    form = stub.new_form(sid)
+                    self.send(200, stub.render_search(form), session_id=sid if new else None)
+                elif path.startswith('/app/case-orders/'):
+                    stub.delay('orders')
+                    key = stub.find_case(path.rsplit('/', 1)[-1])
+                    if key is None:
+                        self.send(404, 'Not Found')
+                    else:
+                        self.send(200, stub.render_orders(key))
+                elif path.startswith('/app/showlogo/'):
+                    stub.delay('pdf')
+                    body = stub.pdf_body(path.rsplit('/', 1)[-1])
+                    etag = '"%s"' % hashlib.md5(body).hexdigest()
+                    if self.headers.get('If-None-Match') == etag:
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.end_headers()
+                    else:
+                        self.send(200, body, 'application/pdf', headers={'ETag': etag})
+                else:
+                    self.send(404, 'Not Found')
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                stub.count(path)
+                if path != '/app/get-case-type-status':
+                    self.send(404, 'Not Found')
+                    return
+                stub.delay('search')
+                length = int(self.headers.get('Content-Length', 0))
+                data = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+                sid, _ = self.session_id()
+                with stub.lock:
+                    form = stub.sessions.pop(sid, None)
+                if form is None or data.get('_token') != form['token']:
+                    # Laravel answers an expired CSRF token with 419
+                    self.send(419, 'Page Expired')
+                    return
+                next_form = stub.new_form(sid)
+                if data.get('captchaInput') != form['captcha']:
+                    rows = '<tr><td colspan="4" class="text-danger">Invalid Captcha</td></tr>'
+                    self.send(200, stub.render_search(next_form, rows))
+                    return
+                key = (data.get('case_type'), data.get('case_number'), data.get('case_year'))
+                rows = stub.render_result(key) if key in stub.cases else None
+                self.send(200, stub.render_search(next_form, rows))
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the court site')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--cases', type=int, default=0, help='generate this many cases instead of the defaults')
+    parser.add_argument('--orders-per-case', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0, help='seconds before every response')
+    parser.add_argument('--search-latency', type=float, help='seconds before search results')
+    parser.add_argument('--jitter', type=float, default=0.2, help='latency varies by up to this fraction')
+    parser.add_argument('--pdf-size', type=parse_size, default=2048, help="bytes, or a range like '1000-50000'")
+    args = parser.parse_args(argv)
+
+    latency = dict.fromkeys(LATENCY_KINDS, args.latency)
+    if args.search_latency is not None:
+        latency['search'] = args.search_latency
+    cases = synthetic_cases(args.cases, args.orders_per_case) if args.cases else None
+    stub = StubCourt(cases, args.pdf_size, latency, args.jitter, args.host, args.port)
+    print(f"Serving {len(stub.cases)} cases at {stub.base_url} (export COURT_BASE_URL={stub.base_url})")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ from unittest.mock import patch, MagicMock
 
 # Add the parent directory to the path to import app
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests index their throwaway databases themselves
+os.environ.setdefault('SEARCH_INDEXER', '0')
 
 from app import app, db
 
@@ -422,5 +424,1537 @@ class IntegrationTestCase(unittest.TestCase):
         data = response.get_json()
         self.assertIn('success', data)
 
+class TempDatabaseMixin:
+    """Point db.DB_PATH at a throwaway database for the duration of a test"""
+    
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        patcher = patch.object(db, 'DB_PATH', self.db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        db.init_db()
+
+    def tearDown(self):
+        db.close_connection()
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+class DriverPoolTestCase(unittest.TestCase):
+    """Test cases for the pooled browser sessions"""
+    
+    def make_pool(self, **kwargs):
+        from selenium_worker import DriverPool
+        kwargs.setdefault('size', 2)
+        return DriverPool(driver_factory=MagicMock, **kwargs)
+
+    def test_session_affinity(self):
+        """Test that a key keeps getting the browser that issued its captcha"""
+        pool = self.make_pool()
+        with pool.checkout('alice') as first:
+            pass
+        with pool.checkout('bob') as other:
+            self.assertIsNot(other, first)
+        with pool.checkout('alice') as again:
+            self.assertIs(again, first)
+
+    def test_pool_is_bounded(self):
+        """Test that checkout waits and times out once every browser is busy"""
+        import metrics
+        from selenium_worker import PoolTimeout
+        pool = self.make_pool(size=1)
+        timeouts = metrics.BROWSER_CHECKOUT_TIMEOUTS.value()
+        with pool.checkout('alice'):
+            with self.assertRaises(PoolTimeout):
+                with pool.checkout('bob', timeout=0.05):
+                    pass
+        self.assertEqual(pool.stats()['open'], 1)
+        self.assertEqual(metrics.BROWSER_CHECKOUT_TIMEOUTS.value(), timeouts + 1)
+
+    def test_recycle_after_navigations(self):
+        """Test that a browser is restarted after too many navigations"""
+        pool = self.make_pool(max_navigations=2)
+        with pool.checkout('alice') as session:
+            driver = session.driver
+            session.get('https://example.com')
+        with pool.checkout('alice') as session:
+            self.assertIsNot(session.driver, driver)
+            driver.quit.assert_called_once()
+
+    def test_idle_eviction(self):
+        """Test that idle browsers are closed"""
+        pool = self.make_pool(idle_timeout=0)
+        with pool.checkout('alice') as session:
+            driver = session.driver
+        with pool.checkout('bob'):
+            driver.quit.assert_called_once()
+            self.assertEqual(pool.stats()['open'], 1)
+
+    def make_driver(self):
+        driver = MagicMock()
+        driver.current_url = 'https://court.test/app/get-case-type-status'
+        driver.find_element.return_value.text = 'ABC123'
+        return driver
+
+    def test_prewarmed_captcha(self):
+        """Test that a prepared captcha is handed out without a checkout and reserves its browser"""
+        import metrics
+        from selenium_worker import DriverPool
+        pool = DriverPool(size=2, driver_factory=self.make_driver)
+        self.assertIsNone(pool.claim_captcha('alice'))
+        self.assertTrue(pool.prewarm_one())
+        self.assertTrue(pool.prewarm_one())
+        timeouts = metrics.BROWSER_CHECKOUT_TIMEOUTS.value()
+        self.assertFalse(pool.prewarm_one())
+        # Nothing left to warm is not a checkout timeout
+        self.assertEqual(metrics.BROWSER_CHECKOUT_TIMEOUTS.value(), timeouts)
+        self.assertEqual(pool.stats()['captchas_ready'], 2)
+
+        self.assertEqual(pool.claim_captcha('alice'), 'ABC123')
+        with pool.checkout('alice') as session:
+            self.assertEqual(session.owner, 'alice')
+        with pool.checkout('bob') as other:
+            self.assertIsNot(other, session)
+        self.assertIsNone(pool.claim_captcha('carol'))
+        # Both browsers are reserved, so there is nothing to refill yet
+        self.assertFalse(pool.prewarm_one())
+
+    def test_reservation_expires(self):
+        """Test that a reserved browser goes back to the pool after the timeout"""
+        from selenium_worker import DriverPool
+        pool = DriverPool(size=1, driver_factory=self.make_driver, reservation_timeout=0)
+        pool.prewarm_one()
+        self.assertEqual(pool.claim_captcha('alice'), 'ABC123')
+        self.assertTrue(pool.prewarm_one())
+        # The handed-out captcha is replaced by reloading the page
+        pool._sessions[0].driver.refresh.assert_called_once()
+        self.assertEqual(pool.claim_captcha('bob'), 'ABC123')
+        with pool.checkout('bob') as session:
+            self.assertEqual(session.owner, 'bob')
+
+    def test_lite_profile(self):
+        """Test that the lite profile blocks heavy resources and the full profile does not"""
+        import selenium_worker
+        with patch('selenium_worker.webdriver.Chrome') as chrome, patch('selenium_worker.Service'):
+            driver = selenium_worker.create_driver('lite')
+            options = chrome.call_args[1]['options']
+            self.assertIn('--disable-extensions', options.arguments)
+            self.assertEqual(options.page_load_strategy, 'eager')
+            blocked = driver.execute_cdp_cmd.call_args[0][1]['urls']
+            self.assertIn('*.woff2', blocked)
+            self.assertNotIn('*.css', blocked)
+
+            driver.reset_mock()
+            driver = selenium_worker.create_driver('full')
+            self.assertNotIn('--disable-extensions', chrome.call_args[1]['options'].arguments)
+            driver.execute_cdp_cmd.assert_not_called()
+
+    def test_home_page_never_waits_on_browser(self):
+        """Test that the home page renders without a ready captcha and fetches one afterwards"""
+        client = app.test_client()
+        with patch('app.claim_captcha', return_value=None), \
+                patch('app.get_captcha', side_effect=AssertionError('browser used')):
+            response = client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"fetch('/captcha')", response.data)
+        with patch('app.claim_captcha', return_value='XYZ789'):
+            response = client.get('/')
+        self.assertIn(b'XYZ789', response.data)
+        self.assertNotIn(b"fetch('/captcha')", response.data)
+
+    def test_broken_browser_replaced_in_background(self):
+        """Test that a crashed browser is dropped on release and the supervisor starts its replacement"""
+        import selenium_worker
+        pool = self.make_pool(size=1)
+        with pool.checkout('alice') as session:
+            selenium_worker._mark_failed(session, selenium_worker.InvalidSessionIdException('invalid session id'))
+        self.assertTrue(session.broken)
+        self.assertEqual(pool.stats()['open'], 0)
+        self.assertEqual(pool.stats()['replacing'], 1)
+
+        pool.supervise()
+        self.assertEqual(pool.stats()['open'], 1)
+        self.assertEqual(pool.stats()['replacing'], 0)
+        with pool.checkout('bob') as replacement:
+            self.assertIsNot(replacement, session)
+            self.assertIsNotNone(replacement.driver)
+
+    def test_refresh_timeout_keeps_browser(self):
+        """Test that a captcha refresh timing out on the court site doesn't throw the browser away"""
+        import selenium_worker
+        pool = self.make_pool(size=1)
+        pool._supervisor = MagicMock()
+        with patch('selenium_worker.pool', pool), \
+                patch('selenium_worker._ensure_search_page',
+                      side_effect=selenium_worker.TimeoutException('site slow')), \
+                patch('selenium_worker.get_captcha', return_value='XYZ789'):
+            self.assertEqual(selenium_worker.refresh_captcha('alice'), 'XYZ789')
+        self.assertFalse(pool._sessions[0].broken)
+        self.assertEqual(pool.stats()['checking'], 1)
+        self.assertEqual(pool.stats()['replacing'], 0)
+
+    def test_hung_browser_dropped_after_probe(self):
+        """Test that a browser that timed out is held back until it passes a health check"""
+        from selenium_worker import PoolTimeout
+        pool = self.make_pool(size=1)
+        pool._supervisor = MagicMock()
+        with pool.checkout('alice') as session:
+            session.suspect = True
+        with self.assertRaises(PoolTimeout):
+            with pool.checkout('bob', timeout=0.05):
+                pass
+        self.assertEqual(pool.stats()['checking'], 1)
+
+        with patch.object(type(session), 'probe', return_value=False):
+            pool.supervise()
+        self.assertNotIn(session, pool._sessions)
+        with pool.checkout('bob') as replacement:
+            self.assertIsNot(replacement, session)
+
+class CircuitBreakerTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for failing fast while the court site is down"""
+
+    def test_opens_and_recovers(self):
+        """Test that the circuit opens after repeated failures and closes after a good trial call"""
+        from circuit_breaker import CircuitBreaker, CircuitOpen, OPEN, HALF_OPEN, CLOSED
+        breaker = CircuitBreaker('test', threshold=2, reset_timeout=60)
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), OPEN)
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+        breaker.opened_at -= 60
+        self.assertEqual(breaker.state(), HALF_OPEN)
+        breaker.before_call()
+        # Only one trial call at a time
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), OPEN)
+
+        breaker.opened_at -= 60
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state(), CLOSED)
+
+    def test_open_circuit_serves_stored_result(self):
+        """Test that a lookup while the site is down returns the last stored result, or an error at once"""
+        import app as app_module
+        from circuit_breaker import CircuitOpen
+        key = ('W.P.(C)', '1234', '2024')
+        result_html = ('<div class="table-responsive"><table><tr><td>1</td><td>W.P.(C) - 1234 / 2024 [PENDING]</td>'
+                       '<td>A VS. B</td><td>NEXT DATE: NA</td></tr></table></div>')
+        db.record_lookup(*key, 'ABC123', result_html, '<table id="caseTable"></table>')
+        app_module.result_cache.invalidate(key)
+
+        with patch('app.submit_form', side_effect=CircuitOpen('down')):
+            html, _, cached = app_module.lookup_case(*key, 'ABC123', session_key='test')
+            self.assertEqual(html, result_html)
+            self.assertTrue(cached)
+            html, orders_html, cached = app_module.lookup_case('LPA', '5', '2023', 'ABC123', session_key='test')
+            self.assertIn('scrape-error', html)
+            self.assertFalse(cached)
+
+class SingleFlightTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for sharing one scrape between identical concurrent lookups"""
+
+    KEY = ('W.P.(C)', '1234', '2024')
+    RESULT = (('<div class="table-responsive"><table><tr><td>1</td><td>W.P.(C) - 1234 / 2024 [PENDING]</td>'
+               '<td>A VS. B</td><td>NEXT DATE: NA</td></tr></table></div>'), '<table id="caseTable"></table>')
+
+    def setUp(self):
+        super().setUp()
+        import app as app_module
+        self.app_module = app_module
+        app_module.result_cache.invalidate(self.KEY)
+
+    def lookup(self, captcha='ABC123'):
+        return self.app_module.lookup_case(*self.KEY, captcha, force_refresh=True, session_key=captcha)
+
+    def test_concurrent_lookups_share_one_scrape(self):
+        """Test that lookups of the same case while one is running wait for it instead of scraping"""
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        started = threading.Event()
+
+        def slow_scrape(*args, **kwargs):
+            started.set()
+            time.sleep(0.2)
+            return self.RESULT
+
+        with patch('app.submit_form', side_effect=slow_scrape) as scrape, patch('app.store_case_records') as store, \
+                ThreadPoolExecutor(max_workers=5) as executor:
+            first = executor.submit(self.lookup)
+            started.wait(1)
+            others = [executor.submit(self.lookup) for _ in range(4)]
+            results = [first.result()] + [future.result() for future in others]
+        self.assertEqual(scrape.call_count, 1)
+        store.assert_called_once()
+        self.assertEqual([result[:2] for result in results], [self.RESULT] * 5)
+        self.assertEqual(sorted(result[2] for result in results), [False, True, True, True, True])
+
+    def test_failed_scrape_is_not_shared(self):
+        """Test that waiters run their own lookup when the one they waited for failed"""
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        started = threading.Event()
+
+        def scrape(case_type, case_number, case_year, captcha, *args, **kwargs):
+            if captcha == 'WRONG':
+                started.set()
+                time.sleep(0.2)
+                return "<div class='scrape-error'>Invalid captcha</div>", ''
+            return self.RESULT
+
+        with patch('app.submit_form', side_effect=scrape) as mock_scrape, patch('app.store_case_records'), \
+                ThreadPoolExecutor(max_workers=2) as executor:
+            wrong = executor.submit(self.lookup, 'WRONG')
+            started.wait(1)
+            right = executor.submit(self.lookup, 'ABC123')
+            self.assertIn('scrape-error', wrong.result()[0])
+            self.assertEqual(right.result(), self.RESULT + (False,))
+        self.assertEqual(mock_scrape.call_count, 2)
+
+    def test_waits_for_other_process(self):
+        """Test that a lookup claimed by another process is waited for and its published result used"""
+        import threading
+        import time
+        now = time.time()
+        self.assertTrue(db.claim_flight(*self.KEY, 'other-process', now, now + 60))
+        self.assertFalse(db.claim_flight(*self.KEY, 'this-process', now, now + 60))
+        timer = threading.Timer(0.2, db.finish_flight, (*self.KEY, 'other-process', time.time() + 0.2) + self.RESULT)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        with patch('app.submit_form', side_effect=AssertionError('scraped twice')):
+            self.assertEqual(self.lookup(), self.RESULT + (True,))
+        # A finished flight no longer blocks the next lookup
+        self.assertTrue(db.claim_flight(*self.KEY, 'this-process', time.time(), time.time() + 60))
+
+class BrowserBrokerTestCase(unittest.TestCase):
+    """Test cases for driving the browsers through the shared broker process"""
+
+    def setUp(self):
+        import threading
+        from browser_broker import BrokerServer, BrokerHandler
+        from broker_client import BrokerClient
+        self.path = os.path.join(tempfile.mkdtemp(), 'broker.sock')
+        self.server = BrokerServer(self.path, BrokerHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(os.unlink, self.path)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = BrokerClient(self.path, timeout=5)
+        self.addCleanup(self.client.close)
+
+    def test_calls_run_in_broker(self):
+        """Test that captcha and search calls reach the broker's browsers with the user's session key"""
+        def submit_form(case_type, case_number, case_year, captcha_input, session_key=None, timings=None):
+            timings['search_wait'] = 1.5
+            return f"<div>{case_number} for {session_key}</div>", '<table id="caseTable"></table>'
+
+        with patch('selenium_worker.get_captcha', return_value='ABC123') as get_captcha, \
+                patch('selenium_worker.submit_form', side_effect=submit_form):
+            self.assertEqual(self.client.get_captcha('alice'), 'ABC123')
+            get_captcha.assert_called_once_with('alice')
+            timings = {}
+            result = self.client.submit_form('W.P.(C)', '1234', '2024', 'ABC123', 'alice', timings=timings)
+        self.assertEqual(result, ('<div>1234 for alice</div>', '<table id="caseTable"></table>'))
+        self.assertEqual(timings, {'search_wait': 1.5})
+
+    def test_errors_keep_their_type(self):
+        """Test that pool timeouts and open circuits are raised as such in the worker"""
+        from selenium_worker import PoolTimeout
+        from circuit_breaker import CircuitOpen
+        from broker_client import BrokerError
+        with patch('selenium_worker.get_captcha', side_effect=PoolTimeout('busy')):
+            with self.assertRaises(PoolTimeout):
+                self.client.get_captcha('alice')
+        with patch('fetcher.court.before_call', side_effect=CircuitOpen('down')):
+            with self.assertRaises(CircuitOpen):
+                self.client.submit_form('W.P.(C)', '1234', '2024', 'ABC123', 'alice')
+        with self.assertRaises(BrokerError):
+            self.client.call('quit')
+
+    def test_fetcher_uses_broker(self):
+        """Test that workers with the broker enabled never start a browser of their own"""
+        import fetcher
+        client = MagicMock()
+        client.claim_captcha.return_value = 'XYZ789'
+        with patch('fetcher.USE_BROWSER_BROKER', True), patch('broker_client.client', client), \
+                patch('selenium_worker.pool') as local_pool, \
+                patch.object(fetcher.metrics.BROWSER_SESSIONS, 'set_function') as set_function:
+            self.assertEqual(fetcher.claim_captcha('alice'), 'XYZ789')
+            fetcher.submit_form('W.P.(C)', '1234', '2024', 'XYZ789', 'alice')
+            client.submit_form.assert_called_once()
+            fetcher.start_prewarm()
+            local_pool.start_prewarm.assert_not_called()
+            local_pool.start_supervisor.assert_not_called()
+            # /metrics reports the broker's pool
+            set_function.assert_called_once_with(client.pool_sessions)
+
+    def test_unavailable_broker(self):
+        """Test that a missing broker is reported as a browser failure, not a court site failure"""
+        import fetcher
+        from broker_client import BrokerClient, BrokerUnavailable
+        client = BrokerClient(self.path + '.missing', timeout=1)
+        with self.assertRaises(BrokerUnavailable) as raised:
+            client.get_captcha('alice')
+        self.assertFalse(fetcher.site_failure(raised.exception))
+
+class OutboundSchedulerTestCase(unittest.TestCase):
+    """Test cases for rate limiting and prioritising requests to the court site"""
+
+    def _grant_order(self, limiter, waiters):
+        """Queue (label, priority, client) waiters on an empty bucket and return the labels in grant order"""
+        import threading
+        import time
+        limiter.acquire()
+        order = []
+        threads = []
+        for label, priority, client in waiters:
+            thread = threading.Thread(target=lambda *a: (limiter.acquire(*a[1:]), order.append(a[0])),
+                                      args=(label, priority, client))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join(5)
+        return order
+
+    def test_interactive_before_background(self):
+        """Test that a queued interactive request gets the next slot ahead of earlier background ones"""
+        from outbound import HostLimiter, INTERACTIVE, BACKGROUND
+        limiter = HostLimiter('court.test', rate=10, burst=1)
+        order = self._grant_order(limiter, [('batch-1', BACKGROUND, 'batch'), ('batch-2', BACKGROUND, 'batch'),
+                                            ('user', INTERACTIVE, 'user')])
+        self.assertEqual(order, ['user', 'batch-1', 'batch-2'])
+
+    def test_clients_take_turns(self):
+        """Test that one client's queued requests don't hold up another client of the same class"""
+        from outbound import HostLimiter, BACKGROUND
+        limiter = HostLimiter('court.test', rate=10, burst=1)
+        order = self._grant_order(limiter, [('a1', BACKGROUND, 'a'), ('a2', BACKGROUND, 'a'),
+                                            ('a3', BACKGROUND, 'a'), ('b1', BACKGROUND, 'b')])
+        self.assertEqual(order, ['a1', 'b1', 'a2', 'a3'])
+
+    def test_backs_off_and_recovers(self):
+        """Test that errors and slow answers halve the rate and good answers win it back"""
+        from outbound import HostLimiter
+        limiter = HostLimiter('court.test', rate=10, burst=5, min_rate=1, slow_after=5, recovery=0.1)
+        self.assertEqual(limiter.feedback(False, 0.1), 'error')
+        self.assertEqual(limiter.rate, 5)
+        self.assertLessEqual(limiter.tokens, 0)
+        self.assertEqual(limiter.feedback(True, 6), 'slow')
+        self.assertEqual(limiter.rate, 2.5)
+        for _ in range(5):
+            limiter.feedback(False, 0.1)
+        self.assertEqual(limiter.rate, 1)
+        self.assertEqual(limiter.feedback(True, 0.1), 'ok')
+        self.assertEqual(limiter.rate, 2)
+
+        # Retry-After holds the host off for that long
+        limiter.feedback(True, 0.1, retry_after=30)
+        self.assertLessEqual(limiter.tokens, -30 * limiter.rate + 0.1)
+
+    def test_gives_up_after_max_wait(self):
+        """Test that a request that can't get a turn in time raises RateLimited and leaves the queue"""
+        from outbound import HostLimiter, RateLimited, INTERACTIVE
+        limiter = HostLimiter('court.test', rate=0.5, burst=1)
+        limiter.acquire()
+        with self.assertRaises(RateLimited):
+            limiter.acquire(INTERACTIVE, 'user', timeout=0.05)
+        self.assertEqual(limiter.stats()['waiting'], {'interactive': 0, 'background': 0})
+
+    def test_scheduler_records_wait_and_outcome(self):
+        """Test that scheduled requests are measured per host and class and 5xx answers slow the host down"""
+        import metrics
+        import outbound
+        scheduler = outbound.Scheduler(rate=100, burst=5)
+        url = 'https://court.test/app/get-case-type-status'
+        waits = metrics.OUTBOUND_WAIT_SECONDS.count(host='court.test', priority='interactive')
+        errors = metrics.OUTBOUND_REQUESTS.value(host='court.test', priority='interactive', outcome='error')
+        before = outbound.current()
+        with outbound.context(outbound.INTERACTIVE, 'user'):
+            with scheduler.request(url) as call:
+                call.response(503)
+        self.assertEqual(outbound.current(), before)
+        self.assertEqual(metrics.OUTBOUND_WAIT_SECONDS.count(host='court.test', priority='interactive'), waits + 1)
+        self.assertEqual(metrics.OUTBOUND_REQUESTS.value(host='court.test', priority='interactive', outcome='error'),
+                         errors + 1)
+        self.assertEqual(scheduler.stats()['court.test']['rate'], 50)
+
+        # bind carries the caller's context to a pool thread
+        from concurrent.futures import ThreadPoolExecutor
+        with outbound.context(outbound.INTERACTIVE, 'user'), ThreadPoolExecutor(1) as executor:
+            self.assertEqual(executor.submit(outbound.bind(outbound.current)).result(),
+                             (outbound.INTERACTIVE, 'user'))
+
+class SearchIndexTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for full-text search over stored results and order PDFs"""
+
+    def _store(self, key, parties):
+        result_html = (f'<div class="table-responsive"><table><tbody><tr><td>1</td>'
+                       f'<td>{key[0]} - {key[1]} / {key[2]} [PENDING]</td><td>{parties}</td>'
+                       f'<td>NEXT DATE: 01/05/2025 COURT NO: 12</td></tr></tbody></table></div>')
+        db.record_lookup(*key, 'ABC123', result_html, '<table id="caseTable"></table>')
+
+    def test_indexes_new_results_incrementally(self):
+        """Test that only new results are indexed and a case's entry follows its latest result"""
+        import search_index
+        indexer = search_index.Indexer(workers=0)
+        key = ('W.P.(C)', '1234', '2024')
+        self._store(key, 'RAMESH SHARMA VS. UNION OF INDIA')
+        db.record_lookup('LPA', '5', '2023', 'ABC123', '<p>No record found</p>', '')
+        self.assertEqual(indexer.index_pending(), {'results': 2, 'orders': 0})
+        self.assertEqual(indexer.index_pending(), {'results': 0, 'orders': 0})
+
+        hits = search_index.search('sharma', 1, 10)
+        self.assertEqual(hits['total'], 1)
+        hit = hits['results'][0]
+        self.assertEqual((hit['kind'], hit['case_type'], hit['case_number'], hit['case_year']), ('case',) + key)
+        self.assertIn('<mark>SHARMA</mark>', hit['snippet'])
+
+        self._store(key, 'RAMESH VERMA VS. UNION OF INDIA')
+        self.assertEqual(indexer.index_pending()['results'], 1)
+        self.assertEqual(search_index.search('sharma', 1, 10)['total'], 0)
+        self.assertEqual(search_index.search('verm*', 1, 10)['total'], 1)
+
+    def test_extracts_on_process_pool(self):
+        """Test that text extraction on worker processes gives the same index"""
+        import search_index
+        indexer = search_index.Indexer(workers=1)
+        self.addCleanup(indexer.close)
+        self._store(('CS(OS)', '77', '2022'), 'ACME LTD VS. GLOBEX CORP')
+        self.assertEqual(indexer.index_pending()['results'], 1)
+        self.assertEqual(search_index.search('globex', 1, 10)['total'], 1)
+        # Workers are never forked straight from the threaded web process
+        self.assertNotEqual(indexer._pool._mp_context.get_start_method(), 'fork')
+
+    def test_indexes_order_pdfs(self):
+        """Test that stored order PDFs are indexed under their case and re-indexed only when they change"""
+        import time
+        import search_index
+        url = 'https://delhihighcourt.nic.in/app/showlogo/WPC-1234-2024-01032024.pdf'
+        key = ('W.P.(C)', '1234', '2024')
+        db.save_case(*key, {'case_title': 'W.P.(C) 1234/2024'},
+                     [{'title': 'W.P.(C) 1234/2024', 'url': url, 'filename': 'a.pdf', 'order_date': '2024-03-01'}],
+                     time.time())
+        db.save_pdf(url, 'a' * 64, 100, None, None, time.time())
+        indexer = search_index.Indexer(workers=0)
+        with patch.object(search_index, 'pypdf', MagicMock()), \
+                patch.object(search_index, 'pdf_text', return_value='Petition under Article 226 is allowed') as pdf_text:
+            self.assertEqual(indexer.index_pending()['orders'], 1)
+            self.assertEqual(indexer.index_pending()['orders'], 0)
+            db.save_pdf(url, 'b' * 64, 100, None, None, time.time())
+            self.assertEqual(indexer.index_pending()['orders'], 1)
+        self.assertEqual(pdf_text.call_count, 2)
+
+        hits = search_index.search('article 226', 1, 10, kind='order')
+        self.assertEqual(hits['total'], 1)
+        self.assertEqual(hits['results'][0]['url'], url)
+        self.assertEqual(hits['results'][0]['case_number'], '1234')
+        self.assertEqual(hits['results'][0]['title'], 'W.P.(C) 1234/2024 2024-03-01')
+
+    def test_search_endpoint(self):
+        """Test ranked, paginated hits from /search and its input checks"""
+        import search_index
+        for number in ('1', '2', '3'):
+            self._store(('W.P.(C)', number, '2024'), f'<b>PARTY {number}</b> VS. STATE OF DELHI')
+        search_index.Indexer(workers=0).index_pending()
+        client = app.test_client()
+
+        data = client.get('/search?q=delhi&limit=2').get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['total'], len(data['results']), data['next_page']), (3, 2, 2))
+        data = client.get('/search?q=delhi&limit=2&page=2').get_json()
+        self.assertEqual((len(data['results']), data['next_page']), (1, None))
+
+        self.assertEqual(client.get('/search?q=').status_code, 400)
+        self.assertEqual(client.get('/search?q=delhi&kind=judge').status_code, 400)
+        # FTS5 syntax in the query is matched as plain words
+        self.assertEqual(client.get('/search?q=delhi%20OR%20(').status_code, 200)
+
+class DeltaStorageTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for storing repeated results as snapshots and deltas"""
+
+    KEY = ('W.P.(C)', '1234', '2024')
+
+    def _pages(self, orders, status='PENDING'):
+        result_html = (f'<div class="table-responsive"><table><tbody><tr><td>1</td>'
+                       f'<td>W.P.(C) - 1234 / 2024 [{status}]</td><td>RAMESH SHARMA VS. UNION OF INDIA</td>'
+                       f'<td>NEXT DATE: 01/05/2025</td></tr></tbody></table></div>')
+        rows = ''.join(f'\n  <tr><td>{i}</td><td><a href="/app/showlogo/{i}.pdf">W.P.(C) 1234/2024</a></td>'
+                       f'<td>{i:02d}/03/2024</td></tr>' for i in range(1, orders + 1))
+        return result_html, f'<table id="caseTable"><tbody>{rows}\n</tbody></table>'
+
+    def _storage(self):
+        return [row[0] for row in db.get_connection().execute('SELECT storage FROM results ORDER BY id')]
+
+    def test_delta_round_trip(self):
+        """Test that rows split losslessly and a delta rebuilds the new version exactly"""
+        import snapshots
+        _, old = self._pages(20)
+        _, new = self._pages(22)
+        self.assertEqual(''.join(snapshots.split_rows(new)), new)
+        base, lines = snapshots.split_rows(old), snapshots.split_rows(new)
+        self.assertEqual(''.join(snapshots.apply(base, snapshots.delta(base, lines))), new)
+        self.assertTrue(snapshots.same(base, snapshots.split_rows(old.replace('\n  ', '\n\t'))))
+
+    def test_repeated_results_stored_as_deltas(self):
+        """Test that unchanged results cost a pointer, changed ones a delta, and reads see every version whole"""
+        for _ in range(5):
+            db.record_lookup(*self.KEY, 'ABC123', *self._pages(40))
+        # Re-indented but otherwise identical
+        result_html, orders_html = self._pages(40)
+        db.record_lookup(*self.KEY, 'ABC123', result_html, orders_html.replace('\n  ', '\n    '))
+        latest = self._pages(41, status='DISPOSED')
+        db.record_lookup(*self.KEY, 'ABC123', *latest)
+        db.record_lookup(*self.KEY, 'ABC123', *latest)
+
+        self.assertEqual(self._storage(), ['snapshot'] + ['same'] * 5 + ['delta', 'same'])
+        self.assertEqual(db.latest_result(*self.KEY)[:2], latest)
+        sizes = db.get_connection().execute('''
+            SELECT SUM(COALESCE(length(result_html), 0) + COALESCE(length(orders_html), 0)
+                       + COALESCE(length(delta), 0)) FROM results
+        ''').fetchone()[0]
+        first = db.get_connection().execute(
+            'SELECT length(result_html) + length(orders_html) FROM results ORDER BY id LIMIT 1').fetchone()[0]
+        self.assertLess(sizes, first * 1.5)
+
+        changes, checks, _ = db.case_history(*self.KEY)
+        self.assertEqual(checks, 8)
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(changes[0]['orders'], {'added': ['41 W.P.(C) 1234/2024 41/03/2024'], 'removed': []})
+        self.assertIn('[DISPOSED]', changes[0]['result']['added'][0])
+        self.assertTrue(changes[1]['initial'])
+
+    def test_compacts_results_stored_whole(self):
+        """Test that results stored before delta mode are rewritten in place with their content intact"""
+        versions = [self._pages(40), self._pages(40), self._pages(42), self._pages(42, status='DISPOSED')]
+        with patch.object(db, 'RESULT_STORAGE', 'full'):
+            for version in versions:
+                db.record_lookup(*self.KEY, 'ABC123', *version)
+        self.assertEqual(self._storage(), [None] * 4)
+
+        db.compact_results()
+        self.assertEqual(self._storage(), ['snapshot', 'same', 'delta', 'delta'])
+        conn = db.get_connection()
+        ids = [row[0] for row in conn.execute('SELECT id FROM results ORDER BY id')]
+        self.assertEqual([db._result_content(conn, result_id) for result_id in ids], versions)
+        self.assertEqual(len(db.case_history(*self.KEY)[0]), 3)
+
+    def test_failed_scrapes_kept_out_of_versions(self):
+        """Test that failed scrapes are stored apart and later results are diffed against the last good one"""
+        from selenium_worker import error_html
+        db.record_lookup(*self.KEY, 'ABC123', *self._pages(40))
+        db.record_lookup(*self.KEY, 'ABC123', error_html('Timeout waiting for element'), '')
+        db.record_lookup(*self.KEY, 'ABC123', *self._pages(40))
+        db.record_lookup(*self.KEY, 'ABC123', *self._pages(41))
+        self.assertEqual(self._storage(), ['snapshot', 'failed', 'same', 'delta'])
+        changes = db.case_history(*self.KEY)[0]
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(changes[0]['result'], {'added': [], 'removed': []})
+        self.assertEqual(changes[0]['orders']['added'], ['41 W.P.(C) 1234/2024 41/03/2024'])
+
+        db.get_connection().execute('DELETE FROM results')
+        with patch.object(db, 'RESULT_STORAGE', 'full'):
+            db.record_lookup(*self.KEY, 'ABC123', *self._pages(40))
+            db.record_lookup(*self.KEY, 'ABC123', '<table><tr><td colspan="4">No data</td></tr></table>', '')
+        # As stored before failed scrapes were told apart
+        db.get_connection().execute('UPDATE results SET storage = NULL')
+        db.compact_results()
+        db.record_lookup(*self.KEY, 'ABC123', *self._pages(40))
+        self.assertEqual(self._storage(), ['snapshot', 'failed', 'same'])
+
+    def test_history_endpoint(self):
+        """Test the change history API and its since filter"""
+        import time
+        client = app.test_client()
+        query = 'case_type=W.P.(C)&case_number=1234&case_year=2024'
+        self.assertEqual(client.get(f'/api/case/history?{query}').status_code, 404)
+        db.record_lookup(*self.KEY, 'ABC123', *self._pages(3))
+        db.record_lookup(*self.KEY, 'ABC123', *self._pages(4))
+
+        data = client.get(f'/api/case/history?{query}').get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['checks'], len(data['changes'])), (2, 2))
+        self.assertEqual(data['changes'][0]['orders']['added'], ['4 W.P.(C) 1234/2024 04/03/2024'])
+        data = client.get(f'/api/case/history?{query}&since={time.time() + 5}').get_json()
+        self.assertEqual(data['changes'], [])
+        self.assertEqual(client.get(f'/api/case/history?{query}&since=soon').status_code, 400)
+
+class CaseTypeCacheTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for the cached case-type list"""
+    
+
+    def test_parse_case_types(self):
+        """Test that options are read from page source in one pass"""
+        from selenium_worker import parse_case_types
+        html = """<select id="case_type"><option value="">Select</option>
+            <option value="W.P.(C)">W.P.(C) - Writ Petition</option>
+            <option value="CRL.A.">CRL.A.</option></select>"""
+        self.assertEqual(parse_case_types(html), [
+            {'value': 'W.P.(C)', 'text': 'W.P.(C) - Writ Petition'},
+            {'value': 'CRL.A.', 'text': 'CRL.A.'},
+        ])
+
+    def test_cold_cache_fetches_once_and_persists(self):
+        """Test that a cold cache waits for one background fetch and saves it"""
+        from case_types_cache import CaseTypeCache
+        fetch = MagicMock(return_value=[{'value': 'W.P.(C)', 'text': 'W.P.(C)'}])
+        cache = CaseTypeCache(fetch)
+        self.assertEqual(cache.get(), fetch.return_value)
+        self.assertEqual(cache.get(), fetch.return_value)
+        fetch.assert_called_once()
+        self.assertEqual(db.load_case_types()[0], fetch.return_value)
+
+    def test_persisted_list_served_without_fetch(self):
+        """Test that a fresh persisted list is used without touching the browser"""
+        import time
+        from case_types_cache import CaseTypeCache
+        db.save_case_types([{'value': 'CRL.A.', 'text': 'CRL.A.'}], time.time())
+        fetch = MagicMock()
+        cache = CaseTypeCache(fetch)
+        self.assertEqual(cache.get(), [{'value': 'CRL.A.', 'text': 'CRL.A.'}])
+        fetch.assert_not_called()
+
+    def test_stale_list_served_while_revalidating(self):
+        """Test that a stale list is returned immediately and refreshed behind it"""
+        import threading
+        from case_types_cache import CaseTypeCache
+        db.save_case_types([{'value': 'OLD', 'text': 'OLD'}], 0)
+        release = threading.Event()
+
+        def fetch():
+            release.wait(5)
+            return [{'value': 'NEW', 'text': 'NEW'}]
+
+        cache = CaseTypeCache(fetch, ttl=60)
+        self.assertEqual(cache.get(), [{'value': 'OLD', 'text': 'OLD'}])
+        refreshed = cache._refreshing
+        release.set()
+        refreshed.wait(5)
+        self.assertEqual(cache.get()[0]['value'], 'NEW')
+
+class HttpWorkerTestCase(unittest.TestCase):
+    """Test cases for the plain-HTTP backend against the local stub court"""
+    
+    def setUp(self):
+        import http_worker
+        from stub_court import StubCourt
+        self.stub = StubCourt().start()
+        self.addCleanup(self.stub.stop)
+        url = self.stub.base_url + '/app/get-case-type-status'
+        patcher = patch.object(http_worker, 'CASE_STATUS_URL', url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.http_worker = http_worker
+
+    def test_case_types(self):
+        """Test that case types are read from the search page"""
+        case_types = self.http_worker.get_available_case_types()
+        self.assertIn({'value': 'W.P.(C)', 'text': 'W.P.(C)'}, case_types)
+
+    def test_submit_form(self):
+        """Test a lookup with the captcha issued to the same session"""
+        captcha = self.http_worker.get_captcha('alice')
+        timings = {}
+        result_html, orders_html = self.http_worker.submit_form(
+            'W.P.(C)', '1234', '2024', captcha, 'alice', timings=timings)
+        self.assertIn('PENDING', result_html)
+        self.assertIn('RAMESH KUMAR', result_html)
+        self.assertIn('caseTable', orders_html)
+        self.assertEqual(orders_html.count('/app/showlogo/'), 3)
+        self.assertIn('search_wait', timings)
+
+    def test_wrong_captcha(self):
+        """Test that a wrong captcha returns the site's message, not results"""
+        self.http_worker.get_captcha('bob')
+        result_html, orders_html = self.http_worker.submit_form('W.P.(C)', '1234', '2024', 'WRONG', 'bob')
+        self.assertIn('Invalid Captcha', result_html)
+        self.assertEqual(orders_html, '')
+
+    def test_fallback_to_selenium(self):
+        """Test that a failing HTTP search falls back to the browser"""
+        import fetcher
+        self.http_worker.get_captcha('carol')
+        self.stub.sessions.clear()
+        with patch.object(fetcher, 'FETCH_BACKEND', 'http'), \
+                patch('selenium_worker.submit_form', return_value=('<div>ok</div>', '')) as selenium_submit:
+            fetcher._remember('carol', self.http_worker)
+            result = fetcher.submit_form('W.P.(C)', '1234', '2024', 'ABC123', 'carol')
+        self.assertEqual(result, ('<div>ok</div>', ''))
+        self.assertIsNone(selenium_submit.call_args[0][3])
+
+class DownloaderTestCase(unittest.TestCase):
+    """Test cases for the streamed ZIP of order PDFs"""
+    
+    def test_stream_zip(self):
+        """Test that all PDFs end up in a valid archive streamed in pieces"""
+        import io
+        import zipfile
+        from downloader import stream_zip
+        from stub_court import StubCourt
+        with StubCourt(pdf_size=200 * 1024) as stub:
+            urls = [f"{stub.base_url}/app/showlogo/order{i}.pdf" for i in range(8)]
+            urls.append(f"{stub.base_url}/missing")
+            chunks = list(stream_zip(urls, concurrency=3))
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zipf:
+            names = zipf.namelist()
+            self.assertEqual(sorted(names), sorted(f"order{i}.pdf" for i in range(8)))
+            self.assertEqual(len(zipf.read('order0.pdf')), 200 * 1024)
+
+    def test_duplicate_names(self):
+        """Test that orders sharing a filename do not overwrite each other"""
+        import io
+        import zipfile
+        from downloader import stream_zip
+        fetch = lambda url: io.BytesIO(b'%PDF-1.4')
+        data = b''.join(stream_zip(['http://x/a/o.pdf', 'http://x/b/o.pdf'], fetch=fetch))
+        with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+            self.assertEqual(len(zipf.namelist()), 2)
+
+class StubCourtTestCase(unittest.TestCase):
+    """Test cases for the local court stub used by tests and benchmarks"""
+    
+    def test_latency_and_pdf_sizes(self):
+        """Test that latency is applied per request kind and PDF sizes stay stable"""
+        import time
+        import requests
+        from stub_court import StubCourt
+        with StubCourt(pdf_size=(1000, 50000), latency={'pdf': 0.2}) as stub:
+            url = f"{stub.base_url}/app/showlogo/a.pdf"
+            start = time.perf_counter()
+            first = requests.get(url, timeout=5)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+            self.assertEqual(len(first.content), len(requests.get(url, timeout=5).content))
+            self.assertTrue(1000 <= len(first.content) <= 50000)
+            start = time.perf_counter()
+            requests.get(f"{stub.base_url}/app/get-case-type-status", timeout=5)
+            self.assertLess(time.perf_counter() - start, 0.2)
+
+    def test_synthetic_cases(self):
+        """Test that generated cases have distinct orders, newest first"""
+        from datetime import datetime
+        from stub_court import synthetic_cases
+        cases = synthetic_cases(20, orders_per_case=15)
+        self.assertEqual(len(cases), 20)
+        for case in cases.values():
+            dates = [datetime.strptime(d, '%d/%m/%Y') for d in case['orders']]
+            self.assertEqual(len(set(dates)), 15)
+            self.assertEqual(dates, sorted(dates, reverse=True))
+
+class PdfStoreTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for the content-addressed order PDF store"""
+    
+    def setUp(self):
+        import shutil
+        from pdf_store import PdfStore
+        from stub_court import StubCourt
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.stub = StubCourt(pdf_size=4096).start()
+        self.addCleanup(self.stub.stop)
+        self.store = PdfStore(root=self.root, max_bytes=3 * 4096)
+
+    def url(self, name):
+        return f"{self.stub.base_url}/app/showlogo/{name}"
+
+    def test_hit_after_first_download(self):
+        """Test that a stored PDF is served without going to the network"""
+        with self.store.fetch(self.url('a.pdf')) as f:
+            first = f.read()
+        with self.store.fetch(self.url('a.pdf')) as f:
+            self.assertEqual(f.read(), first)
+        stats = self.store.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['bytes_saved'], 4096)
+        self.assertEqual(self.stub.hits['/app/showlogo/a.pdf'], 1)
+
+    def test_identical_files_deduplicated(self):
+        """Test that the same content under two URLs is stored once"""
+        with patch.object(self.stub, 'pdf_body', return_value=b'%PDF-1.4 same'):
+            self.store.fetch(self.url('a.pdf')).close()
+            self.store.fetch(self.url('b.pdf')).close()
+        stats = self.store.stats()
+        self.assertEqual(stats['blobs'], 1)
+        self.assertEqual(stats['dedup'], 1)
+
+    def test_revalidation_and_lru_eviction(self):
+        """Test conditional revalidation and that the size cap evicts old blobs"""
+        self.store.revalidate_after = 0
+        for name in ('a.pdf', 'b.pdf', 'c.pdf', 'a.pdf', 'd.pdf'):
+            self.store.fetch(self.url(name)).close()
+        stats = self.store.stats()
+        self.assertEqual(stats['revalidated'], 1)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertIsNone(db.get_pdf_url(self.url('b.pdf')))
+        self.assertEqual(stats['blobs'], 3)
+
+    def test_download_by_request_id(self):
+        """Test that the result page carries only a request id and the ZIP is built from stored orders"""
+        import io
+        import re
+        import zipfile
+        import app as app_module
+        key = ('W.P.(C)', '1234', '2024')
+        app_module.result_cache.invalidate(key)
+        result_html = '<div class="table-responsive"><table>' + self.stub.render_result(key) + '</table></div>'
+        client = app.test_client()
+        form = dict(zip(('case_type', 'case_number', 'case_year'), key), captcha_entered='ABC123')
+        with patch('app.submit_form', return_value=(result_html, self.stub.render_orders(key))), \
+                patch('app.COURT_BASE_URL', self.stub.base_url):
+            page = client.post('/submit', data=form).get_data(as_text=True)
+        self.assertNotIn('<textarea name="orders_html">', page)
+        request_id = re.search(r'name="request_id" value="(\d+)"', page).group(1)
+
+        with patch('app.pdf_store.store', self.store):
+            response = client.post('/download-all-orders', data={'request_id': request_id})
+            self.assertEqual(response.mimetype, 'application/zip')
+            with zipfile.ZipFile(io.BytesIO(response.get_data())) as zipf:
+                self.assertEqual(len(zipf.namelist()), 3)
+            legacy = client.post('/download-all-orders', data={'orders_html': '<a href="x.pdf">'})
+            self.assertEqual(legacy.status_code, 400)
+            self.assertEqual(client.post('/download-all-orders', data={'request_id': '999999'}).status_code, 404)
+
+class ResultCacheTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for the read-through result cache"""
+    
+    PENDING = ('<div class="table-responsive"><table><tr><td>1</td><td>W.P.(C) - 1234 / 2024 [PENDING]</td>'
+               '<td>A VS. B</td><td>NEXT DATE: NA</td></tr></table></div>')
+    DISPOSED = ('<div class="table-responsive"><table><tr><td>1</td><td>CRL.A. - 77 / 2023 [DISPOSED]</td>'
+                '<td>A VS. B</td><td>NEXT DATE: NA</td></tr></table></div>')
+
+
+    def test_freshness_depends_on_status(self):
+        """Test that disposed cases stay fresh longer than pending ones"""
+        import time
+        from result_cache import ResultCache
+        cache = ResultCache(ttl_disposed=3600, ttl_pending=60)
+        cache.put(('W.P.(C)', '1234', '2024'), self.PENDING, '', fetched_at=time.time() - 120)
+        cache.put(('CRL.A.', '77', '2023'), self.DISPOSED, '', fetched_at=time.time() - 120)
+        self.assertIsNone(cache.get(('W.P.(C)', '1234', '2024')))
+        self.assertIsNotNone(cache.get(('CRL.A.', '77', '2023')))
+
+    def test_errors_not_cached(self):
+        """Test that failed scrapes are never served from cache"""
+        from result_cache import ResultCache
+        from selenium_worker import error_html
+        cache = ResultCache()
+        cache.put(('W.P.(C)', '1234', '2024'), error_html('Timeout 1234'), '')
+        self.assertIsNone(cache.get(('W.P.(C)', '1234', '2024')))
+
+    def test_failed_lookup_does_not_hide_stored_result(self):
+        """Test that the newest good stored result is served after a later scrape failed"""
+        from result_cache import ResultCache
+        from selenium_worker import error_html
+        key = ('W.P.(C)', '1234', '2024')
+        db.record_lookup(*key, 'ABC123', self.PENDING, '')
+        db.record_lookup(*key, 'ABC123', error_html('Timeout waiting for element'), '')
+        cache = ResultCache()
+        self.assertEqual(cache.get_stale(key)[0], self.PENDING)
+        self.assertEqual(cache.get(key)[0], self.PENDING)
+        with patch.object(db, 'RESULT_STORAGE', 'full'):
+            db.record_lookup(*key, 'ABC123', error_html('Timeout waiting for element'), '')
+        db.get_connection().execute('UPDATE results SET storage = NULL')
+        self.assertEqual(db.latest_result(*key)[0], self.PENDING)
+
+    def test_not_found_page_not_cached(self):
+        """Test that a case number appearing elsewhere in an empty result table doesn't count as found"""
+        from batch import lookup_status
+        from result_cache import is_cacheable
+        empty = '<table><tr><td colspan="4">No data available in table</td></tr></table>'
+        self.assertFalse(is_cacheable('4', empty, ''))
+        self.assertEqual(lookup_status('4', empty, ''), 'not_found')
+        self.assertFalse(is_cacheable('23', self.DISPOSED, ''))
+        self.assertTrue(is_cacheable('77', self.DISPOSED, ''))
+
+    def test_repeat_submit_served_from_cache(self):
+        """Test that a repeat lookup skips the scraper, and force_refresh does not"""
+        import app as app_module
+        app_module.result_cache._entries.clear()
+        client = app.test_client()
+        form = {'case_type': 'W.P.(C)', 'case_number': '1234', 'case_year': '2024', 'captcha_entered': 'ABC123'}
+        with patch('app.submit_form', return_value=(self.PENDING, '<table id="caseTable"></table>')) as scrape:
+            self.assertEqual(client.post('/submit', data=form).status_code, 200)
+            app_module.result_cache._entries.clear()
+            response = client.post('/submit', data=form)
+            self.assertIn(b'recently fetched', response.data)
+            self.assertEqual(scrape.call_count, 1)
+            client.post('/submit', data=dict(form, force_refresh='1'))
+            self.assertEqual(scrape.call_count, 2)
+
+class DatabaseSchemaTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for the SQLite schema, connection reuse and compression"""
+
+    LPA = '<table><tr><td>1</td><td>LPA - 5 / 2022</td><td>A VS. B</td><td>NEXT DATE: NA</td></tr></table>'
+
+    def test_indexes_and_wal(self):
+        """Test that the lookup index exists and WAL is enabled"""
+        conn = db.get_connection()
+        indexes = [row[1] for row in conn.execute("SELECT * FROM sqlite_master WHERE type='index'")]
+        self.assertIn('idx_requests_case', indexes)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertIs(db.get_connection(), conn)
+
+    def test_record_lookup_compresses_html(self):
+        """Test that results are stored compressed and read back as text"""
+        html = ('<div class="table-responsive"><table>'
+                + '<tr><td>1</td><td>W.P.(C) - 1234 / 2024</td><td>A VS. B</td><td>NEXT DATE: NA</td></tr>' * 50
+                + '</table></div>')
+        db.record_lookup('W.P.(C)', '1234', '2024', 'ABC123', html, '<table id="caseTable"></table>')
+        raw = db.get_connection().execute('SELECT result_html FROM results').fetchone()[0]
+        self.assertIsInstance(raw, bytes)
+        self.assertLess(len(raw), len(html))
+        self.assertEqual(db.latest_result('W.P.(C)', '1234', '2024')[0], html)
+
+    def test_migrates_old_database(self):
+        """Test that a database from before this schema is upgraded in place"""
+        import sqlite3
+        db.close_connection()
+        os.unlink(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE requests (id INTEGER PRIMARY KEY AUTOINCREMENT, case_type TEXT,
+                        case_number TEXT, case_year TEXT, captcha_entered TEXT,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute('CREATE TABLE results (id INTEGER PRIMARY KEY AUTOINCREMENT, request_id INTEGER, result_html TEXT)')
+        conn.execute("INSERT INTO requests (case_type, case_number, case_year) VALUES ('LPA', '5', '2022')")
+        conn.execute("INSERT INTO results (request_id, result_html) VALUES (1, ?)", (self.LPA,))
+        conn.commit()
+        conn.close()
+
+        db.init_db()
+        conn = db.get_connection()
+        self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], db.SCHEMA_VERSION)
+        self.assertEqual(db.latest_result('LPA', '5', '2022')[:2], (self.LPA, None))
+
+class CaseParserTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for parsing results into the cases and orders tables"""
+
+    KEY = ('W.P.(C)', '1234', '2024')
+
+    def setUp(self):
+        from stub_court import StubCourt
+        super().setUp()
+        stub = StubCourt()
+        stub.server.server_close()
+        self.result_html = f'<div class="table-responsive"><table>{stub.render_result(self.KEY)}</table></div>'
+        self.orders_html = stub.render_orders(self.KEY)
+
+    def test_parsers_agree(self):
+        """Test that the lxml and html.parser paths produce the same records"""
+        import case_parser
+        record = case_parser.parse_result(self.result_html, 'https://court.test/app/')
+        self.assertEqual(record['status'], 'PENDING')
+        self.assertEqual((record['petitioner'], record['respondent']), ('RAMESH KUMAR', 'UNION OF INDIA & ORS.'))
+        self.assertEqual(record['next_hearing_date'], '2024-03-15')
+        self.assertEqual(record['orders_url'], 'https://court.test/app/case-orders/WPC-1234-2024')
+        orders = case_parser.parse_orders(self.orders_html)
+        self.assertEqual([order['order_date'] for order in orders], ['2024-02-12', '2024-01-20', '2024-01-05'])
+        self.assertEqual(case_parser.parse_result(self.result_html, 'https://court.test/app/', 'html.parser'), record)
+        self.assertEqual(case_parser.parse_orders(self.orders_html, parser='html.parser'), orders)
+
+    def test_case_api_reads_stored_records(self):
+        """Test that a fresh lookup is stored and served by /api/case"""
+        import app as app_module
+        app_module.result_cache._entries.clear()
+        client = app.test_client()
+        form = {'case_type': 'W.P.(C)', 'case_number': '1234', 'case_year': '2024', 'captcha_entered': 'ABC123'}
+        with patch('app.submit_form', return_value=(self.result_html, self.orders_html)):
+            client.post('/submit', data=form)
+        response = client.get('/api/case', query_string={'case_type': 'W.P.(C)', 'case_number': '1234',
+                                                         'case_year': '2024'})
+        data = response.get_json()
+        self.assertEqual(data['case']['court_no'], '12')
+        self.assertEqual(len(data['orders']), 3)
+        self.assertTrue(data['orders'][0]['url'].startswith('http'))
+        self.assertEqual(client.get('/api/case?case_type=LPA&case_number=1&case_year=2020').status_code, 404)
+
+class OrdersApiTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for the paginated orders API"""
+    
+    KEY = ('W.P.(C)', '1234', '2024')
+
+    def setUp(self):
+        super().setUp()
+        orders = [{'title': f"Order {i}", 'url': f"https://example.com/{i}.pdf", 'filename': f"{i}.pdf",
+                   'order_date': f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}" if i < 25 else None} for i in range(30)]
+        db.save_case(*self.KEY, {'status': 'PENDING'}, orders, 0)
+        self.client = app.test_client()
+        self.query = dict(zip(('case_type', 'case_number', 'case_year'), self.KEY))
+
+    def get(self, **params):
+        return self.client.get('/api/case/orders', query_string=dict(self.query, **params))
+
+    def test_cursor_pagination(self):
+        """Test that following next_cursor returns every order once, newest first, undated last"""
+        seen, cursor = [], None
+        while True:
+            data = self.get(limit=7, **({'cursor': cursor} if cursor else {})).get_json()
+            self.assertEqual(data['total'], 30)
+            self.assertLessEqual(len(data['orders']), 7)
+            seen.extend(data['orders'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(len({order['url'] for order in seen}), 30)
+        dates = [order['order_date'] for order in seen]
+        self.assertEqual(dates[:25], sorted(dates[:25], reverse=True))
+        self.assertEqual(dates[25:], [None] * 5)
+
+    def test_filters_and_fields(self):
+        """Test date-range filters, field selection and bad parameters"""
+        data = self.get(**{'from': '2024-03-01', 'to': '2024-04-30', 'fields': 'url,order_date'}).get_json()
+        self.assertTrue(data['orders'])
+        self.assertEqual(data['total'], len(data['orders']))
+        for order in data['orders']:
+            self.assertEqual(set(order), {'url', 'order_date'})
+            self.assertTrue('2024-03-01' <= order['order_date'] <= '2024-04-30')
+        self.assertEqual(self.get(fields='url,secret').status_code, 400)
+        self.assertEqual(self.get(**{'from': '03/2024'}).status_code, 400)
+        self.assertEqual(self.get(cursor='bogus').status_code, 400)
+        import app as app_module
+        for after in ([None, None], [{}, 1], ['2024-03-01'], ['2024-03-01', 'x'], {'id': 1}, 5):
+            self.assertEqual(self.get(cursor=app_module.encode_cursor(after)).status_code, 400, after)
+        self.assertEqual(self.client.get('/api/case/orders?case_type=LPA&case_number=1&case_year=2020').status_code,
+                         404)
+
+    def test_result_page_renders_first_page(self):
+        """Test that the result page shows the first page of stored orders and a cursor for the rest"""
+        import app as app_module
+        app_module.result_cache.invalidate(self.KEY)
+        result_html = ('<div class="table-responsive"><table><tr><td>1</td><td>W.P.(C) - 1234 / 2024 [PENDING]</td>'
+                       '<td>A VS. B</td><td>NEXT DATE: NA</td></tr></table></div>')
+        with patch('app.submit_form', return_value=(result_html, '<table id="caseTable"></table>')), \
+                patch('app.store_case_records'):
+            page = self.client.post('/submit', data=dict(self.query, captcha_entered='ABC123')).get_data(as_text=True)
+        self.assertIn(f"{min(app_module.ORDERS_PAGE_SIZE, 30)} of 30 orders", page)
+        self.assertNotIn('id="caseTable"', page)
+
+class JobQueueTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for the background lookup queue"""
+
+    def wait_for(self, job_id, timeout=5):
+        import time
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = db.get_job(job_id)
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep(0.02)
+        self.fail(f"job {job_id} did not finish")
+
+    def test_jobs_run_and_report_stats(self):
+        """Test that queued jobs run on the workers and failures are recorded"""
+        from jobs import JobQueue
+        def handler(job):
+            if job['case_number'] == 'bad':
+                raise RuntimeError('browser crashed')
+            return '<div>result</div>', '<table></table>', False, {'search_wait': 0.1}
+        queue = JobQueue(handler, workers=2).start()
+        self.addCleanup(queue.close)
+        ok = queue.submit('W.P.(C)', '1234', '2024', 'ABC123', 'alice')
+        bad = queue.submit('W.P.(C)', 'bad', '2024', 'ABC123', 'alice')
+        self.assertEqual(self.wait_for(ok)['result_html'], '<div>result</div>')
+        self.assertEqual(self.wait_for(bad)['error'], 'browser crashed')
+        stats = queue.stats()
+        self.assertEqual((stats['done'], stats['failed'], stats['queued'], stats['workers']), (1, 1, 0, 2))
+        self.assertEqual(stats['started_recently'], 2)
+
+    def test_restart_recovers_queued_jobs(self):
+        """Test that jobs queued or interrupted before a restart are run on start"""
+        import time
+        from jobs import JobQueue
+        db.create_job('queued1', 'LPA', '5', '2022', 'ABC123', 'alice', False, None, time.time())
+        db.create_job('running1', 'LPA', '6', '2022', 'XYZ789', 'bob', False, None, time.time())
+        db.claim_job('running1', time.time() - 3600)
+        seen = []
+        def handler(job):
+            seen.append((job['id'], job['captcha_entered']))
+            return '', '', False, {}
+        queue = JobQueue(handler, workers=1).start()
+        self.addCleanup(queue.close)
+        self.wait_for('queued1')
+        self.wait_for('running1')
+        self.assertEqual(sorted(seen), [('queued1', 'ABC123'), ('running1', None)])
+
+    def test_webhook_delivery(self):
+        """Test that a finished job is posted to its callback URL"""
+        import threading
+        from jobs import JobQueue
+        delivered = threading.Event()
+        queue = JobQueue(lambda job: ('<div>r</div>', '', True, {}), workers=1).start()
+        self.addCleanup(queue.close)
+        public = [(None, None, None, '', ('93.184.216.34', 80))]
+        with patch('jobs.requests.post', side_effect=lambda *a, **kw: delivered.set() or MagicMock()) as post, \
+                patch('jobs.socket.getaddrinfo', return_value=public):
+            job_id = queue.submit('LPA', '5', '2022', callback_url='http://client.test/hook')
+            self.assertTrue(delivered.wait(5))
+        self.assertEqual(post.call_args[0][0], 'http://client.test/hook')
+        self.assertEqual(post.call_args[1]['json']['job_id'], job_id)
+        self.assertTrue(post.call_args[1]['json']['cached'])
+        self.assertFalse(post.call_args[1]['allow_redirects'])
+
+    def test_callback_url_must_be_public(self):
+        """Test that callbacks to internal addresses or other schemes are refused"""
+        client = app.test_client()
+        form = {'case_type': 'LPA', 'case_number': '5', 'case_year': '2022'}
+        for url in ('http://127.0.0.1:8080/admin', 'http://169.254.169.254/latest/meta-data/',
+                    'http://[::1]/', 'http://10.0.0.5/hook', 'file:///etc/passwd', 'gopher://client.test/'):
+            response = client.post('/jobs', json=dict(form, callback_url=url))
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('callback_url', response.get_json()['error'])
+        with patch('jobs.CALLBACK_ALLOWED_HOSTS', {'hooks.internal'}):
+            from jobs import check_callback_url
+            check_callback_url('https://hooks.internal/case')
+            with self.assertRaises(ValueError):
+                check_callback_url('https://client.test/case')
+
+    def test_job_endpoints(self):
+        """Test that /jobs returns at once and the result is served once done"""
+        import app as app_module
+        app_module.result_cache._entries.clear()
+        client = app.test_client()
+        form = {'case_type': 'W.P.(C)', 'case_number': '1234', 'case_year': '2024', 'captcha_entered': 'ABC123'}
+        with patch('app.submit_form', return_value=('<div>W.P.(C) 1234/2024</div>', '')):
+            response = client.post('/jobs', data=form)
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()['job_id']
+            self.wait_for(job_id)
+        status = client.get(f"/jobs/{job_id}").get_json()
+        self.assertEqual(status['status'], 'done')
+        self.assertIn('1234/2024', status['result_html'])
+        self.assertIn(b'1234/2024', client.get(f"/jobs/{job_id}/result").data)
+        self.assertEqual(client.get('/jobs/missing').status_code, 404)
+        self.assertEqual(client.post('/jobs', data={'case_type': 'LPA'}).status_code, 400)
+        self.assertIn('queued', client.get('/jobs/stats').get_json())
+
+    def test_unchanged_job_polls_to_304(self):
+        """Test that polling a job that hasn't moved revalidates to 304"""
+        import time
+        client = app.test_client()
+        # Starts this process's job workers first, so they don't pick up the job below
+        client.get('/jobs/stats')
+        db.create_job('waiting1', 'LPA', '5', '2022', 'ABC123', 'alice', False, None, time.time() - 5)
+        first = client.get('/jobs/waiting1')
+        self.assertIsNone(first.get_json()['wait_time'])
+        time.sleep(0.01)
+        again = client.get('/jobs/waiting1', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_jobs_run_in_forked_worker(self):
+        """Test that a worker forked after import, as with gunicorn's preload_app, runs the jobs it is sent"""
+        import signal
+        import time
+        db.get_connection()
+        form = {'case_type': 'W.P.(C)', 'case_number': '1234', 'case_year': '2024', 'captcha_entered': 'ABC123'}
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                with patch('app.submit_form', return_value=(ResultCacheTestCase.PENDING, '')):
+                    job_id = app.test_client().post('/jobs', data={**form, 'force_refresh': '1'}).get_json()['job_id']
+                    code = 0 if self.wait_for(job_id)['status'] == 'done' else 1
+            finally:
+                os._exit(code)
+        deadline = time.time() + 15
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                break
+            if time.time() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                self.fail('forked worker hung')
+            time.sleep(0.05)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+class BatchTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for batch status checks"""
+
+    @staticmethod
+    def fake_submit(case_type, case_number, case_year, captcha_input, session_key=None, timings=None):
+        if case_number == 'boom':
+            raise RuntimeError('browser crashed')
+        if case_number == '404':
+            return '<div class="table-responsive">No record found</div>', ''
+        row = (f'<tr><td>1</td><td>{case_type} - {case_number} / {case_year}<br>[PENDING]</td>'
+               '<td>A<br>VS.<br>B</td><td>NEXT DATE: 01/02/2025</td></tr>')
+        return f'<div class="table-responsive"><table>{row}</table></div>', '<table id="caseTable"></table>'
+
+    def setUp(self):
+        import result_cache
+        super().setUp()
+        result_cache.cache._entries.clear()
+
+    def test_parse_cases(self):
+        """Test that CSV with a header and JSON objects are both accepted"""
+        from batch import parse_cases
+        csv_text = 'case_type,case_number,case_year\nW.P.(C), 1234 ,2024\n\nLPA,5,2022\n'
+        self.assertEqual(parse_cases(csv_text), [('W.P.(C)', '1234', '2024'), ('LPA', '5', '2022')])
+        json_text = '[{"case_type": "LPA", "case_number": 5, "case_year": 2022}]'
+        self.assertEqual(parse_cases(json_text), [('LPA', '5', '2022')])
+        with self.assertRaises(ValueError):
+            parse_cases('LPA,5')
+        for bad in ('[5, 6]', '["abc"]', '{"cases": 5}'):
+            with self.assertRaises(ValueError):
+                parse_cases(bad)
+        response = app.test_client().post('/batch', data='[5, 6]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_run_batch(self):
+        """Test progress events, cache reuse, bulk writes and the summary"""
+        from batch import run_batch
+        cases = [('W.P.(C)', '1234', '2024'), ('LPA', '404', '2022'), ('LPA', 'boom', '2022'),
+                 ('W.P.(C)', '1234', '2024'), ('CRL.A.', '77', '2023')]
+        with patch('batch.submit_form', side_effect=self.fake_submit) as scrape:
+            events = list(run_batch(cases, concurrency=2, flush_size=2))
+            self.assertEqual(scrape.call_count, 4)
+            # A second run is served from the cache
+            rerun = list(run_batch(cases[:1]))
+            self.assertEqual(scrape.call_count, 4)
+        summary = events[-1]
+        self.assertEqual(summary['event'], 'summary')
+        self.assertEqual((summary['total'], summary['duplicates']), (4, 1))
+        self.assertEqual((summary['ok'], summary['not_found'], summary['error']), (2, 1, 1))
+        self.assertGreater(summary['cases_per_minute'], 0)
+        by_number = {event['case_number']: event for event in events[:-1]}
+        self.assertEqual(by_number['boom']['error'], 'browser crashed')
+        self.assertEqual(by_number['1234']['case']['next_hearing_date'], '2025-02-01')
+        self.assertTrue(rerun[0]['cached'])
+        self.assertEqual(db.get_connection().execute('SELECT COUNT(*) FROM requests').fetchone()[0], 4)
+        self.assertIsNotNone(db.get_case('CRL.A.', '77', '2023'))
+
+    def test_batch_endpoint_streams_ndjson(self):
+        """Test that /batch streams one JSON line per case plus a summary"""
+        import json
+        client = app.test_client()
+        with patch('batch.submit_form', side_effect=self.fake_submit):
+            response = client.post('/batch', data='LPA,5,2022\nLPA,6,2022\n', content_type='text/csv')
+            lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([line['event'] for line in lines], ['case', 'case', 'summary'])
+        self.assertEqual(client.post('/batch', data='').status_code, 400)
+
+class TrackerTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for tracked cases and incremental order sync"""
+
+    KEY = ('W.P.(C)', '1234', '2024')
+
+    def setUp(self):
+        from stub_court import StubCourt
+        super().setUp()
+        self.stub = StubCourt().start()
+        self.addCleanup(self.stub.stop)
+        patcher = patch('tracker.COURT_BASE_URL', self.stub.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = MagicMock()
+        patcher = patch('tracker.pdf_store.store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def seed(self):
+        db.save_case(*self.KEY, {'orders_url': f"{self.stub.base_url}/app/case-orders/WPC-1234-2024"}, [], 0)
+        return db.track_case(*self.KEY, 0)
+
+    def test_only_new_orders_are_fetched(self):
+        """Test that a re-check stores and downloads just the orders added since the last one"""
+        import json
+        import tracker
+        self.seed()
+        self.assertEqual(tracker.sync_due()['new_orders'], 0)
+        self.assertEqual(len(db.get_orders(db.get_case(*self.KEY)['id'])), 3)
+
+        self.stub.cases[self.KEY]['orders'].insert(0, '01/03/2024')
+        summary = tracker.sync_due(now=float('inf'))
+        self.assertEqual((summary['checked'], summary['new_orders'], summary['errors']), (1, 1, 0))
+        orders = db.get_orders(db.get_case(*self.KEY)['id'])
+        self.assertEqual([order['order_date'] for order in orders][:2], ['2024-03-01', '2024-02-12'])
+        self.store.fetch.assert_called_once_with(orders[0]['url'])
+        events = db.case_events()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(json.loads(events[0]['payload'])['orders'][0]['order_date'], '2024-03-01')
+        # No searches were needed, only the Orders page
+        self.assertNotIn('/app/get-case-type-status', self.stub.hits)
+
+    def test_failed_first_check_is_not_the_baseline(self):
+        """Test that orders found by the first successful check after a failed one are not reported as new"""
+        import tracker
+        self.seed()
+        with patch('tracker.fetch_orders', side_effect=RuntimeError('Timeout')):
+            self.assertEqual(tracker.sync_due()['errors'], 1)
+        tracked = db.tracked_cases()[0]
+        self.assertIsNone(tracked['last_checked_at'])
+        self.assertEqual(tracked['last_error'], 'Timeout')
+
+        self.assertEqual(tracker.sync_due(now=float('inf'))['new_orders'], 0)
+        self.assertEqual(len(db.get_orders(db.get_case(*self.KEY)['id'])), 3)
+        self.store.fetch.assert_not_called()
+        self.assertEqual(db.case_events(), [])
+
+    def test_search_when_no_orders_url(self):
+        """Test that a case never looked up is searched once to find its Orders page"""
+        import tracker
+        db.track_case(*self.KEY, 0)
+        result_html = ('<div class="table-responsive"><table>' + self.stub.render_result(self.KEY)
+                       + '</table></div>')
+        with patch('tracker.submit_form', return_value=(result_html, self.stub.render_orders(self.KEY))) as scrape:
+            summary = tracker.sync_due()
+        self.assertEqual((summary['checked'], summary['errors']), (1, 0))
+        self.assertIsNone(scrape.call_args[0][3])
+        self.assertEqual(db.get_case(*self.KEY)['status'], 'PENDING')
+        self.assertIsNone(db.tracked_cases()[0]['last_error'])
+
+    def test_tracked_endpoints(self):
+        """Test adding, listing, events and removing tracked cases"""
+        client = app.test_client()
+        response = client.post('/tracked', json=dict(zip(('case_type', 'case_number', 'case_year'), self.KEY)))
+        self.assertEqual(response.status_code, 201)
+        tracking_id = response.get_json()['id']
+        self.assertEqual(client.get('/tracked').get_json()['tracked'][0]['id'], tracking_id)
+        db.add_case_event(*self.KEY, 'new_orders', '{"orders": []}', 0)
+        events = client.get('/tracked/events?since=0').get_json()['events']
+        self.assertEqual(events[0]['orders'], [])
+        self.assertEqual(client.delete(f"/tracked/{tracking_id}").status_code, 200)
+        self.assertEqual(client.delete(f"/tracked/{tracking_id}").status_code, 404)
+
+    def test_sync_endpoint_without_scheduler(self):
+        """Test that /tracked/sync checks once and leaves no poller behind when the scheduler is off"""
+        import threading
+        import tracker
+        scheduler = tracker.Scheduler()
+        synced = threading.Event()
+        with patch('tracker.scheduler', scheduler), patch('tracker.TRACK_SCHEDULER', False), \
+                patch('tracker.sync_due', side_effect=lambda: synced.set() or {'checked': 0}):
+            self.assertEqual(app.test_client().post('/tracked/sync').status_code, 202)
+            self.assertTrue(synced.wait(5))
+            scheduler._once.join(5)
+        self.assertIsNone(scheduler._thread)
+        self.assertEqual(scheduler.last_summary, {'checked': 0})
+
+    def test_events_limit_is_bounded(self):
+        """Test that a non-positive limit can't lift the cap on returned events"""
+        for _ in range(3):
+            db.add_case_event(*self.KEY, 'new_orders', '{"orders": []}', 0)
+        client = app.test_client()
+        self.assertEqual(len(client.get('/tracked/events?limit=-1').get_json()['events']), 1)
+        self.assertEqual(len(client.get('/tracked/events?limit=2').get_json()['events']), 2)
+
+class MetricsTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for request timing and the /metrics endpoint"""
+    
+    def test_histogram_exposition(self):
+        """Test that histograms render cumulative buckets, sum and count"""
+        import metrics
+        histogram = metrics.Histogram('test_seconds', 'Test histogram', ('phase',), buckets=(0.1, 1))
+        metrics.registry.remove(histogram)
+        histogram.observe(0.05, phase='a')
+        histogram.observe(0.5, phase='a')
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{phase="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{phase="a",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{phase="a",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_count{phase="a"} 2', lines)
+        with self.assertRaises(ValueError):
+            histogram.observe(1, backend='a')
+
+    def test_span_records_everywhere(self):
+        """Test that a span fills the timings dict, the request breakdown and the histogram"""
+        import metrics
+        before = metrics.PHASE_SECONDS.count(backend='app', phase='test_phase')
+        timings = {}
+        metrics.begin_request()
+        with metrics.span('test_phase', timings):
+            pass
+        breakdown = metrics.end_request()
+        self.assertIn('test_phase', timings)
+        self.assertIn('test_phase', breakdown)
+        self.assertEqual(metrics.PHASE_SECONDS.count(backend='app', phase='test_phase'), before + 1)
+        self.assertRegex(metrics.server_timing(breakdown, 0.5), r'^test_phase;dur=[\d.]+, total;dur=500\.0$')
+
+    def test_submit_server_timing_and_metrics(self):
+        """Test that /submit reports its phases and /metrics exposes them"""
+        import app as app_module
+        app_module.result_cache._entries.clear()
+        client = app.test_client()
+        form = {'case_type': 'W.P.(C)', 'case_number': '1234', 'case_year': '2024', 'captcha_entered': 'ABC123'}
+        result_html = ('<div class="table-responsive"><table><tr><td>1</td><td>W.P.(C) - 1234 / 2024 [PENDING]</td>'
+                       '<td>A VS. B</td><td>NEXT DATE: NA</td></tr></table></div>')
+        with patch('app.submit_form', return_value=(result_html, '<table id="caseTable"></table>')):
+            response = client.post('/submit', data=form)
+        timing = response.headers['Server-Timing']
+        for phase in ('cache_lookup', 'record_parse', 'db_write', 'total'):
+            self.assertIn(phase + ';dur=', timing)
+
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="POST",endpoint="/submit",status="200"}', text)
+        self.assertIn('lookup_phase_seconds_count{backend="app",phase="db_write"}', text)
+        self.assertIn('result_cache_lookups_total{result="miss"}', text)
+        self.assertIn('browser_pool_sessions{state="capacity"}', text)
+
+class HttpCacheTestCase(TempDatabaseMixin, unittest.TestCase):
+    """Test cases for ETags, Cache-Control and compression"""
+
+    def setUp(self):
+        super().setUp()
+        orders = [{'title': f"Order {i}", 'url': f"https://example.com/{i}.pdf", 'filename': f"{i}.pdf",
+                   'order_date': f"2024-01-{i + 1:02d}"} for i in range(20)]
+        db.save_case('W.P.(C)', '1234', '2024', {'status': 'DISPOSED'}, orders, 0)
+        db.save_case('LPA', '5', '2023', {'status': 'PENDING'}, orders[:1], 0)
+        self.client = app.test_client()
+
+    def test_gzip_and_conditional_get(self):
+        """Test that JSON is gzipped when accepted and an unchanged response comes back as an empty 304"""
+        import gzip
+        import json
+        url = '/api/case?case_type=W.P.(C)&case_number=1234&case_year=2024'
+        plain = self.client.get(url)
+        self.assertIsNone(plain.headers.get('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.get_data())), plain.get_json())
+        self.assertEqual(response.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+
+        for etag in (plain.headers['ETag'], response.headers['ETag']):
+            cached = self.client.get(url, headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.get_data(), b'')
+
+    def test_cache_control(self):
+        """Test max-age for disposed cases, revalidation for pending ones and immutable versioned static files"""
+        import re
+        import http_cache
+        disposed = self.client.get('/api/case?case_type=W.P.(C)&case_number=1234&case_year=2024')
+        self.assertEqual(disposed.cache_control.max_age, http_cache.DISPOSED_MAX_AGE)
+        self.assertTrue(disposed.cache_control.private)
+        pending = self.client.get('/api/case?case_type=LPA&case_number=5&case_year=2023')
+        self.assertIsNone(pending.cache_control.max_age)
+        self.assertTrue(pending.cache_control.no_cache)
+
+        page = self.client.get('/').get_data(as_text=True)
+        url = re.search(r'href="(/static/index\.css\?v=\w+)"', page).group(1)
+        response = self.client.get(url)
+        self.assertEqual(response.cache_control.max_age, http_cache.STATIC_MAX_AGE)
+        self.assertTrue(response.cache_control.immutable)
+        response.close()
+        response = self.client.get('/static/index.css')
+        self.assertTrue(response.cache_control.no_cache)
+        response.close()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,202 @@
+"""Tracked cases with incremental order sync.
+
+A tracked case is re-checked every TRACK_INTERVAL seconds. A check reads
+the case's Orders page directly from the stored orders URL, which needs no
+captcha or browser. Only orders that were not seen before are stored and
+their PDFs downloaded, and a ``new_orders`` event is recorded (and posted
+to TRACK_WEBHOOK_URL if set). A full search is run only for cases that
+have no usable orders URL yet. Run due checks from cron with:
+
+    python tracker.py sync
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import threading
+import time
+
+import requests
+
+import db
+import outbound
+import pdf_store
+from batch import lookup_status
+from case_parser import parse_result, parse_orders
+from fetcher import submit_form
+from http_worker import new_session, HTTP_TIMEOUT
+from jobs import deliver
+from selenium_worker import CASE_STATUS_URL, COURT_BASE_URL, extract_orders_table
+
+TRACK_INTERVAL = float(os.environ.get('TRACK_INTERVAL', str(24 * 3600)))
+TRACK_RETRY_INTERVAL = float(os.environ.get('TRACK_RETRY_INTERVAL', '3600'))
+TRACK_CONCURRENCY = int(os.environ.get('TRACK_CONCURRENCY', '4'))
+TRACK_PREFETCH_PDFS = os.environ.get('TRACK_PREFETCH_PDFS', '1') == '1'
+TRACK_WEBHOOK_URL = os.environ.get('TRACK_WEBHOOK_URL')
+# TRACK_SCHEDULER=1 runs due checks inside the web app, polling every TRACK_POLL_INTERVAL seconds
+TRACK_SCHEDULER = os.environ.get('TRACK_SCHEDULER', '0') == '1'
+TRACK_POLL_INTERVAL = float(os.environ.get('TRACK_POLL_INTERVAL', '60'))
+
+_local = threading.local()
+
+
+def _session():
+    # requests sessions are not shared between threads
+    if getattr(_local, 'session', None) is None:
+        _local.session = new_session()
+    return _local.session
+
+
+def fetch_orders(orders_url):
+    """The caseTable HTML at orders_url, or None if it could not be read"""
+    try:
+        with outbound.scheduler.request(orders_url) as call:
+            response = _session().get(orders_url, timeout=HTTP_TIMEOUT)
+            outbound.response(call, response)
+        response.raise_for_status()
+    except (requests.RequestException, outbound.RateLimited) as e:
+        print(f"Error fetching orders from {orders_url}: {str(e)}")
+        return None
+    orders_html = extract_orders_table(response.text)
+    return None if 'scrape-error' in orders_html else orders_html
+
+
+def search(case_type, case_number, case_year):
+    """Full lookup for a case with no usable orders URL; returns (record, orders_html)"""
+    session_key = f"tracker-{threading.current_thread().name}"
+    result_html, orders_html = submit_form(case_type, case_number, case_year, None, session_key)
+    status = lookup_status(case_number, result_html, orders_html)
+    if status != 'ok':
+        raise RuntimeError(f"Search for {case_type} {case_number}/{case_year} failed: {status}")
+    return parse_result(result_html, CASE_STATUS_URL), orders_html
+
+
+def sync_case(tracked, now=None):
+    """Check one tracked case and store only new orders; returns the list of new orders"""
+    now = now or time.time()
+    key = (tracked['case_type'], tracked['case_number'], tracked['case_year'])
+    record = db.get_case(*key)
+    orders_html = fetch_orders(record['orders_url']) if record and record['orders_url'] else None
+    if orders_html is None:
+        record, orders_html = search(*key)
+
+    orders = parse_orders(orders_html, COURT_BASE_URL)
+    _, added = db.save_case(*key, record, orders, now)
+    if tracked['last_checked_at'] is None:
+        # The first successful check of a case only sets the baseline
+        return []
+    if added:
+        if TRACK_PREFETCH_PDFS:
+            for order in added:
+                try:
+                    pdf_store.store.fetch(order['url']).close()
+                except Exception as e:
+                    print(f"Error downloading {order['url']}: {str(e)}")
+        event_id = db.add_case_event(*key, 'new_orders', json.dumps({'orders': added}), now)
+        if TRACK_WEBHOOK_URL:
+            event = {'id': event_id, 'kind': 'new_orders', 'case_type': key[0], 'case_number': key[1],
+                     'case_year': key[2], 'orders': added, 'created_at': now}
+            deliver(TRACK_WEBHOOK_URL, event, f"event {event_id}")
+    return added
+
+
+def _check(tracked):
+    try:
+        # Tracked-case syncs queue behind interactive lookups and take turns with batches
+        with outbound.context(outbound.BACKGROUND, 'tracker'):
+            added = sync_case(tracked)
+        db.mark_tracked(tracked['id'], time.time(), time.time() + TRACK_INTERVAL)
+        return len(added), None
+    except Exception as e:
+        # last_checked_at stays at the last successful sync, so a failed first check doesn't become the baseline
+        db.mark_tracked(tracked['id'], None, time.time() + TRACK_RETRY_INTERVAL, str(e))
+        return 0, str(e)
+
+
+def sync_due(concurrency=TRACK_CONCURRENCY, now=None):
+    """Check every tracked case that is due and return a summary"""
+    start = time.perf_counter()
+    due = db.tracked_cases(due_before=now or time.time())
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tracker') as executor:
+        results = list(executor.map(_check, due))
+    return {
+        'checked': len(due),
+        'new_orders': sum(added for added, _ in results),
+        'errors': sum(1 for _, error in results if error),
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+class Scheduler:
+    """Runs sync_due in the background every ``interval`` seconds, or on demand"""
+
+    def __init__(self, interval=TRACK_POLL_INTERVAL):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._once = None
+        self._lock = threading.Lock()
+        self.last_summary = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='tracker', daemon=True)
+                self._thread.start()
+        return self
+
+    def trigger(self):
+        self.start()
+        self._wake.set()
+
+    def sync_once(self):
+        """Check due cases once on a short-lived thread, for when the polling loop is off; False if one is running"""
+        with self._lock:
+            if self._once is not None and self._once.is_alive():
+                return False
+            self._once = threading.Thread(target=self._sync, name='tracker-once', daemon=True)
+            self._once.start()
+        return True
+
+    def _sync(self):
+        try:
+            self.last_summary = sync_due()
+        except Exception as e:
+            print(f"Error syncing tracked cases: {str(e)}")
+
+    def _loop(self):
+        while True:
+            self._wake.clear()
+            self._sync()
+            self._wake.wait(self.interval)
+
+
+scheduler = Scheduler()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Track cases and sync new orders')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='start tracking a case')
+    add.add_argument('case_type')
+    add.add_argument('case_number')
+    add.add_argument('case_year')
+    commands.add_parser('list', help='list tracked cases')
+    sync = commands.add_parser('sync', help='check every case that is due')
+    sync.add_argument('--all', action='store_true', help='check every tracked case, due or not')
+    sync.add_argument('--concurrency', type=int, default=TRACK_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    if args.command == 'add':
+        print(db.track_case(args.case_type, args.case_number, args.case_year, time.time()))
+    elif args.command == 'list':
+        for tracked in db.tracked_cases():
+            print(json.dumps(tracked))
+    else:
+        now = float('inf') if args.all else None
+        print(json.dumps(sync_due(args.concurrency, now)))
+
+
+if __name__ == '__main__':
+    main()